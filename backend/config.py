@@ -2,6 +2,15 @@ import os
 
 # Optional environment variable to point to aria2 binary
 ARIA2C_PATH = os.environ.get("ARIA2C_PATH")
+# Magnets vão para um único aria2c em modo RPC (DHT compartilhada); 0 = um processo CLI por job
+ARIA2_RPC = os.environ.get("ARIA2_RPC", "1").lower() not in ("0", "false", "no")
+# Porta do RPC do daemon (0 = escolher uma livre) e token; ARIA2_RPC_URL usa um aria2 já rodando
+ARIA2_RPC_PORT = int(os.environ.get("ARIA2_RPC_PORT", "0"))
+ARIA2_RPC_SECRET = os.environ.get("ARIA2_RPC_SECRET") or None
+ARIA2_RPC_URL = os.environ.get("ARIA2_RPC_URL") or None
+# Quantos trackers do registro de saúde vão para o aria2 (--bt-tracker) e para o scrape UDP
+TRACKERS_TOP_N = int(os.environ.get("TRACKERS_TOP_N", "30"))
+TRACKERS_SCRAPE_TOP_N = int(os.environ.get("TRACKERS_SCRAPE_TOP_N", "20"))
 
 _app_data_dir = os.environ.get("APP_DATA_DIR")
 
@@ -28,6 +37,19 @@ else:
 # other defaults
 DEFAULT_N_CONNS = int(os.environ.get("DEFAULT_N_CONNS", "4"))
 DEFAULT_CONCURRENCY = int(os.environ.get("DEFAULT_CONCURRENCY", "2"))
+# Digests extras calculados durante downloads diretos (md5,sha1,sha256,crc32). Vazio (padrão): só
+# calcula quando a fonte informa digests para o item
+CHECKSUM_ALGORITHMS = [a.strip() for a in os.environ.get("CHECKSUM_ALGORITHMS", "").split(",") if a.strip()]
+# Teto global de banda para downloads (bytes/s; 0 = sem teto). Dividido entre jobs ativos pelo peso
+GLOBAL_BANDWIDTH_LIMIT = int(os.environ.get("GLOBAL_BANDWIDTH_LIMIT", "0")) or None
+# Job mais prioritário na fila pausa o job rodando de menor prioridade (que volta para a fila depois)
+JOB_PREEMPTION = os.environ.get("JOB_PREEMPTION", "1").lower() not in ("0", "false", "no")
+# Jobs simultâneos: começa em MIN e o ajuste automático (vazão agregada + latência de disco) sobe até MAX
+JOB_CONCURRENCY_MIN = max(1, int(os.environ.get("JOB_CONCURRENCY_MIN", "1")))
+JOB_CONCURRENCY_MAX = max(JOB_CONCURRENCY_MIN, int(os.environ.get("JOB_CONCURRENCY_MAX", "4")))
+JOB_CONCURRENCY_AUTO = os.environ.get("JOB_CONCURRENCY_AUTO", "1").lower() not in ("0", "false", "no")
+# Progresso dos jobs é gravado no banco em lote a cada N segundos (todos os jobs numa transação)
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", "2.0"))
 
 # External Services (Obtenha sua chave em https://www.steamgriddb.com/profile/api)
 STEAMGRIDDB_API_KEY = os.environ.get("STEAMGRIDDB_API_KEY", "SUA_CHAVE_AQUI")
@@ -177,7 +177,9 @@ def _check_and_migrate_schema(conn):
         'size': 'INTEGER',
         'setup_executed': 'INTEGER DEFAULT 0',
         'started_at': 'DATETIME',
-        'completed_at': 'DATETIME'
+        'completed_at': 'DATETIME',
+        'checksums': 'TEXT',
+        'priority': 'INTEGER DEFAULT 0'
     }
     for col, type_def in cols_to_add.items():
         if not has_column('job', col):
@@ -188,7 +190,7 @@ def _check_and_migrate_schema(conn):
         conn.exec_driver_sql("ALTER TABLE source ADD COLUMN data TEXT")
 
     # Item columns
-    for col, typ in {'image':'TEXT', 'icon':'TEXT', 'thumbnail':'TEXT', 'seeders':'INTEGER', 'leechers':'INTEGER'}.items():
+    for col, typ in {'image':'TEXT', 'icon':'TEXT', 'thumbnail':'TEXT', 'seeders':'INTEGER', 'leechers':'INTEGER', 'mirrors':'TEXT', 'checksums':'TEXT', 'batch_files':'TEXT'}.items():
         if not has_column('item', col):
             conn.exec_driver_sql(f"ALTER TABLE item ADD COLUMN {col} {typ}")
 
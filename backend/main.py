@@ -62,6 +62,8 @@ from datetime import datetime
 import asyncio
 import pathlib
 import time
+import json
+import hashlib
 import zlib
 import re
 import unicodedata
@@ -70,7 +72,15 @@ from pydantic import BaseModel
 from starlette.staticfiles import StaticFiles
 from sqlmodel import select, delete
 from engine.manager import job_manager
+from engine.bandwidth import bandwidth_scheduler
+from engine.http_pool import http_pool
+from engine.batch import BATCH_URL_PREFIX
 from engine.download import supports_range
+from engine.checksums import extract_checksums, normalize_checksums
+from engine.diskspace import disk_monitor
+from engine.concurrency import ConcurrencyTuner
+from engine.trackers import tracker_registry
+from engine.torrent_cache import torrent_cache, magnet_infohash
 from backend.db import init_db, get_session
 from backend.models.models import Source, Item, Favorite, Job, JobPart, ResolverAlias, GameMetadata, SteamApp
 from backend import config as backend_config
@@ -888,6 +898,7 @@ async def lifespan(app: FastAPI):
             pass
 
     await job_manager.stop()
+    await http_pool.close_all()
     await steam_client.close()
     print("[SHUTDOWN] Graceful shutdown complete.")
 
@@ -955,12 +966,16 @@ def get_system_disk_space(path: str = None):
             check_p = str(pathlib.Path.home())
 
         total, used, free = shutil.disk_usage(check_p)
+        # Reservado = o que os jobs ativos nesse volume ainda vão escrever; "available" já desconta isso
+        reserved = disk_monitor.reserved(check_p)
         return {
             "path": p,
             "checked_path": check_p,
             "total": total,
             "used": used,
             "free": free,
+            "reserved": reserved,
+            "available": max(0, free - reserved),
             "status": "success"
         }
     except Exception as e:
@@ -993,6 +1008,10 @@ class CreateJobReq(BaseModel):
     n_conns: int = 4
     resume_on_start: bool = True
     verify_ssl: bool = True
+    uris: Optional[List[str]] = None  # Todas as URIs do item (mirrors do mesmo arquivo)
+    checksums: Optional[Dict[str, str]] = None  # Digests informados pela fonte ({"sha256": "..."})
+    limit_bandwidth: Optional[int] = None  # Teto de banda do job em bytes/s
+    priority: int = 0  # Maior sai primeiro da fila (pode pausar um job de prioridade menor)
 
 
 # ==================== STEAM IMAGES ENDPOINT ====================
@@ -1526,6 +1545,9 @@ def safe_delete_download(dest_path: str, job_name: str = None) -> tuple[bool, st
             f"{filename_base}.aria2",      # aria2 metadata
             f"{filename_base}.aria2c",     # aria2 temp metadata
             f"{filename_base}.part",       # download part file
+            f"{filename_base}.part.meta",  # serial resume validator (ETag/Last-Modified)
+            f"{filename_base}.tmp",        # segmented (UltraMax) temp file
+            f"{filename_base}.tmp.ranges", # segmented resume map
             f"{filename_base}.parts",      # download parts folder
             f"{filename_base}.torrent",    # torrent metadata
         ]
@@ -1799,7 +1821,9 @@ async def load_json_raw(req: LoadJsonRawRequest):
 async def api_supports_range(url: str):
     # Magnet links don't support range requests - return false immediately
     if url.startswith('magnet:'):
-        return {"accept_ranges": False, "size": None, "status_code": None, "note": "Magnet links use aria2"}
+        # Tamanho conhecido se os metadados desse infohash já estão em cache
+        return {"accept_ranges": False, "size": torrent_cache.total_size(magnet_infohash(url)),
+                "status_code": None, "note": "Magnet links use aria2"}
     
     info = await supports_range(url)
     return info
@@ -1843,6 +1867,10 @@ async def create_job(req: CreateJobReq):
         session.refresh(item)
         print(f"[OK] Item criado: #{item.id} - {item.name}")
     
+    # Magnet sem tamanho: usa o do .torrent em cache, se o infohash já foi resolvido antes
+    if not req.size and not item.size and item.url and item.url.startswith("magnet:"):
+        req.size = torrent_cache.total_size(magnet_infohash(item.url))
+
     # Se veio size e item não tem, atualizar
     if req.size and not item.size:
         item.size = req.size
@@ -1850,6 +1878,24 @@ async def create_job(req: CreateJobReq):
         session.commit()
         session.refresh(item)
 
+    # Mirrors: guardar as URIs extras para o UltraMax dividir os ranges entre elas
+    if req.uris:
+        mirrors = [u for u in req.uris if isinstance(u, str) and u.strip() and u != item.url]
+        if mirrors:
+            item.mirrors = json.dumps(mirrors)
+            session.add(item)
+            session.commit()
+            session.refresh(item)
+            print(f"[MIRROR] {len(mirrors)} mirror(s) registrados para o item #{item.id}")
+
+    # Digests da fonte: o download falha se o arquivo baixado não conferir
+    expected_checksums = normalize_checksums(req.checksums)
+    if expected_checksums:
+        item.checksums = json.dumps(expected_checksums)
+        session.add(item)
+        session.commit()
+        session.refresh(item)
+
     #  Use 'destination' from frontend (modal choice), fallback to 'dest' if provided
     #  CRITICAL FIX: Ignore relative paths (like "downloads") to prevent writing to app dir
     raw_dest = req.destination or req.dest
@@ -1866,7 +1912,8 @@ async def create_job(req: CreateJobReq):
     print(f" Destination recebido: destination={req.destination}, dest={req.dest}")
     print(f" Usando: {download_dest}")
     
-    job = Job(item_id=item.id, dest=download_dest, status="queued", k=req.k, n_conns=req.n_conns, resume_on_start=req.resume_on_start, verify_ssl=req.verify_ssl, size=req.size)
+    job = Job(item_id=item.id, dest=download_dest, status="queued", k=req.k, n_conns=req.n_conns, resume_on_start=req.resume_on_start, verify_ssl=req.verify_ssl, size=req.size, limit_bandwidth=req.limit_bandwidth or None,
+              priority=req.priority)
     session.add(job)
     session.commit()
     session.refresh(job)
@@ -1876,12 +1923,70 @@ async def create_job(req: CreateJobReq):
 
     # enqueue job
     print(f" Adicionando job #{job.id} à fila de processamento")
-    await job_manager.enqueue_job(job.id)
+    await job_manager.enqueue_job(job.id, priority=req.priority)
     print(f" Job #{job.id} enfileirado com sucesso")
 
     return {"job_id": job.id}
 
 
+class BatchFileReq(BaseModel):
+    url: str
+    name: Optional[str] = None
+    size: Optional[int] = None
+    checksums: Optional[Dict[str, str]] = None
+
+
+class CreateBatchJobReq(BaseModel):
+    name: str
+    files: List[BatchFileReq]
+    destination: Optional[str] = None
+    concurrency: int = 8  # Arquivos baixados ao mesmo tempo (guardado em Job.n_conns)
+    verify_ssl: bool = True
+    limit_bandwidth: Optional[int] = None
+    priority: int = 0
+
+
+@app.post("/api/jobs/batch")
+async def create_batch_job(req: CreateBatchJobReq):
+    """Muitos arquivos pequenos num único job (progresso por arquivo em /api/jobs/{id}/parts)."""
+    files = [f.dict() for f in req.files if f.url and not f.url.startswith("magnet:")]
+    if not files:
+        raise HTTPException(status_code=400, detail="Batch has no downloadable files")
+
+    # URL estável do lote: o mesmo conjunto de arquivos não vira dois jobs
+    batch_url = BATCH_URL_PREFIX + hashlib.sha1("\n".join(sorted(f["url"] for f in files)).encode()).hexdigest()
+    session = get_session()
+    try:
+        existing_jobs = session.exec(select(Job).where(Job.status.in_(["queued", "running", "paused"]))).all()
+        for existing_job in existing_jobs:
+            existing_item = session.get(Item, existing_job.item_id) if existing_job.item_id else None
+            if existing_item and existing_item.url == batch_url:
+                raise HTTPException(status_code=400, detail=f"DOWNLOAD_ALREADY_EXISTS:{existing_job.status}")
+
+        known_sizes = [f["size"] for f in files if f.get("size")]
+        item = Item(source_id=None, name=req.name, url=batch_url,
+                    size=sum(known_sizes) if len(known_sizes) == len(files) else None,
+                    batch_files=json.dumps(files))
+        session.add(item)
+        session.commit()
+        session.refresh(item)
+
+        download_dest = req.destination if req.destination and os.path.isabs(req.destination) else backend_config.DOWNLOADS_DIR
+        job = Job(item_id=item.id, dest=download_dest, status="queued", k=1, n_conns=max(1, min(req.concurrency, 32)),
+                  verify_ssl=req.verify_ssl, size=item.size, limit_bandwidth=req.limit_bandwidth or None,
+                  priority=req.priority)
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        job_id = job.id
+    finally:
+        session.close()
+
+    print(f"[LOTE] Job #{job_id} criado com {len(files)} arquivos")
+    await job_manager.enqueue_job(job_id, priority=req.priority)
+    return {"job_id": job_id, "files": len(files)}
+
+
 @app.get("/api/jobs")
 async def list_jobs():
     session = get_session()
@@ -1894,7 +1999,7 @@ async def list_jobs():
             id=j.id, 
             item_id=j.item_id, 
             status=j.status, 
-            progress=j.progress or prog.get('progress'), 
+            progress=prog.get('progress') if prog.get('progress') is not None else j.progress, 
             created_at=j.created_at.isoformat() if j.created_at else None, 
             updated_at=j.updated_at.isoformat() if j.updated_at else None, 
             started_at=j.started_at.isoformat() if j.started_at else None,
@@ -1911,6 +2016,8 @@ async def list_jobs():
             size=j.size,
             free_space_at_pause=getattr(j, "free_space_at_pause", None), # DEFENSIVO
             setup_executed=j.setup_executed,
+            checksums=(json.loads(j.checksums) if getattr(j, "checksums", None) else None),
+            priority=getattr(j, "priority", 0) or 0,
             is_installing=(j.id in active_installers)
         ))
     session.close()
@@ -2147,7 +2254,10 @@ async def _load_items_internal(source: Source):
             continue
         
         # Detectar URL
+        uris = []
         if "uris" in raw and isinstance(raw["uris"], list) and len(raw["uris"]) > 0:
+            # Mantém todas as URIs: as http(s) extras viram mirrors do mesmo arquivo
+            uris = [x for x in raw["uris"] if isinstance(x, str) and x.strip()]
             u = raw["uris"][0]
         else:
             u = raw.get("url") or raw.get("link") or raw.get("magnet") or raw.get("uri")
@@ -2228,7 +2338,9 @@ async def _load_items_internal(source: Source):
             thumbnail=thumbnail,
             uploadDate=upload_date,
             seeders=seeders,
-            leechers=leechers
+            leechers=leechers,
+            uris=uris if len(uris) > 1 else None,
+            checksums=extract_checksums(raw) or None
         ))
     
     return items
@@ -2289,7 +2401,13 @@ async def list_job_parts(job_id: int):
     session = get_session()
     j = session.get(Job, job_id)
     if not j:
+        session.close()
         raise HTTPException(status_code=404, detail="Job not found")
+    # Job rodando: estado das partes vem da memória (o banco só é atualizado a cada flush)
+    live = job_manager.progress_store.get_parts(job_id)
+    if live is not None:
+        session.close()
+        return live
     parts = session.exec(select(JobPart).where(JobPart.job_id == job_id)).all()
     session.close()
     return [dict(index=p.index, start=p.start, end=p.end, downloaded=p.downloaded, size=p.size, path=p.path, status=p.status) for p in parts]
@@ -2299,8 +2417,16 @@ async def list_job_parts(job_id: int):
 async def aria2_status():
     path = backend_config.ARIA2C_PATH
     from engine.aria2_wrapper import find_aria2_binary
+    from engine.aria2_rpc import aria2_daemon
     found = find_aria2_binary(os.getcwd())
-    return {"env_path": path, "found_path": found, "available": bool(found)}
+    return {"env_path": path, "found_path": found, "available": bool(found),
+            "rpc_enabled": backend_config.ARIA2_RPC, "rpc": aria2_daemon.snapshot(),
+            "torrent_cache": torrent_cache.snapshot()}
+
+
+@app.get("/api/trackers/health")
+async def trackers_health(limit: int = 50):
+    return tracker_registry.snapshot(limit)
 
 
 @app.get("/api/resolver/telemetry")
@@ -2333,7 +2459,7 @@ async def get_job(job_id: int):
             id=j.id, 
             item_id=j.item_id, 
             status=j.status, 
-            progress=j.progress or prog.get('progress'), 
+            progress=prog.get('progress') if prog.get('progress') is not None else j.progress, 
             created_at=j.created_at.isoformat() if j.created_at else None,
             updated_at=j.updated_at.isoformat() if j.updated_at else None,
             started_at=j.started_at.isoformat() if j.started_at else None,
@@ -2354,6 +2480,84 @@ async def get_job(job_id: int):
         session.close()
 
 
+class BandwidthReq(BaseModel):
+    global_limit: Optional[int] = None  # bytes/s; 0/None = sem teto
+
+
+class JobBandwidthReq(BaseModel):
+    limit_bandwidth: Optional[int] = None  # bytes/s; 0 = sem teto
+    weight: Optional[float] = None  # peso na divisão do teto global ou, sem teto, da capacidade medida (padrão 1.0)
+
+
+@app.get("/api/bandwidth")
+async def get_bandwidth():
+    """Teto global e taxa atribuída a cada job ativo."""
+    return bandwidth_scheduler.snapshot()
+
+
+@app.post("/api/bandwidth")
+async def set_bandwidth(req: BandwidthReq):
+    bandwidth_scheduler.set_global_limit(req.global_limit)
+    print(f"[BANDA] Teto global: {req.global_limit or 'sem teto'}")
+    return bandwidth_scheduler.snapshot()
+
+
+@app.post("/api/jobs/{job_id}/bandwidth")
+async def set_job_bandwidth(job_id: int, req: JobBandwidthReq):
+    """Define teto e/ou peso do job (aplicado na hora em downloads diretos)."""
+    session = get_session()
+    j = session.get(Job, job_id)
+    session.close()
+    if not j:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job_manager.set_bandwidth(job_id, limit=req.limit_bandwidth, weight=req.weight)
+    return {"ok": True, "rate": bandwidth_scheduler.rate_for(job_id)}
+
+
+class ConcurrencyReq(BaseModel):
+    mode: Optional[str] = None  # "auto" (ajuste por vazão/disco) ou "manual" (fixo em `value`)
+    value: Optional[int] = None
+    min: Optional[int] = None
+    max: Optional[int] = None
+
+
+@app.get("/api/concurrency")
+async def get_concurrency():
+    """Jobs simultâneos: alvo atual, limites, vazão agregada e última decisão do ajuste automático."""
+    return job_manager.tuner.snapshot()
+
+
+@app.post("/api/concurrency")
+async def set_concurrency(req: ConcurrencyReq):
+    if req.mode not in (None, "auto", "manual"):
+        raise HTTPException(status_code=400, detail="mode deve ser 'auto' ou 'manual'")
+    if req.mode == "manual" and (req.value is None or req.value < 1):
+        raise HTTPException(status_code=400, detail="modo manual exige value >= 1")
+    cap = ConcurrencyTuner.HARD_MAX_SLOTS
+    if any(v is not None and v > cap for v in (req.value, req.min, req.max)):
+        raise HTTPException(status_code=400, detail=f"concorrência máxima é {cap}")
+    return await job_manager.set_concurrency(req.mode, req.value, req.min, req.max)
+
+
+class JobPriorityReq(BaseModel):
+    priority: int  # maior = mais urgente (padrão 0)
+
+
+@app.get("/api/queue")
+async def get_queue():
+    """Jobs rodando e fila de espera na ordem em que vão sair."""
+    return job_manager.queue_snapshot()
+
+
+@app.post("/api/jobs/{job_id}/priority")
+async def set_job_priority(job_id: int, req: JobPriorityReq):
+    """Muda a prioridade; na fila o job é reposicionado, e pode pausar um job menos prioritário."""
+    if not await job_manager.set_priority(job_id, req.priority):
+        raise HTTPException(status_code=404, detail="Job not found")
+    print(f"[FILA] Job {job_id} agora com prioridade {req.priority}")
+    return {"ok": True, **job_manager.queue_snapshot()}
+
+
 @app.post("/api/jobs/{job_id}/pause")
 async def pause_job(job_id: int):
     """
@@ -2470,7 +2674,7 @@ async def cancel_job(job_id: int):
                 dest = j.dest or backend_config.DOWNLOADS_DIR
                 raw_name = os.path.basename(it.url.split("?")[0]) or it.name
                 # Try to clean up partial files
-                for suffix in [".part", ".parts"]:
+                for suffix in [".part", ".part.meta", ".parts", ".tmp", ".tmp.ranges"]:
                     partial_path = os.path.join(dest, raw_name + suffix) if raw_name else None
                     if partial_path and os.path.exists(partial_path):
                         try:
@@ -2671,31 +2875,8 @@ async def magnet_health(req: MagnetHealthReq):
         from backend.services.analysis import SourceHealthService
         from backend.utils.tracker import UDPTrackerClient
 
-    # Probe a single-item list in-place, with extra trackers for better consistency with pre-job.
-    TRACKERS_EXTRAS = [
-        "udp://tracker.opentrackr.org:1337/announce",
-        "udp://open.stealth.si:80/announce",
-        "udp://tracker.torrent.eu.org:451/announce",
-        "udp://exodus.desync.com:6969/announce",
-        "udp://tracker.moeking.me:6969/announce",
-        "udp://tracker.openbittorrent.com:6969/announce",
-        "udp://opentracker.i2p.rocks:6969/announce",
-        "udp://tracker.internetwarriors.net:1337/announce",
-        "udp://explodie.org:6969/announce",
-        "udp://tracker.cyberia.is:6969/announce",
-        "udp://tracker.birkenwald.de:6969/announce",
-        "udp://tracker.tiny-vps.com:6969/announce",
-        "udp://retracker.lanta-net.ru:2710/announce",
-        "udp://ipv4.tracker.harry.lu:80/announce",
-        "udp://tracker.theoks.net:6969/announce",
-        "udp://tracker.ccp.ovh:6969/announce",
-        "udp://bt1.archive.org:6969/announce",
-        "udp://bt2.archive.org:6969/announce",
-        "udp://tracker.filemail.com:6969/announce",
-        "udp://tracker1.bt.moack.co.kr:80/announce",
-        "udp://9.rarbg.com:2810/announce",
-        "udp://tracker.uw0.xyz:6969/announce",
-    ]
+    # Probe a single-item list in-place, with the same ranked trackers as the pre-job analysis.
+    TRACKERS_EXTRAS = tracker_registry.top(backend_config.TRACKERS_SCRAPE_TOP_N, schemes=("udp",))
     # Append extra trackers to maximize chances of finding seeds (same as SourceHealthService)
     full_url = url
     for tr in TRACKERS_EXTRAS:
@@ -27,6 +27,9 @@ class Item(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.now)
     seeders: Optional[int] = Field(default=None)
     leechers: Optional[int] = Field(default=None)
+    mirrors: Optional[str] = None  # JSON: lista de URIs alternativas para o mesmo arquivo
+    checksums: Optional[str] = None  # JSON {algoritmo: hex} informado pela fonte
+    batch_files: Optional[str] = None  # JSON [{url, name, size}] quando o item é um lote (url 'batch:...')
 
     source: Optional[Source] = Relationship(back_populates="items")
 
@@ -49,7 +52,7 @@ class Job(SQLModel, table=True):
     k: int = 4  # number of parts
     n_conns: int = 4  # parallel connections per file total
     resume_on_start: bool = True
-    limit_bandwidth: Optional[int] = None  # bytes/s limit (not yet implemented)
+    limit_bandwidth: Optional[int] = None  # bytes/s limit (engine/bandwidth.py)
     verify_ssl: bool = True
     status: str = "queued"  # queued, running, paused, completed, failed
     progress: float = 0.0
@@ -64,6 +67,8 @@ class Job(SQLModel, table=True):
     setup_executed: bool = Field(default=False) # Indica se o instalador foi executado pelo usuário
     started_at: Optional[datetime] = None # Momento em que o download realmente saiu da fila
     completed_at: Optional[datetime] = None # Momento da conclusão com sucesso
+    checksums: Optional[str] = None # JSON {algoritmo: hex} calculado durante o download
+    priority: int = 0 # Maior sai primeiro da fila (e pode preemptar jobs de prioridade menor)
 
 
 class JobPart(SQLModel, table=True):
@@ -2,6 +2,8 @@ import re
 from typing import List, Dict, Optional
 from sqlmodel import Session, select
 from backend.models.models import Item, Source
+from backend.config import TRACKERS_SCRAPE_TOP_N
+from engine.trackers import tracker_registry
 
 class ItemMatchingService:
     @staticmethod
@@ -153,31 +155,8 @@ class SourceHealthService:
         Enriches a list of item candidates (dicts or objects) with real-time stats 
         from UDP trackers. Modifies the list in-place.
         """
-        # Trackers extras sincronizados com engine/aria2_wrapper.py
-        TRACKERS_EXTRAS = [
-            "udp://tracker.opentrackr.org:1337/announce",
-            "udp://open.stealth.si:80/announce",
-            "udp://tracker.torrent.eu.org:451/announce",
-            "udp://exodus.desync.com:6969/announce",
-            "udp://tracker.moeking.me:6969/announce",
-            "udp://tracker.openbittorrent.com:6969/announce",
-            "udp://opentracker.i2p.rocks:6969/announce",
-            "udp://tracker.internetwarriors.net:1337/announce",
-            "udp://explodie.org:6969/announce",
-            "udp://tracker.cyberia.is:6969/announce",
-            "udp://tracker.birkenwald.de:6969/announce",
-            "udp://tracker.tiny-vps.com:6969/announce",
-            "udp://retracker.lanta-net.ru:2710/announce",
-            "udp://ipv4.tracker.harry.lu:80/announce",
-            "udp://tracker.theoks.net:6969/announce",
-            "udp://tracker.ccp.ovh:6969/announce",
-            "udp://bt1.archive.org:6969/announce",
-            "udp://bt2.archive.org:6969/announce",
-            "udp://tracker.filemail.com:6969/announce",
-            "udp://tracker1.bt.moack.co.kr:80/announce",
-            "udp://9.rarbg.com:2810/announce",
-            "udp://tracker.uw0.xyz:6969/announce",
-        ]
+        # Só os trackers UDP mais saudáveis do registro (o mesmo que alimenta o aria2)
+        TRACKERS_EXTRAS = tracker_registry.top(TRACKERS_SCRAPE_TOP_N, schemes=("udp",))
 
         client = UDPTrackerClient(timeout=1.5, retries=1)
         
@@ -5,6 +5,8 @@ import random
 import time
 from urllib.parse import urlparse
 
+from engine.trackers import tracker_registry
+
 class UDPTrackerClient:
     def __init__(self, timeout=1.5, retries=1):
         self.timeout = timeout
@@ -152,6 +154,13 @@ class UDPTrackerClient:
         return trackers
 
     async def _scrape_tracker(self, tracker_url, info_hash):
+        # Cada resultado alimenta o registro de saúde (cancelamento por timeout global não conta)
+        start = time.monotonic()
+        res = await self._scrape_once(tracker_url, info_hash)
+        tracker_registry.record(tracker_url, bool(res), time.monotonic() - start if res else None)
+        return res
+
+    async def _scrape_once(self, tracker_url, info_hash):
         parsed = urlparse(tracker_url)
         host = parsed.hostname
         port = parsed.port
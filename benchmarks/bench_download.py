@@ -0,0 +1,350 @@
+"""
+Benchmark do engine de download contra o servidor de ranges local.
+
+Para cada combinação cenário × protocolo × engine sobe um servidor
+(`benchmarks.range_server`) com as condições do cenário e baixa o arquivo num
+processo filho isolado (CPU e pico de memória medidos só do download). Resultado
+em JSON legível por máquina:
+
+  python -m benchmarks.bench_download --size-mb 256 --output bench.json
+  python -m benchmarks.bench_download --scenarios clean,flaky --protocols h1 --engines segmented
+
+Métricas por execução: MB/s, TTFB (média e p50), latência de cauda das
+requisições (p50/p95/p99, do pedido ao último byte), segundos de CPU por GB,
+pico de RSS (MB), coletas do GC, requisições feitas, 5xx/resets injetados e se o SHA-256
+final confere. HTTP/2 usa TLS com certificado autoassinado (gerado com o
+`openssl` do sistema) e precisa do pacote `h2`.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import hashlib
+import platform
+import tempfile
+import subprocess
+import urllib.request
+from typing import Optional, List, Dict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULT_VERSION = 1
+
+# Condições de rede de cada cenário (argumentos do range_server)
+SCENARIOS: Dict[str, dict] = {
+    "clean": {},
+    "throttled": {"bandwidth": 50_000_000, "per_conn": 2_000_000, "latency": 0.02},
+    "flaky": {"error_rate": 0.05, "reset_rate": 0.02, "latency": 0.005},
+}
+PROTOCOLS = ("h1", "h2")
+ENGINES = ("serial", "segmented")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def make_self_signed_cert(directory: str):
+    """Certificado autoassinado para 127.0.0.1 (só para o benchmark). Retorna (cert, key) ou None."""
+    openssl = shutil.which("openssl")
+    if not openssl:
+        return None
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    cmd = [openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+           "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+           "-keyout", key, "-out", cert]
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+    except Exception:
+        return None
+    return cert, key
+
+
+def h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ============================================================
+# SERVIDOR
+# ============================================================
+
+class ServerProcess:
+    def __init__(self, size_mb: float, scenario: dict, protocol: str, certs, rng_seed: int):
+        cmd = [sys.executable, "-m", "benchmarks.range_server", "--size-mb", str(size_mb),
+               "--rng-seed", str(rng_seed)]
+        for key, value in scenario.items():
+            cmd += [f"--{key.replace('_', '-')}", str(value)]
+        if protocol == "h2":
+            cmd += ["--tls", "--http2", "--cert", certs[0], "--key", certs[1]]
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline()
+        if not line:
+            self.proc.kill()
+            raise RuntimeError("servidor de benchmark não iniciou")
+        info = json.loads(line)
+        self.url = info["url"]
+        self.size = info["size"]
+        self.sha256 = info["sha256"]
+
+    def stats(self) -> dict:
+        stats_url = self.url.rsplit("/", 1)[0] + "/__stats"
+        if stats_url.startswith("https"):
+            # O /__stats é lido em HTTP/1.1 pela mesma porta TLS
+            import ssl
+            ctx = ssl.create_default_context()
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            with urllib.request.urlopen(stats_url, context=ctx, timeout=30) as r:
+                return json.loads(r.read())
+        with urllib.request.urlopen(stats_url, timeout=30) as r:
+            return json.loads(r.read())
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+# ============================================================
+# EXECUÇÃO DE UM DOWNLOAD (PROCESSO FILHO)
+# ============================================================
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _cpu_seconds() -> float:
+    if resource is None:
+        t = os.times()
+        return t.user + t.system
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_one(engine: str, url: str, workdir: str) -> dict:
+    """Baixa `url` com o engine pedido e mede este processo."""
+    # Caches do engine num diretório temporário: cada execução começa do zero
+    os.environ["PROBE_CACHE_FILE"] = os.path.join(workdir, "probe_cache.json")
+    os.environ["HOST_TUNING_FILE"] = os.path.join(workdir, "host_tuning.json")
+    sys.path.insert(0, ROOT)
+    try:
+        from engine.download import download_serial, download_segmented
+        from engine.http_pool import http_pool
+    except ImportError as e:
+        return {"ok": False, "error": f"dependência ausente: {e}"}
+
+    dest = os.path.join(workdir, "download.bin")
+    state = {"ttfb": None}
+    t0 = time.perf_counter()
+
+    async def progress(downloaded, total, *args, **kwargs):
+        if state["ttfb"] is None and downloaded:
+            state["ttfb"] = time.perf_counter() - t0
+
+    async def main():
+        try:
+            if engine == "serial":
+                return await download_serial(url, dest, progress_cb=progress, resume=False, verify=False)
+            return await download_segmented(url, dest, progress_cb=progress, resume=False, verify=False)
+        finally:
+            await http_pool.close_all()
+
+    cpu0 = _cpu_seconds()
+    gc0 = sum(g["collections"] for g in gc.get_stats())
+    error = None
+    result = None
+    try:
+        result = asyncio.run(main())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - t0
+    cpu = _cpu_seconds() - cpu0
+    return {
+        "ok": bool(result) and error is None,
+        "error": error,
+        "seconds": round(seconds, 3),
+        "first_progress_s": round(state["ttfb"], 3) if state["ttfb"] is not None else None,
+        "cpu_s": round(cpu, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        "gc_collections": sum(g["collections"] for g in gc.get_stats()) - gc0,
+        "sha256": _file_sha256(dest) if result and os.path.exists(dest) else None,
+    }
+
+
+def run_child(engine: str, url: str, timeout: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-dl-")
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_download", "--run-one", engine, "--url", url, "--workdir", workdir],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True, timeout=timeout
+        )
+        # O engine loga no stdout; o resultado é a última linha
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if not lines:
+            return {"ok": False, "error": f"processo filho saiu com código {proc.returncode} sem resultado"}
+        return json.loads(lines[-1])
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"tempo esgotado ({timeout:.0f}s)"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ============================================================
+# DRIVER
+# ============================================================
+
+def summarize(engine: str, protocol: str, scenario: str, server: ServerProcess, child: dict, stats: dict) -> dict:
+    reqs = [r for r in stats.get("requests", []) if r.get("t_done") is not None]
+    ttfb = [(r["t_first_byte"] - r["t_request"]) * 1000 for r in reqs if r.get("t_first_byte")]
+    latency = [(r["t_done"] - r["t_request"]) * 1000 for r in reqs]
+    seconds = child.get("seconds") or 0
+    size_gb = server.size / (1024 ** 3)
+    cpu_s = child.get("cpu_s")
+
+    def ms(v):
+        return round(v, 2) if v is not None else None
+
+    return {
+        "engine": engine,
+        "protocol": protocol,
+        "scenario": scenario,
+        "size_bytes": server.size,
+        "ok": bool(child.get("ok")),
+        "error": child.get("error"),
+        "seconds": seconds,
+        "mb_s": round(server.size / (1024 * 1024) / seconds, 2) if child.get("ok") and seconds else None,
+        "ttfb_ms": {"mean": ms(sum(ttfb) / len(ttfb)) if ttfb else None, "p50": ms(percentile(ttfb, 50))},
+        "latency_ms": {"p50": ms(percentile(latency, 50)), "p95": ms(percentile(latency, 95)),
+                       "p99": ms(percentile(latency, 99))},
+        "first_progress_ms": ms(child["first_progress_s"] * 1000) if child.get("first_progress_s") is not None else None,
+        "requests": len(stats.get("requests", [])),
+        "errors_injected": stats.get("errors_injected", 0),
+        "resets_injected": stats.get("resets_injected", 0),
+        "cpu_s": cpu_s,
+        "cpu_s_per_gb": round(cpu_s / size_gb, 3) if cpu_s is not None and size_gb else None,
+        "peak_rss_mb": child.get("peak_rss_mb"),
+        "gc_collections": child.get("gc_collections"),
+        "sha256_ok": child.get("sha256") == server.sha256 if child.get("ok") else None,
+    }
+
+
+def run_matrix(args) -> dict:
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    protocols = [p.strip() for p in args.protocols.split(",") if p.strip()]
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise SystemExit(f"cenário desconhecido: {name} (disponíveis: {', '.join(SCENARIOS)})")
+
+    notes = []
+    certs = None
+    certdir = tempfile.mkdtemp(prefix="bench-cert-")
+    if "h2" in protocols:
+        if not h2_available():
+            notes.append("h2 ignorado: pacote 'h2' não instalado")
+            protocols.remove("h2")
+        else:
+            certs = make_self_signed_cert(certdir)
+            if certs is None:
+                notes.append("h2 ignorado: não foi possível gerar certificado com openssl")
+                protocols.remove("h2")
+
+    results = []
+    try:
+        for scenario in scenarios:
+            for protocol in protocols:
+                for engine in engines:
+                    for rep in range(args.repeat):
+                        print(f"[BENCH] {scenario} / {protocol} / {engine} (#{rep + 1})", file=sys.stderr, flush=True)
+                        server = ServerProcess(args.size_mb, SCENARIOS[scenario], protocol, certs, rng_seed=rep + 1)
+                        try:
+                            child = run_child(engine, server.url, args.timeout)
+                            stats = server.stats()
+                        finally:
+                            server.stop()
+                        row = summarize(engine, protocol, scenario, server, child, stats)
+                        row["repeat"] = rep
+                        results.append(row)
+                        print(f"[BENCH]   ok={row['ok']} {row['mb_s']} MB/s, p99 {row['latency_ms']['p99']} ms, "
+                              f"{row['cpu_s_per_gb']} s CPU/GB, RSS {row['peak_rss_mb']} MB", file=sys.stderr, flush=True)
+    finally:
+        shutil.rmtree(certdir, ignore_errors=True)
+
+    return {
+        "version": RESULT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size_mb": args.size_mb,
+        "scenarios": {name: SCENARIOS[name] for name in scenarios},
+        "notes": notes,
+        "results": results,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Benchmark dos engines de download (serial / segmentado)")
+    p.add_argument("--size-mb", type=float, default=256,
+                   help="Tamanho do arquivo (abaixo de 50 MB o segmentado cai para o serial)")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    p.add_argument("--protocols", default=",".join(PROTOCOLS))
+    p.add_argument("--engines", default=",".join(ENGINES))
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--timeout", type=float, default=900, help="Tempo máximo por download (s)")
+    p.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    # Uso interno: um download isolado num processo filho
+    p.add_argument("--run-one", choices=ENGINES, help=argparse.SUPPRESS)
+    p.add_argument("--url", help=argparse.SUPPRESS)
+    p.add_argument("--workdir", help=argparse.SUPPRESS)
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.url, args.workdir)), flush=True)
+        return
+    report = run_matrix(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[BENCH] Resultado salvo em {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
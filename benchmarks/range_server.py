@@ -0,0 +1,373 @@
+"""
+Servidor HTTP local com suporte a Range para benchmark do engine de download.
+
+Serve um arquivo sintético (determinístico a partir de --seed) sem tocar no disco,
+em HTTP/1.1 e, com --tls, HTTP/2 via ALPN (precisa do pacote `h2`, que já vem
+com httpx[http2]). Condições de rede configuráveis:
+
+  --bandwidth   teto total do servidor (bytes/s, 0 = sem teto)
+  --per-conn    teto por conexão/stream (bytes/s, 0 = sem teto)
+  --latency     atraso antes dos headers de cada resposta (segundos)
+  --error-rate  probabilidade de responder 5xx (500/503) em vez do arquivo
+  --reset-rate  probabilidade de derrubar a conexão/stream no meio do corpo
+
+GET /__stats devolve (e zera) os tempos de cada requisição em JSON; o driver do
+benchmark usa isso para TTFB e latência de cauda. Uso avulso:
+
+  python -m benchmarks.range_server --port 8765 --size-mb 256 --per-conn 4000000
+"""
+import ssl
+import json
+import time
+import random
+import asyncio
+import argparse
+import hashlib
+from typing import Optional, List
+
+PATTERN_SIZE = 1024 * 1024
+SEND_CHUNK = 64 * 1024
+FILE_PATH = "/file.bin"
+
+
+def make_pattern(seed: int) -> bytes:
+    return random.Random(seed).randbytes(PATTERN_SIZE)
+
+
+def expected_sha256(size: int, seed: int) -> str:
+    """SHA-256 do arquivo sintético (para o driver conferir o que foi baixado)."""
+    pattern = make_pattern(seed)
+    h = hashlib.sha256()
+    full, rest = divmod(size, PATTERN_SIZE)
+    for _ in range(full):
+        h.update(pattern)
+    h.update(pattern[:rest])
+    return h.hexdigest()
+
+
+class _Bucket:
+    """Token bucket simples (bytes/s). rate=0 desliga."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    async def take(self, n: int):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.rate * 0.25, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= n
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class RangeServer:
+    def __init__(self, size: int, seed: int = 1, bandwidth: int = 0, per_conn: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, reset_rate: float = 0.0, rng_seed: Optional[int] = None):
+        self.size = size
+        self.pattern = make_pattern(seed)
+        self.etag = f'"bench-{seed}-{size}"'
+        self.per_conn = per_conn
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.global_bucket = _Bucket(bandwidth)
+        self.rng = random.Random(rng_seed)
+        self.stats: List[dict] = []
+        self.errors_injected = 0
+        self.resets_injected = 0
+
+    # ---------------------- conteúdo ----------------------
+
+    def slice(self, start: int, length: int) -> bytes:
+        out = bytearray()
+        pos = start
+        while len(out) < length:
+            off = pos % PATTERN_SIZE
+            take = min(PATTERN_SIZE - off, length - len(out))
+            out += self.pattern[off:off + take]
+            pos += take
+        return bytes(out)
+
+    def parse_range(self, value: Optional[str]):
+        """Retorna (start, end) ou None (arquivo inteiro). Só um range por pedido."""
+        if not value or not value.startswith("bytes="):
+            return None
+        spec = value[6:].split(",")[0].strip()
+        first, _, last = spec.partition("-")
+        if first == "":
+            n = int(last)
+            return max(0, self.size - n), self.size - 1
+        start = int(first)
+        end = int(last) if last else self.size - 1
+        return start, min(end, self.size - 1)
+
+    def plan(self, method: str, path: str, headers: dict):
+        """Decide a resposta: (status, headers, start, length, reset_at)."""
+        if path == "/__stats":
+            body = json.dumps(self.take_stats()).encode()
+            return 200, {"content-type": "application/json", "content-length": str(len(body))}, body, None
+        if path != FILE_PATH:
+            return 404, {"content-length": "0"}, b"", None
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors_injected += 1
+            status = self.rng.choice((500, 503))
+            return status, {"content-length": "0", "retry-after": "1"}, b"", None
+
+        rng = self.parse_range(headers.get("range"))
+        if_range = headers.get("if-range")
+        if rng and if_range and if_range != self.etag:
+            rng = None
+        base = {"accept-ranges": "bytes", "etag": self.etag, "content-type": "application/octet-stream"}
+        if rng:
+            start, end = rng
+            if start >= self.size or start > end:
+                return 416, {**base, "content-range": f"bytes */{self.size}", "content-length": "0"}, b"", None
+            status = 206
+            base["content-range"] = f"bytes {start}-{end}/{self.size}"
+        else:
+            start, end = 0, self.size - 1
+            status = 200
+        length = end - start + 1
+        base["content-length"] = str(length)
+        reset_at = None
+        if method == "GET" and self.reset_rate and self.rng.random() < self.reset_rate:
+            self.resets_injected += 1
+            reset_at = self.rng.randint(0, max(0, length - 1))
+        return status, base, (start, length if method == "GET" else 0), reset_at
+
+    def take_stats(self) -> dict:
+        out = {"requests": self.stats, "errors_injected": self.errors_injected, "resets_injected": self.resets_injected}
+        self.stats = []
+        self.errors_injected = 0
+        self.resets_injected = 0
+        return out
+
+    async def body_chunks(self, start: int, length: int, bucket: _Bucket):
+        sent = 0
+        while sent < length:
+            n = min(SEND_CHUNK, length - sent)
+            await bucket.take(n)
+            await self.global_bucket.take(n)
+            yield self.slice(start + sent, n)
+            sent += n
+
+    # ---------------------- HTTP/1.1 ----------------------
+
+    async def handle_h1(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                if not await self._respond_h1(method, path, headers, writer):
+                    return
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _respond_h1(self, method: str, path: str, headers: dict, writer: asyncio.StreamWriter) -> bool:
+        t_req = time.time()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status, resp_headers, body, reset_at = self.plan(method, path, headers)
+        reason = {200: "OK", 206: "Partial Content", 404: "Not Found", 416: "Range Not Satisfiable",
+                  500: "Internal Server Error", 503: "Service Unavailable"}.get(status, "")
+        head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in resp_headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1"))
+        rec = {"t_request": t_req, "t_first_byte": None, "t_done": None, "status": status, "bytes": 0, "proto": "h1"}
+        self.stats.append(rec)
+        if isinstance(body, bytes):
+            writer.write(body)
+            await writer.drain()
+            rec["t_first_byte"] = rec["t_done"] = time.time()
+            return True
+        start, length = body
+        bucket = _Bucket(self.per_conn)
+        async for chunk in self.body_chunks(start, length, bucket):
+            if reset_at is not None and rec["bytes"] + len(chunk) > reset_at:
+                writer.transport.abort()
+                rec["t_done"] = time.time()
+                rec["reset"] = True
+                return False
+            writer.write(chunk)
+            await writer.drain()
+            if rec["t_first_byte"] is None:
+                rec["t_first_byte"] = time.time()
+            rec["bytes"] += len(chunk)
+        rec["t_done"] = time.time()
+        if rec["t_first_byte"] is None:
+            rec["t_first_byte"] = rec["t_done"]
+        return True
+
+    # ---------------------- HTTP/2 ----------------------
+
+    async def handle_h2(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        window_open = asyncio.Event()
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def flush():
+            data = conn.data_to_send()
+            if data:
+                writer.write(data)
+                await writer.drain()
+
+        async def send_stream(stream_id: int, headers: dict):
+            t_req = time.time()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            status, resp_headers, body, reset_at = self.plan(headers.get(":method", "GET"), headers.get(":path", "/"), headers)
+            rec = {"t_request": t_req, "t_first_byte": None, "t_done": None, "status": status, "bytes": 0, "proto": "h2"}
+            self.stats.append(rec)
+            async with lock:
+                conn.send_headers(stream_id, [(":status", str(status))] + list(resp_headers.items()),
+                                  end_stream=isinstance(body, bytes) and not body)
+                await flush()
+            if isinstance(body, bytes):
+                if body:
+                    async with lock:
+                        conn.send_data(stream_id, body, end_stream=True)
+                        await flush()
+                rec["t_first_byte"] = rec["t_done"] = time.time()
+                return
+            start, length = body
+            bucket = _Bucket(self.per_conn)
+            async for chunk in self.body_chunks(start, length, bucket):
+                if reset_at is not None and rec["bytes"] + len(chunk) > reset_at:
+                    async with lock:
+                        conn.reset_stream(stream_id)
+                        await flush()
+                    rec["t_done"] = time.time()
+                    rec["reset"] = True
+                    return
+                view = memoryview(chunk)
+                while view:
+                    async with lock:
+                        allowed = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(view))
+                        if allowed > 0:
+                            conn.send_data(stream_id, bytes(view[:allowed]))
+                            await flush()
+                            view = view[allowed:]
+                            continue
+                        window_open.clear()
+                    await window_open.wait()
+                if rec["t_first_byte"] is None:
+                    rec["t_first_byte"] = time.time()
+                rec["bytes"] += len(chunk)
+            async with lock:
+                conn.end_stream(stream_id)
+                await flush()
+            rec["t_done"] = time.time()
+
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                async with lock:
+                    events = conn.receive_data(data)
+                    for ev in events:
+                        if isinstance(ev, h2.events.RequestReceived):
+                            hdrs = {k.lower(): v for k, v in ev.headers}
+                            t = asyncio.create_task(send_stream(ev.stream_id, hdrs))
+                            tasks.add(t)
+                            t.add_done_callback(tasks.discard)
+                        elif isinstance(ev, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                            window_open.set()
+                        elif isinstance(ev, h2.events.ConnectionTerminated):
+                            return
+                    await flush()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        except Exception:
+            return
+        finally:
+            for t in list(tasks):
+                t.cancel()
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    # ---------------------- entrada ----------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        ssl_obj = writer.get_extra_info("ssl_object")
+        if ssl_obj is not None and ssl_obj.selected_alpn_protocol() == "h2":
+            await self.handle_h2(reader, writer)
+        else:
+            await self.handle_h1(reader, writer)
+
+
+def make_ssl_context(certfile: str, keyfile: str, http2: bool) -> ssl.SSLContext:
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(certfile, keyfile)
+    ctx.set_alpn_protocols(["h2", "http/1.1"] if http2 else ["http/1.1"])
+    return ctx
+
+
+async def serve(args):
+    server = RangeServer(
+        size=int(args.size_mb * 1024 * 1024), seed=args.seed, bandwidth=args.bandwidth, per_conn=args.per_conn,
+        latency=args.latency, error_rate=args.error_rate, reset_rate=args.reset_rate, rng_seed=args.rng_seed
+    )
+    ssl_ctx = make_ssl_context(args.cert, args.key, args.http2) if args.tls else None
+    srv = await asyncio.start_server(server.handle, args.host, args.port, ssl=ssl_ctx, backlog=1024)
+    port = srv.sockets[0].getsockname()[1]
+    scheme = "https" if ssl_ctx else "http"
+    # Primeira linha na saída: o driver lê a URL daqui
+    print(json.dumps({"url": f"{scheme}://{args.host}:{port}{FILE_PATH}", "size": server.size,
+                      "sha256": expected_sha256(server.size, args.seed)}), flush=True)
+    async with srv:
+        await srv.serve_forever()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Servidor HTTP de ranges para benchmark")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--size-mb", type=float, default=256)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--rng-seed", type=int, default=None, help="Semente das falhas aleatórias (reprodutível)")
+    p.add_argument("--bandwidth", type=int, default=0)
+    p.add_argument("--per-conn", type=int, default=0)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--reset-rate", type=float, default=0.0)
+    p.add_argument("--tls", action="store_true")
+    p.add_argument("--http2", action="store_true", help="Anunciar h2 via ALPN (requer --tls)")
+    p.add_argument("--cert")
+    p.add_argument("--key")
+    return p
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(build_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,143 @@
+import os
+import re
+from collections import deque
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+
+# ============================================================
+# PARSER INCREMENTAL DA SAÍDA DO aria2c (MODO CLI)
+# ============================================================
+
+_GID_RE = re.compile(r'\[#([a-f0-9]{6,})')
+_PROGRESS_RE = re.compile(r'\[#([a-f0-9]{6,}) ([\d.]+)(B|KiB|MiB|GiB)/([\d.]+)(B|KiB|MiB|GiB)')
+_PCT_RE = re.compile(r'\((\d+)%\)')
+_CN_RE = re.compile(r'CN:(\d+)')
+_SD_RE = re.compile(r'SD:(\d+)')
+_DL_RE = re.compile(r'DL:([\d.]+)(B|KiB|MiB|GiB)')
+_COMPLETE_RE = re.compile(r'Download complete:\s*(.+)$')
+_FILE_RE = re.compile(r'FILE:\s*(.+)/[^/]+(?:\s|$)')
+
+_UNITS = {'B': 1, 'KiB': 1024, 'MiB': 1024**2, 'GiB': 1024**3}
+
+
+def parse_progress_line(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Linha de resumo do aria2, ex.:
+    [#2d5f00 0B/8.7KiB(0%) CN:51 SD:3 DL:0B]
+    [#69e19f 344MiB/1.6GiB(20%) CN:72 SD:12 DL:11MiB ETA:1m51s]
+    GID volta na forma curta (6 caracteres).
+    """
+    match = _PROGRESS_RE.search(line)
+    if not match:
+        return None
+    gid, down_val, down_unit, total_val, total_unit = match.groups()
+    pct = _PCT_RE.search(line)
+    peers = _CN_RE.search(line)
+    seeders = _SD_RE.search(line)
+    speed = _DL_RE.search(line)
+    return {
+        'gid': gid[:6],
+        'downloaded': int(float(down_val) * _UNITS.get(down_unit, 1)),
+        'total': int(float(total_val) * _UNITS.get(total_unit, 1)),
+        'percentage': int(pct.group(1)) if pct else 0,
+        'peers': int(peers.group(1)) if peers else 0,
+        'seeders': int(seeders.group(1)) if seeders else 0,
+        'speed': int(float(speed.group(1)) * _UNITS.get(speed.group(2), 1)) if speed else 0,
+    }
+
+
+class Aria2OutputParser:
+    """
+    Lê cada linha do aria2 uma única vez (no event loop) e mantém só o estado
+    que o loop do download consulta: GIDs na ordem em que apareceram, último
+    progresso por GID, caminho da notificação de conclusão e último FILE:.
+
+    Das linhas em si só fica um buffer circular (`tail`) para diagnóstico, então
+    torrents longos com --log-level=debug não crescem a memória nem são
+    re-varridos a cada 100 ms.
+    """
+
+    TAIL_LINES = 200
+
+    def __init__(self, tail_lines: Optional[int] = None):
+        self.tail = deque(maxlen=tail_lines or self.TAIL_LINES)
+        self.lines = 0
+        self.gids: List[str] = []  # forma curta, ordem de aparição
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+        self.latest: Optional[Dict[str, Any]] = None
+        self.completion_path: Optional[str] = None
+        self.file_dir: Optional[str] = None
+
+    def feed(self, line: str) -> bool:
+        """Processa uma linha; True se ela mudou progresso, GIDs ou caminho."""
+        line = line.rstrip('\r\n')
+        if not line:
+            return False
+        self.lines += 1
+        self.tail.append(line)
+        changed = False
+        if '[#' in line:
+            gid_match = _GID_RE.search(line)
+            if gid_match:
+                gid = gid_match.group(1)[:6]
+                if gid not in self.gids:
+                    self.gids.append(gid)
+                    changed = True
+            progress = parse_progress_line(line)
+            if progress:
+                self._seq += 1
+                progress['seq'] = self._seq
+                self._progress[progress['gid']] = progress
+                self.latest = progress
+                changed = True
+        if "[NOTICE] Download complete:" in line:
+            match = _COMPLETE_RE.search(line)
+            if match:
+                self.completion_path = match.group(1).strip()
+                changed = True
+        elif "FILE:" in line:
+            match = _FILE_RE.search(line)
+            if match:
+                self.file_dir = match.group(1).strip()
+        return changed
+
+    # ---------------------- consultas ----------------------
+
+    def first_gid(self, exclude: Optional[str] = None) -> Optional[str]:
+        """Primeiro GID visto (diferente de `exclude`): metadados primeiro, download real depois."""
+        for gid in self.gids:
+            if gid != exclude:
+                return gid
+        return None
+
+    def progress(self, allowed_gids=None) -> Optional[Dict[str, Any]]:
+        """Último progresso reportado (só dos GIDs permitidos, se informados)."""
+        if not allowed_gids:
+            return dict(self.latest) if self.latest else None
+        candidates = [self._progress[g] for g in allowed_gids if g in self._progress]
+        return dict(max(candidates, key=lambda p: p['seq'])) if candidates else None
+
+    def download_path(self) -> Optional[Path]:
+        """
+        Caminho real do download segundo o aria2:
+        1. notificação de conclusão (raiz do torrent);
+        2. pasta do último FILE: (subindo um nível se a raiz tem o .aria2).
+        """
+        completion, file_dir = self.completion_path, self.file_dir
+        if completion:
+            candidate = Path(os.path.normpath(completion))
+            if candidate.exists():
+                return candidate
+        if file_dir:
+            candidate = Path(os.path.normpath(file_dir))
+            if candidate.exists():
+                parent = candidate.parent
+                if parent != candidate and Path(str(parent) + ".aria2").exists():
+                    return parent
+                return candidate
+        return None
+
+    def recent(self, n: int = 20) -> List[str]:
+        return list(self.tail)[-n:]
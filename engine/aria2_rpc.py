@@ -0,0 +1,511 @@
+import os
+import time
+import socket
+import asyncio
+import secrets
+import subprocess
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Callable
+
+import httpx
+
+from .aria2_wrapper import _get_aria2_paths, cleanup_aria2_residuals
+from .trackers import injected_trackers
+from .torrent_cache import torrent_cache, magnet_infohash
+from .bandwidth import JobBandwidth
+
+
+# ============================================================
+# DAEMON aria2c ÚNICO (JSON-RPC) PARA TODOS OS MAGNETS
+# ============================================================
+
+class Aria2RpcError(Exception):
+    """Erro devolvido pelo aria2 (ou daemon inacessível)."""
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+
+# Opções globais do daemon: as mesmas do modo CLI, mas uma vez só para todos os jobs
+# (uma tabela DHT quente, um par de portas de escuta)
+DAEMON_OPTIONS = [
+    '--continue=true',
+    '--auto-file-renaming=false',
+    '--reuse-uri=true',
+    '--allow-overwrite=true',
+    '--max-resume-failure-tries=10',
+    '--save-session-interval=5',
+    '--bt-save-metadata=true',
+    '--bt-load-saved-metadata=true',
+    '--bt-detach-seed-only=false',
+    '--file-allocation=trunc',
+    '--seed-time=0',
+    '--bt-max-peers=0',
+    '--bt-max-open-files=1024',
+    '--max-connection-per-server=16',
+    '--max-concurrent-downloads=16',
+    '--check-integrity=false',
+    '--bt-tracker-connect-timeout=10',
+    '--bt-tracker-interval=40',
+    '--dht-listen-port=6881-6889',
+    '--dht-entry-point=dht.transmissionbt.com:6881',
+    '--dht-entry-point6=dht.transmissionbt.com:6881',
+    '--enable-dht=true',
+    '--enable-dht6=true',
+    '--bt-enable-lpd=true',
+    '--max-tries=5',
+    '--retry-wait=1',
+    '--use-head=false',
+    '--allow-piece-length-change=true',
+    '--max-upload-limit=0',
+    '--bt-request-peer-speed-limit=0',
+    '--connect-timeout=5',
+    '--min-split-size=1M',
+    '--bt-require-crypto=false',
+    '--bt-min-crypto-level=plain',
+    '--peer-id-prefix=-qB4390-',
+    '--user-agent=qBittorrent/4.5.0',
+    '--listen-port=6881-6889',
+    '--enable-peer-exchange=true',
+    '--bt-hash-check-seed=false',
+]
+
+STATUS_KEYS = ["gid", "status", "totalLength", "completedLength", "downloadSpeed", "connections",
+               "numSeeders", "followedBy", "following", "errorCode", "errorMessage", "dir", "files",
+               "bittorrent", "infoHash"]
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Aria2RpcClient:
+    """Cliente JSON-RPC mínimo (HTTP POST em /jsonrpc) com o token secreto do daemon."""
+
+    def __init__(self, url: str, secret: Optional[str] = None, timeout: float = 10.0):
+        self.url = url
+        self.secret = secret
+        self._client = httpx.AsyncClient(timeout=timeout, trust_env=False)
+        self._ids = 0
+
+    def _params(self, params) -> list:
+        return ([f"token:{self.secret}"] if self.secret else []) + list(params)
+
+    async def call(self, method: str, *params) -> Any:
+        return await self._post(method, self._params(params))
+
+    async def _post(self, method: str, params: list) -> Any:
+        self._ids += 1
+        payload = {"jsonrpc": "2.0", "id": str(self._ids), "method": method, "params": params}
+        try:
+            r = await self._client.post(self.url, json=payload)
+            data = r.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise Aria2RpcError(f"aria2 RPC inacessível ({method}): {e}")
+        if "error" in data:
+            err = data["error"] or {}
+            raise Aria2RpcError(err.get("message") or str(err), err.get("code"))
+        return data.get("result")
+
+    async def multicall(self, calls: List[tuple]) -> List[Any]:
+        """Várias chamadas num POST só (system.multicall); erros individuais voltam como Aria2RpcError."""
+        batch = [{"methodName": m, "params": self._params(p)} for m, *p in calls]
+        results = await self._post("system.multicall", [batch])  # system.* não leva token
+        out = []
+        for res in results:
+            if isinstance(res, dict) and "faultCode" in res:
+                out.append(Aria2RpcError(res.get("faultString", ""), res.get("faultCode")))
+            else:
+                out.append(res[0] if isinstance(res, list) and res else res)
+        return out
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class Aria2Daemon:
+    """
+    Um aria2c com RPC ligado, compartilhado por todos os jobs magnet.
+
+    Sobe sob demanda no primeiro magnet (`ensure`) e volta a subir se morrer.
+    Uma DHT e uma sessão só: downloads pausados ficam no daemon (e no arquivo de
+    sessão, recarregado no próximo start), então retomar é um `unpause`.
+    Com `url` informado usa um servidor RPC externo (ex.: servidor falso de
+    teste) e não inicia processo nenhum.
+    """
+
+    START_TIMEOUT = 10.0
+
+    def __init__(self, url: Optional[str] = None, secret: Optional[str] = None, port: int = 0):
+        self.external_url = url
+        self.secret = secret or (None if url else secrets.token_hex(16))
+        self.port = port
+        self.proc: Optional[subprocess.Popen] = None
+        self.client: Optional[Aria2RpcClient] = None
+        self.version: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        if self.external_url:
+            return self.client is not None
+        return self.proc is not None and self.proc.poll() is None and self.client is not None
+
+    def _command(self, aria2_path: str, port: int) -> List[str]:
+        session_file, dht_file = _get_aria2_paths()
+        try:
+            dht_file.parent.mkdir(parents=True, exist_ok=True)
+        except Exception:
+            pass
+        cmd = [
+            aria2_path,
+            '--enable-rpc=true',
+            '--rpc-listen-all=false',
+            f'--rpc-listen-port={port}',
+            f'--rpc-secret={self.secret}',
+            '--rpc-max-request-size=16M',
+            '--save-session=' + str(session_file),
+            '--dht-file-path=' + str(dht_file),
+            '--quiet=true',
+            '--log-level=warn',
+        ] + DAEMON_OPTIONS
+        if session_file.exists() and session_file.stat().st_size > 0:
+            cmd.append('--input-file=' + str(session_file))
+        return cmd
+
+    async def ensure(self, aria2_path: Optional[str] = None) -> bool:
+        """Garante o daemon de pé; False se não foi possível (o chamador usa o modo CLI)."""
+        async with self._lock:
+            if self.alive:
+                return True
+            await self._close_client()
+            try:
+                if self.external_url:
+                    self.client = Aria2RpcClient(self.external_url, self.secret)
+                else:
+                    if not aria2_path or not os.path.exists(aria2_path):
+                        raise Aria2RpcError("aria2c binary not found")
+                    port = self.port or _free_port()
+                    self.proc = subprocess.Popen(
+                        self._command(aria2_path, port),
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+                    )
+                    self.client = Aria2RpcClient(f"http://127.0.0.1:{port}/jsonrpc", self.secret)
+                await self._wait_ready()
+                print(f"[ARIA2-RPC] Daemon pronto (aria2 {self.version}"
+                      f"{', pid ' + str(self.proc.pid) if self.proc else ', externo'})")
+                self.last_error = None
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[ARIA2-RPC] Daemon indisponível, usando modo CLI: {e}")
+                await self._terminate()
+                return False
+
+    async def _wait_ready(self):
+        deadline = time.time() + self.START_TIMEOUT
+        while True:
+            if self.proc is not None and self.proc.poll() is not None:
+                raise Aria2RpcError(f"aria2c saiu ao iniciar (código {self.proc.returncode})")
+            try:
+                info = await self.client.call("aria2.getVersion")
+                self.version = (info or {}).get("version")
+                return
+            except Aria2RpcError:
+                if time.time() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+    async def call(self, method: str, *params) -> Any:
+        if not self.client:
+            raise Aria2RpcError("aria2 daemon não iniciado")
+        return await self.client.call(method, *params)
+
+    async def find_by_infohash(self, infohash: str) -> Optional[Dict[str, Any]]:
+        """Download já conhecido pelo daemon com esse infohash (ativo, na fila ou parado)."""
+        keys = ["gid", "status", "infoHash", "followedBy", "following"]
+        results = await self.client.multicall([
+            ("aria2.tellActive", keys),
+            ("aria2.tellWaiting", 0, 1000, keys),
+            ("aria2.tellStopped", 0, 1000, keys),
+        ])
+        found = []
+        for res in results:
+            if isinstance(res, list):
+                found.extend(d for d in res if (d.get("infoHash") or "").lower() == infohash)
+        # O download real (seguindo os metadados) tem preferência sobre o de metadados
+        found.sort(key=lambda d: (not d.get("following"), d.get("status") in ("complete", "removed", "error")))
+        return found[0] if found else None
+
+    async def shutdown(self):
+        """Pausa tudo, salva a sessão (pausados voltam no próximo start) e encerra o daemon."""
+        async with self._lock:
+            if self.client and not self.external_url:
+                try:
+                    # Job cancelado no meio do poll não pausou o seu gid: sem isso a sessão sai
+                    # com o download ativo e o --input-file o retoma sem job acompanhando
+                    await self.client.call("aria2.forcePauseAll")
+                    await self.client.call("aria2.saveSession")
+                    await self.client.call("aria2.shutdown")
+                except Exception:
+                    pass
+            await self._terminate()
+
+    async def _terminate(self):
+        await self._close_client()
+        if self.proc is not None:
+            try:
+                if self.proc.poll() is None:
+                    self.proc.terminate()
+                    try:
+                        await asyncio.to_thread(self.proc.wait, 10)
+                    except subprocess.TimeoutExpired:
+                        self.proc.kill()
+            except Exception:
+                pass
+            self.proc = None
+
+    async def _close_client(self):
+        if self.client:
+            try:
+                await self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+    def snapshot(self) -> dict:
+        return {
+            "alive": self.alive,
+            "external": bool(self.external_url),
+            "pid": self.proc.pid if self.proc else None,
+            "version": self.version,
+            "last_error": self.last_error,
+        }
+
+
+async def _force_pause(daemon: Aria2Daemon, gid: str):
+    try:
+        await daemon.call("aria2.forcePause", gid)
+        await daemon.call("aria2.saveSession")
+    except Aria2RpcError as e:
+        print(f"[ARIA2-RPC] Falha ao pausar gid={gid}: {e}")
+
+
+def _limit_option(rate: Optional[float]) -> str:
+    """max-download-limit do aria2 ("0" = sem limite)."""
+    return str(int(rate)) if rate and rate > 0 else "0"
+
+
+def _download_root(status: Dict[str, Any]) -> Optional[Path]:
+    """Pasta (multi-arquivo) ou arquivo raiz do download."""
+    name = ((status.get("bittorrent") or {}).get("info") or {}).get("name")
+    if name and status.get("dir"):
+        return Path(status["dir"]) / name
+    files = status.get("files") or []
+    if files and files[0].get("path"):
+        return Path(files[0]["path"])
+    return None
+
+
+async def download_magnet_rpc(magnet_url: str, dest_path: str, daemon: Aria2Daemon,
+                              progress_cb: Optional[Callable] = None, stop_event: Optional[asyncio.Event] = None,
+                              total_size_hint: Optional[int] = None, job_id: Optional[int] = None,
+                              job_manager: Optional[object] = None, max_download_limit: Optional[int] = None,
+                              poll_interval: float = 0.5, bandwidth: Optional[JobBandwidth] = None) -> tuple[str, str]:
+    """
+    Magnet via daemon: mesma interface/retorno de `download_magnet_cli`
+    ((caminho, "completed" | "paused" | "canceled")).
+
+    O progresso vem de `aria2.tellStatus`; quando os metadados terminam o aria2
+    cria o download real (`followedBy`) e o acompanhamento passa para ele. Pausar
+    é `forcePause` (o download fica no daemon para o resume), cancelar é
+    `forceRemove`.
+
+    Com `bandwidth`, cada nova taxa do agendador (outro job entrou/saiu, teto
+    mudou pela API) vai para o gid atual com `aria2.changeOption`.
+    """
+    dest = Path(dest_path)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    infohash = magnet_infohash(magnet_url)
+
+    gid = None
+    applied_limit: Optional[str] = None  # None = ainda não aplicado ao gid atual
+    wanted = {"limit": _limit_option(bandwidth.rate if bandwidth else max_download_limit)}
+    if bandwidth is not None:
+        bandwidth.on_rate = lambda rate: wanted.__setitem__("limit", _limit_option(rate))
+    existing = await daemon.find_by_infohash(infohash) if infohash else None
+    if existing and existing.get("status") in ("paused", "active", "waiting"):
+        gid = existing["gid"]
+        print(f"[ARIA2-RPC] Retomando download existente no daemon (gid={gid}, status={existing['status']})")
+        if existing["status"] == "paused":
+            await daemon.call("aria2.unpause", gid)
+    else:
+        if existing:
+            try:
+                await daemon.call("aria2.removeDownloadResult", existing["gid"])
+            except Aria2RpcError:
+                pass
+        # Metadados já conhecidos: --bt-load-saved-metadata do daemon pula a fase do DHT
+        torrent_cache.restore(infohash, dest.parent)
+        # Trackers por download: o ranking do registro muda enquanto o daemon vive
+        options = {"dir": str(dest.parent), "out": dest.name}
+        trackers = await injected_trackers()
+        if trackers:
+            options["bt-tracker"] = ",".join(trackers)
+        if max_download_limit and max_download_limit > 0:
+            options["max-download-limit"] = str(int(max_download_limit))
+            print(f" Limite de banda: {max_download_limit/1024/1024:.2f} MB/s")
+        gid = await daemon.call("aria2.addUri", [magnet_url], options)
+        applied_limit = options.get("max-download-limit", "0")
+        print(f"[ARIA2-RPC] Magnet adicionado ao daemon (gid={gid})")
+
+    metadata_phase = True
+    metadata_done_until = 0.0
+    final_path: Optional[Path] = None
+    last_completed = -1
+    last_change = time.time()
+    status: Dict[str, Any] = {}
+
+    try:
+        while True:
+            if stop_event and stop_event.is_set():
+                canceled = job_id and job_manager and job_manager.is_job_canceled(job_id)
+                try:
+                    if canceled:
+                        await daemon.call("aria2.forceRemove", gid)
+                    else:
+                        await daemon.call("aria2.forcePause", gid)
+                        await daemon.call("aria2.saveSession")
+                except Aria2RpcError as e:
+                    print(f"[ARIA2-RPC] Falha ao parar gid={gid}: {e}")
+                if canceled:
+                    cleanup_aria2_residuals(final_path or dest)
+                    if infohash:
+                        _remove_quiet(dest.parent / f"{infohash}.torrent")
+                return str(final_path or dest), "canceled" if canceled else "paused"
+
+            if bandwidth is not None and wanted["limit"] != applied_limit:
+                try:
+                    await daemon.call("aria2.changeOption", gid, {"max-download-limit": wanted["limit"]})
+                    applied_limit = wanted["limit"]
+                except Aria2RpcError as e:
+                    print(f"[ARIA2-RPC] Falha ao ajustar limite de banda do gid={gid}: {e}")
+
+            status = await daemon.call("aria2.tellStatus", gid, STATUS_KEYS)
+            state = status.get("status")
+
+            if state == "complete" and status.get("followedBy"):
+                # Metadados prontos: o download de verdade é outro gid
+                gid = status["followedBy"][0]
+                applied_limit = None
+                metadata_phase = False
+                metadata_done_until = time.time() + 3.0
+                last_completed, last_change = -1, time.time()
+                torrent_cache.capture(dest.parent, infohash)
+                print(f"[ARIA2-RPC] Metadados baixados, acompanhando download real (gid={gid})")
+                continue
+            if status.get("bittorrent", {}).get("info"):
+                metadata_phase = False
+            root = _download_root(status)
+            if root and not metadata_phase:
+                final_path = root
+
+            if state == "error":
+                raise RuntimeError(f"aria2: {status.get('errorMessage') or 'erro ' + str(status.get('errorCode'))}")
+            if state == "removed":
+                return str(final_path or dest), "canceled"
+
+            completed = int(status.get("completedLength") or 0)
+            total = int(status.get("totalLength") or 0)
+            if metadata_phase:
+                phase, phase_label = "metadata", "Baixando metadados"
+                phase_progress = (completed / total * 100) if total else 0.0
+                downloaded, total_report = 0, total_size_hint or 0
+            else:
+                phase = "metadata_done" if time.time() < metadata_done_until else None
+                phase_label = "Metadados baixados" if phase else None
+                phase_progress = None
+                downloaded, total_report = completed, total or total_size_hint or 0
+
+            if progress_cb:
+                try:
+                    await progress_cb(
+                        downloaded,
+                        total_report,
+                        peers=int(status.get("connections") or 0),
+                        seeders=int(status.get("numSeeders") or 0),
+                        speed=int(status.get("downloadSpeed") or 0),
+                        phase=phase,
+                        phase_label=phase_label,
+                        phase_progress=phase_progress,
+                        real_path=str(final_path) if final_path else None
+                    )
+                except Exception as e:
+                    print(f"Error calling progress_cb: {e}")
+
+            if state == "complete":
+                print(f"[ARIA2-RPC] Download concluído: {final_path or dest}")
+                try:
+                    await daemon.call("aria2.removeDownloadResult", gid)
+                except Aria2RpcError:
+                    pass
+                torrent_cache.capture(dest.parent, infohash)
+                cleanup_aria2_residuals(final_path or dest)
+                if infohash:
+                    _remove_quiet(dest.parent / f"{infohash}.torrent")
+                return str(final_path or dest), "completed"
+
+            # Mesmos limites do modo CLI: torrent parado em 98%+ conta como concluído, sem progresso = falha
+            now = time.time()
+            if completed != last_completed:
+                last_completed, last_change = completed, now
+            stalled = now - last_change
+            if not metadata_phase and total and completed / total >= 0.98 and stalled > 120:
+                print(f"Download is {completed/total*100:.1f}% complete and stalled for {stalled:.0f}s - considering COMPLETE")
+                await daemon.call("aria2.forceRemove", gid)
+                return str(final_path or dest), "completed"
+            threshold = 180 if completed == 0 else (300 if completed < 1_000_000 else 600)
+            if stalled > threshold:
+                await daemon.call("aria2.forcePause", gid)
+                raise RuntimeError(f"No progress for {stalled:.0f}s - download stalled")
+
+            await asyncio.sleep(poll_interval)
+    except asyncio.CancelledError:
+        # Worker cancelado (shutdown do JobManager): o download não pode seguir ativo no daemon
+        try:
+            await asyncio.shield(_force_pause(daemon, gid))
+        except Exception:
+            pass
+        raise
+    except Aria2RpcError as e:
+        raise RuntimeError(f"aria2 RPC: {e}")
+    finally:
+        if bandwidth is not None:
+            bandwidth.on_rate = None
+
+
+def _remove_quiet(path: Path):
+    try:
+        if path.exists():
+            path.unlink()
+    except Exception:
+        pass
+
+
+def _daemon_from_config() -> Aria2Daemon:
+    try:
+        from backend import config as backend_config
+        return Aria2Daemon(url=getattr(backend_config, "ARIA2_RPC_URL", None),
+                           secret=getattr(backend_config, "ARIA2_RPC_SECRET", None),
+                           port=getattr(backend_config, "ARIA2_RPC_PORT", 0))
+    except Exception:
+        return Aria2Daemon()
+
+
+aria2_daemon = _daemon_from_config()
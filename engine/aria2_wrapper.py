@@ -13,6 +13,10 @@ import threading
 import xml.etree.ElementTree as ET
 import re
 
+from .aria2_output import Aria2OutputParser
+from .trackers import injected_trackers
+from .torrent_cache import torrent_cache, magnet_infohash
+
 
 def _get_aria2_paths(job_id: Optional[int] = None) -> tuple[Path, Path]:
     session_env = os.environ.get("ARIA2_SESSION_FILE")
@@ -42,156 +46,116 @@ def _get_aria2_paths(job_id: Optional[int] = None) -> tuple[Path, Path]:
     return session_file, dht_file
 
 
-# Lista de trackers públicos confiáveis para maximizar peers/seeders
-# Estes trackers são injetados automaticamente em todos os downloads magnet
-TRACKERS_EXTRAS = [
-    # Tier 1: BEST Performance (ngosang/trackerslist best_ip + newtrackon stable)
-    "udp://tracker.opentrackr.org:1337/announce",
-    "http://tracker.opentrackr.org:1337/announce",
-    "udp://9.rarbg.com:2810/announce",
-    "udp://open.demonii.com:1337/announce",
-    "udp://tracker.openbittorrent.com:80/announce",
-    "udp://tracker.coppersurfer.tk:6969/announce",
-    "udp://tracker.leechers-paradise.org:6969/announce",
-    "udp://p4p.arenabg.com:1337/announce",
-    "udp://tracker.internetwarriors.net:1337/announce",
-    "udp://open.stealth.si:80/announce",
-    "udp://tracker.tiny-vps.com:6969/announce",
-    "udp://tracker.torrent.eu.org:451/announce",
-    "udp://exodus.desync.com:6969/announce",
-    "udp://tracker.theoks.net:6969/announce",
-    "udp://explodie.org:6969/announce",
-    "udp://tracker.cyberia.is:6969/announce",
-    "udp://ipv4.tracker.harry.lu:80/announce",
-    "udp://retracker.lanta-net.ru:2710/announce",
-    "udp://tracker.moeking.me:6969/announce",
-    "udp://opentracker.i2p.rocks:6969/announce",
-    
-    # Tier 2: Public Stable
-    "udp://tracker.zerobytes.xyz:1337/announce",
-    "udp://finportal.ru:6969/announce",
-    "udp://tracker.leech.ie:1337/announce",
-    "udp://wambo.club:1337/announce",
-    "udp://tracker.doko.moe:6969/announce",
-    "udp://tracker.sbsub.com:2710/announce",
-    "udp://tracker.reboot.chat:6969/announce",
-    "udp://tracker.auctor.tv:6969/announce",
-    "udp://tracker.swateam.org.uk:2710/announce",
-    "udp://tracker.lelux.fi:6969/announce",
-    "udp://tracker.bittor.pw:1337/announce",
-    "udp://tracker.0x7c0.com:6969/announce",
-    
-    # Tier 3: IPv6 & Backup
-    "udp://tracker.dler.org:6969/announce",
-    "udp://tracker.uw0.xyz:6969/announce",
-    "udp://movies.zsw.ca:6969/announce",
-    "udp://tracker1.myporn.club:9337/announce",
-    "udp://open.tracker.cl:1337/announce",
-    "udp://tracker.dump.cl:6969/announce",
-    "udp://tracker.srv00.com:6969/announce",
-    "udp://tracker.qu.ax:6969/announce",
-    "udp://tracker2.dler.org:80/announce",
-    
-    # Tier 4: WebSeeds / HTTP / HTTPS (Failsafes)
-    "https://tracker.tamersunion.org:443/announce",
-    "https://tracker.nanoha.org:443/announce",
-    "https://tr.burnabyhighstar.com:443/announce",
-    "http://tracker.gbitt.info:80/announce",
-    "http://tracker.files.fm:6969/announce",
-    "http://tracker2.dler.org:80/announce",
-    "http://tracker1.bt.moack.co.kr:80/announce",
-    "http://tracker.dler.org:6969/announce",
-    "http://tr.kxmp.cf:80/announce",
-    
-    # Tier 5: Archive & Others
-    "udp://bt1.archive.org:6969/announce",
-    "udp://bt2.archive.org:6969/announce",
-    "udp://tracker.ccp.ovh:6969/announce",
-    "udp://tracker.birkenwald.de:6969/announce",
-    "udp://retracker01-msk-virt.corbina.net:80/announce",
-    "udp://opentracker.io:6969/announce",
-    "udp://open.free-tracker.ga:6969/announce",
-    "udp://new-line.net:6969/announce",
-    "udp://moonburrow.club:6969/announce",
-    "udp://leet-tracker.moe:1337/announce",
-    "udp://u.peer-exchange.download:6969/announce",
-    "udp://ttk2.nbaonlineservice.com:6969/announce",
-    "udp://tracker.tryhackx.org:6969/announce",
-    "udp://tracker.skynetcloud.site:6969/announce",
-    "udp://tracker.jamesthebard.net:6969/announce",
-    "udp://tracker.fnix.net:6969/announce",
-    "udp://tracker.filemail.com:6969/announce",
-    "udp://tracker.farted.net:6969/announce",
-    "udp://tracker.edkj.club:6969/announce",
-    "udp://tracker.deadorbit.nl:6969/announce",
-    "udp://tracker.darkness.services:6969/announce",
-    "udp://tamas3.ynh.fr:6969/announce",
-    "udp://ryjer.com:6969/announce",
-    "udp://run.publictracker.xyz:6969/announce",
-    "udp://public.tracker.vraphim.com:6969/announce",
-    "udp://p2p.publictracker.xyz:6969/announce",
-    "udp://open.u-p.pw:6969/announce",
-    "udp://open.publictracker.xyz:6969/announce",
-    "udp://open.dstud.io:6969/announce",
-    "udp://open.demonoid.ch:6969/announce",
-    "udp://odd-hd.fr:6969/announce",
-    "udp://martin-gebhardt.eu:25/announce",
-    "udp://jutone.com:6969/announce",
-    "udp://isk.richardsw.club:6969/announce",
-    "udp://evan.im:6969/announce",
-    "udp://epider.me:6969/announce",
-    "udp://d40969.acod.regrucolo.ru:6969/announce",
-    "udp://bt.rer.lol:6969/announce",
-    "udp://amigacity.xyz:6969/announce",
-    "udp://1c.premierzal.ru:6969/announce",
-    "https://trackers.run:443/announce",
-    "https://tracker.yemekyedim.com:443/announce",
-    "https://tracker.renfei.net:443/announce",
-    "https://tracker.pmman.tech:443/announce",
-    "https://tracker.lilithraws.org:443/announce",
-    "https://tracker.imgoingto.icu:443/announce",
-    "https://tracker.cloudit.top:443/announce",
-    "https://tracker-zhuqiy.dgj055.icu:443/announce",
-    "http://tracker.renfei.net:8080/announce",
-    "http://tracker.mywaifu.best:6969/announce",
-    "http://tracker.ipv6tracker.org:80/announce",
-    "http://tracker.files.fm:6969/announce",
-    "http://tracker.edkj.club:6969/announce",
-    "http://tracker.bt4g.com:2095/announce",
-    "http://tracker-zhuqiy.dgj055.icu:80/announce",
-    "http://t1.aag.moe:17715/announce",
-    "http://t.overflow.biz:6969/announce",
-    "http://bittorrent-tracker.e-n-c-r-y-p-t.net:1337/announce",
-    "udp://torrents.artixlinux.org:6969/announce",
-    "udp://mail.artixlinux.org:6969/announce",
-    "udp://ipv4.rer.lol:2710/announce",
-    "udp://concen.org:6969/announce",
-    "udp://bt.rer.lol:2710/announce",
-    "udp://aegir.sexy:6969/announce",
-    "https://www.peckservers.com:9443/announce",
-    "https://tracker.ipfsscan.io:443/announce",
-    "https://tracker.gcrenwp.top:443/announce",
-    "http://www.peckservers.com:9000/announce",
-    "http://tracker1.itzmx.com:8080/announce",
-    "http://ch3oh.ru:6969/announce",
-    "http://bvarf.tracker.sh:2086/announce",
-    "udp://tracker.moeking.me:6969/announce",
-    "udp://tracker.openbittorrent.com:6969/announce",
-    "udp://opentracker.i2p.rocks:6969/announce",
-    "udp://tracker.internetwarriors.net:1337/announce",
-    "udp://tracker.cyberia.is:6969/announce",
-    "udp://tracker.birkenwald.de:6969/announce",
-    "udp://retracker.lanta-net.ru:2710/announce",
-    "udp://ipv4.tracker.harry.lu:80/announce",
-    "udp://tracker.uw0.xyz:6969/announce",
-    "udp://tracker.lelux.fi:6969/announce",
-    "udp://movies.zsw.ca:6969/announce",
-    "udp://tracker.auctor.tv:6969/announce",
-    "udp://tracker.doko.moe:6969/announce",
-    "udp://tracker.qu.ax:6969/announce",
-    "udp://tracker.swateam.org.uk:2710/announce",
-    "udp://9.rarbg.com:2810/announce",
-]
+# Loop do modo CLI sem saída nova do aria2: acorda só para as checagens de travamento/tamanho
+ARIA2_IDLE_TICK = 2.0
+
+
+class Aria2Process:
+    """
+    aria2c supervisionado pelo event loop: as linhas de saída chegam por `lines()`
+    e o fim do processo por `wait()`, sem thread por job nem polling de `poll()`.
+
+    Usa asyncio.create_subprocess_exec; em loops sem suporte a subprocess
+    (SelectorEventLoop no Windows) cai para Popen com uma thread leitora que só
+    entrega as linhas ao loop.
+    """
+
+    LINE_LIMIT = 1024 * 1024  # linhas de debug do aria2 podem passar do limite padrão de 64 KiB
+
+    def __init__(self, proc, queue: Optional[asyncio.Queue] = None):
+        self._proc = proc
+        self._queue = queue
+
+    @classmethod
+    async def start(cls, cmd: List[str]) -> "Aria2Process":
+        flags = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,  # Merge stderr into stdout for better debugging
+                limit=cls.LINE_LIMIT,
+                creationflags=flags
+            )
+            return cls(proc)
+        except NotImplementedError:
+            popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     universal_newlines=True, bufsize=1, creationflags=flags)
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+
+            def pump():
+                try:
+                    for line in iter(popen.stdout.readline, ''):
+                        loop.call_soon_threadsafe(queue.put_nowait, line)
+                except Exception:
+                    pass
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, None)
+
+            threading.Thread(target=pump, daemon=True).start()
+            return cls(popen, queue)
+
+    @property
+    def pid(self) -> int:
+        return self._proc.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._proc.poll() if self._queue is not None else self._proc.returncode
+
+    @property
+    def running(self) -> bool:
+        return self.returncode is None
+
+    async def lines(self):
+        """Linhas da saída (stdout + stderr) até o processo fechar a saída."""
+        if self._queue is None:
+            while True:
+                try:
+                    raw = await self._proc.stdout.readline()
+                except ValueError:
+                    continue  # linha acima do limite: descartada
+                if not raw:
+                    return
+                yield raw.decode('utf-8', errors='replace')
+        else:
+            while True:
+                line = await self._queue.get()
+                if line is None:
+                    return
+                yield line
+
+    async def wait(self, timeout: Optional[float] = None) -> int:
+        """Espera o fim do processo; asyncio.TimeoutError se passar de `timeout`."""
+        if self._queue is None:
+            return await asyncio.wait_for(self._proc.wait(), timeout)
+        try:
+            return await asyncio.to_thread(self._proc.wait, timeout)
+        except subprocess.TimeoutExpired:
+            raise asyncio.TimeoutError()
+
+    def terminate(self):
+        try:
+            self._proc.terminate()
+        except ProcessLookupError:
+            pass
+
+    def kill(self):
+        try:
+            self._proc.kill()
+        except ProcessLookupError:
+            pass
+
+    async def stop(self, grace: float = 10.0) -> Optional[int]:
+        """Encerramento gracioso (aria2 salva a sessão) e kill se não sair em `grace` segundos."""
+        if self.running:
+            self.terminate()
+        try:
+            return await self.wait(grace)
+        except asyncio.TimeoutError:
+            self.kill()
+            return await self.wait()
 
 
 def find_aria2_binary(project_root: Optional[str] = None) -> Optional[str]:
@@ -241,7 +205,36 @@ def find_aria2_binary(project_root: Optional[str] = None) -> Optional[str]:
     return path
 
 
-async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Optional[Callable[[int, int, int, int, float, str, str, float, str], Any]] = None, stop_event: Optional[asyncio.Event] = None, aria2_path: Optional[str] = None, project_root: Optional[str] = None, total_size_hint: Optional[int] = None, job_id: Optional[int] = None, job_manager: Optional[object] = None) -> tuple[str, str]:
+def cleanup_aria2_residuals(actual_root: Path):
+    """Remove .aria2/.aria2c/.torrent deixados ao lado da pasta/arquivo do download (concluído ou cancelado)."""
+    try:
+        parent_dir = actual_root.parent
+        base_name = actual_root.name.lower()
+        
+        # Clean specific patterns linked to this download
+        for pattern in ['.aria2', '.aria2c', '.torrent']:
+            # 1. Direct match (Path + pattern)
+            target = Path(str(actual_root) + pattern)
+            if target.exists():
+                target.unlink()
+                print(f"   [OK] Removed direct residual: {target.name}")
+            
+            # 2. Aggressive substring match in parent dir (Online-Fix fix)
+            # Search for any file.aria2 that contains the download's base name
+            if parent_dir.exists():
+                for item in parent_dir.iterdir():
+                    if item.is_file() and item.name.lower().endswith(pattern):
+                        # If filename matches or is contained within our root name (e.g. hytale.aria2 vs Hytale folder)
+                        if base_name in item.name.lower() or item.name.lower().replace(pattern, '') in base_name:
+                            try:
+                                item.unlink()
+                                print(f"   [OK] Removed orphan residual via name matching: {item.name}")
+                            except: pass
+    except Exception as cleanup_err:
+        print(f"Error during aggressive cleanup: {cleanup_err}")
+
+
+async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Optional[Callable[[int, int, int, int, float, str, str, float, str], Any]] = None, stop_event: Optional[asyncio.Event] = None, aria2_path: Optional[str] = None, project_root: Optional[str] = None, total_size_hint: Optional[int] = None, job_id: Optional[int] = None, job_manager: Optional[object] = None, max_download_limit: Optional[int] = None) -> tuple[str, str]:
     """
     Download magnet using aria2c CLI (like v0).
     Monitors file size while aria2 is running with robust progress detection.
@@ -415,6 +408,10 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
     # Creating it empty beforehand causes: empty folder creation + stray .torrent files
     # Let aria2 handle the folder creation naturally
     
+    # Metadados já resolvidos antes (mesmo infohash): --bt-load-saved-metadata pula a fase do DHT
+    infohash = magnet_infohash(magnet_url)
+    torrent_cache.restore(infohash, dest.parent)
+
     # Build aria2 command (CLI mode, no RPC)
     # CRITICAL: When resuming, ONLY use --input-file, do NOT pass magnet URL again
     
@@ -472,10 +469,10 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
             '--bt-hash-check-seed=false',
             '--input-file=' + str(session_file)
         ]
-        if TRACKERS_EXTRAS:
-            trackers_str = ','.join(TRACKERS_EXTRAS)
-            cmd.append(f'--bt-tracker={trackers_str}')
-            print(f" TRACKERS EXTRAS INJETADOS: {len(TRACKERS_EXTRAS)} trackers adicionados")
+        trackers = await injected_trackers()
+        if trackers:
+            cmd.append('--bt-tracker=' + ','.join(trackers))
+            print(f" TRACKERS EXTRAS INJETADOS: {len(trackers)} trackers (mais saudáveis do registro)")
         print(f" Session loaded - continuing download with aggressive optimizations")
     else:
         #  FRESH START: Full command with magnet URL and all parameters
@@ -536,28 +533,26 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
         
         # Injetar trackers extras para maximizar peers/seeders
         # Formato: --bt-tracker=tracker1,tracker2,tracker3
-        if TRACKERS_EXTRAS:
-            trackers_str = ','.join(TRACKERS_EXTRAS)
-            cmd.append(f'--bt-tracker={trackers_str}')
-            print(f" TRACKERS EXTRAS INJETADOS: {len(TRACKERS_EXTRAS)} trackers adicionados")
+        trackers = await injected_trackers()
+        if trackers:
+            cmd.append('--bt-tracker=' + ','.join(trackers))
+            print(f" TRACKERS EXTRAS INJETADOS: {len(trackers)} trackers (mais saudáveis do registro)")
         
         print(f" FRESH START: Session will be created new with SAFE optimizations")
         # Add magnet URL ONLY for fresh start
         cmd.append(magnet_url)
     
+    # Limite de banda do job (agendador global): aria2 aplica o teto internamente
+    if max_download_limit and max_download_limit > 0:
+        cmd.insert(1, f'--max-download-limit={int(max_download_limit)}')
+        print(f" Limite de banda: {max_download_limit/1024/1024:.2f} MB/s")
+
     print(f"Starting aria2: {aria2_path}")
     print(f"Destination: {dest}")
     print(f"Command: {' '.join(cmd)}")
     
     # Start aria2 process with PIPE for both stdout and stderr
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,  # Merge stderr into stdout for better debugging
-        universal_newlines=True,
-        bufsize=1,  # Line buffered
-        creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
-    )
+    proc = await Aria2Process.start(cmd)
     
     print(f"aria2c PID: {proc.pid}")
     
@@ -580,25 +575,40 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
     real_gid_detected = False
     gid_detection_start = time.time()
     
-    # Thread-safe log buffer
-    aria2_log_buffer = []
-    log_lock = threading.Lock()
+    # Parser incremental: cada linha é processada uma vez; das linhas só fica um buffer circular
+    output = Aria2OutputParser()
+    
+    # Acordado a cada linha de progresso/caminho: o loop principal só roda quando há novidade
+    output_event = asyncio.Event()
     
-    def read_aria2_output():
-        """Read aria2 output line by line and buffer it"""
+    async def read_aria2_output():
+        """Read aria2 output line by line and feed the parser"""
         try:
-            for line in iter(proc.stdout.readline, ''):
+            async for line in proc.lines():
+                line = line.rstrip('\r\n')
                 if line:
-                    line = line.rstrip('\n')
-                    if line:
-                        print(f"   [aria2] {line}")
-                        with log_lock:
-                            aria2_log_buffer.append(line)
+                    print(f"   [aria2] {line}")
+                    if output.feed(line):
+                        output_event.set()
         except Exception as e:
             print(f"Error reading aria2 output: {e}")
+        finally:
+            output_event.set()
     
-    log_thread = threading.Thread(target=read_aria2_output, daemon=True)
-    log_thread.start()
+    reader_task = asyncio.create_task(read_aria2_output())
+    exit_task = asyncio.create_task(proc.wait())
+    
+    async def wait_for_activity():
+        """Dorme até: progresso novo do aria2, pedido de parada, fim do processo ou IDLE_TICK (checagens de travamento)."""
+        waiters = [asyncio.create_task(output_event.wait())]
+        if stop_event:
+            waiters.append(asyncio.create_task(stop_event.wait()))
+        try:
+            await asyncio.wait(waiters + [exit_task], timeout=ARIA2_IDLE_TICK, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for w in waiters:
+                w.cancel()
+        output_event.clear()
     
     # Track if aria2 loaded existing session
     session_loaded_indicator = False
@@ -609,80 +619,8 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
     metadata_show_done_until = 0.0
     metadata_was_active = False
     
-    def extract_download_path_from_logs() -> Optional[Path]:
-        """
-        Parse aria2 logs to find actual download path.
-        Looks for lines like: FILE: C:/Users/diego/Downloads/Hollow Knight.../fg-01.bin
-        Extracts the folder path (without the filename).
-        """
-        try:
-            with log_lock:
-                if not aria2_log_buffer:
-                    return None
-                
-                # Priority 1: Official completion notice (Absolute Truth for Root Folder)
-                # Matches: [NOTICE] Download complete: C:/Users/diego/Downloads/Hytale
-                for log_line in reversed(aria2_log_buffer[-100:]):
-                    if "[NOTICE] Download complete:" in log_line:
-                        match = re.search(r'Download complete:\s*(.+)$', log_line)
-                        if match:
-                            path_str = match.group(1).strip()
-                            path_str = path_str.replace('/', '\\')
-                            candidate = Path(path_str)
-                            if candidate.exists():
-                                print(f"DEBUG: Found ROOT download path from completion notice: {candidate}")
-                                return candidate
-
-                # Priority 2: File logs (Heuristic for mid-download)
-                recent_lines = aria2_log_buffer[-50:] if len(aria2_log_buffer) > 50 else aria2_log_buffer
-                for log_line in reversed(recent_lines):
-                    if "FILE:" in log_line:
-                        match = re.search(r'FILE:\s*(.+)/[^/]+(?:\s|$)', log_line)
-                        if match:
-                            path_str = match.group(1).strip()
-                            path_str = path_str.replace('/', '\\')
-                            candidate = Path(path_str)
-                            
-                            # CRITICAL: If this is a multifile torrent, the actual root is likely one or two levels up
-                            # We check if choosing the parent directory contains .aria2 metadata
-                            if candidate.exists():
-                                parent = candidate.parent
-                                aria2_meta = Path(str(candidate) + ".aria2")
-                                parent_aria2_meta = Path(str(parent) + ".aria2")
-                                
-                                if parent_aria2_meta.exists() and parent != candidate:
-                                    # Detected subfolder, using root
-                                    return parent
-                                    
-                                return candidate
-        except Exception:
-            pass
-        return None
-    
     # ==================== HELPER FUNCTIONS ====================
     
-    def extract_gid_from_log_line(log_line: str) -> Optional[str]:
-        """
-        Extract GID from aria2 log lines like:
-        [#401b0b 0B/4.7KiB(0%)...]     <- metadata GID (short form)
-        [#967bda 0B/851MiB(0%)...]     <- real download GID (short form)
-        [#be0a87d67f9e2e3d 0B/...]     <- full GID form
-        
-        The real GID is usually a different one that appears later,
-        when actual bytes are being downloaded (not metadata).
-        Returns the short 6-character form for comparison.
-        """
-        try:
-            # Try to match full GID first: [#XXXXXXXXXXXXXXXX or [#XXXXXX
-            match = re.search(r'\[#([a-f0-9]{6,})', log_line)
-            if match:
-                full_gid = match.group(1)
-                # Return short form (first 6 chars) for consistent comparison
-                return full_gid[:6]
-        except Exception:
-            pass
-        return None
-    
     def update_session_with_real_gid(real_gid: str) -> bool:
         """
         Update aria2.session file to contain the REAL download GID.
@@ -763,74 +701,6 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
     
     # ==================== MAIN HELPER FUNCTIONS ====================
     
-    def parse_aria2_progress(log_line: str) -> Optional[Dict[str, Any]]:
-        """
-        Parse aria2 progress line like:
-        [#2d5f00 0B/8.7KiB(0%) CN:51 SD:3 DL:0B]
-        [#69e19f 344MiB/1.6GiB(20%) CN:72 SD:12 DL:11MiB ETA:1m51s]
-        
-        Returns dict with keys: downloaded_bytes, total_bytes, percentage, peers, seeders, speed_bytes_per_sec
-        """
-        try:
-            # Match pattern: [#HASH DOWNLOADED/TOTAL(%)...]
-            match = re.search(r'\[#([a-f0-9]{6,}) ([\d.]+)(B|KiB|MiB|GiB)/([\d.]+)(B|KiB|MiB|GiB)', log_line)
-            if match:
-                gid, down_val, down_unit, total_val, total_unit = match.groups()
-                gid = gid[:6]
-                
-                multipliers = {'B': 1, 'KiB': 1024, 'MiB': 1024**2, 'GiB': 1024**3}
-                
-                downloaded_bytes = int(float(down_val) * multipliers.get(down_unit, 1))
-                total_bytes = int(float(total_val) * multipliers.get(total_unit, 1))
-                
-                # Extract percentage
-                pct_match = re.search(r'\((\d+)%\)', log_line)
-                percentage = int(pct_match.group(1)) if pct_match else 0
-                
-                # Extract peers/seeders
-                peers_match = re.search(r'CN:(\d+)', log_line)
-                peers = int(peers_match.group(1)) if peers_match else 0
-                
-                seeders_match = re.search(r'SD:(\d+)', log_line)
-                seeders = int(seeders_match.group(1)) if seeders_match else 0
-                
-                # Extract speed (DL:VALUE)
-                speed_bytes_per_sec = 0
-                speed_match = re.search(r'DL:([\d.]+)(B|KiB|MiB|GiB)', log_line)
-                if speed_match:
-                    speed_val, speed_unit = speed_match.groups()
-                    speed_bytes_per_sec = int(float(speed_val) * multipliers.get(speed_unit, 1))
-                
-                return {
-                    'gid': gid,
-                    'downloaded': downloaded_bytes,
-                    'total': total_bytes,
-                    'percentage': percentage,
-                    'peers': peers,
-                    'seeders': seeders,
-                    'speed': speed_bytes_per_sec
-                }
-        except Exception:
-            pass
-        return None
-    
-    def get_latest_progress_from_logs(allowed_gids=None) -> Optional[Dict[str, Any]]:
-        """Extract latest progress information from log buffer, filtered by GID if provided"""
-        with log_lock:
-            if not aria2_log_buffer:
-                return None
-            
-            # Search from most recent to oldest
-            recent_lines = aria2_log_buffer[-200:] if len(aria2_log_buffer) > 200 else aria2_log_buffer
-            
-            for log_line in reversed(recent_lines):
-                result = parse_aria2_progress(log_line)
-                if result:
-                    if allowed_gids and result.get('gid') not in allowed_gids:
-                        continue
-                    return result
-        return None
-    
     def sum_directory_size(directory: Path) -> int:
         """Recursively sum all file sizes in directory, return 0 if any error"""
         try:
@@ -919,14 +789,9 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
         return 0
     
     def try_extract_total_from_logs() -> int:
-        """Try to extract total size from recent log lines"""
-        try:
-            progress = get_latest_progress_from_logs()
-            if progress and progress.get('total', 0) > 0:
-                return progress['total']
-        except Exception:
-            pass
-        return 0
+        """Total size from the latest progress line (any GID)"""
+        progress = output.progress()
+        return progress['total'] if progress and progress.get('total', 0) > 0 else 0
     
     def estimate_total_size(current: int) -> int:
         """Estimate total size based on current size"""
@@ -940,56 +805,45 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
     # ==================== MAIN LOOP ====================
 
     try:
-        while proc.poll() is None:
+        while proc.running:
             # -------------------- STOP / PAUSE --------------------
             if stop_event and stop_event.is_set():
                 try:
-                    proc.terminate()  # Graceful shutdown
-                    try:
-                        proc.wait(timeout=10)
-                    except subprocess.TimeoutExpired:
-                        proc.kill()
+                    await proc.stop(grace=10)  # Graceful shutdown
                 except Exception as e:
                     print(f"Error sending pause signal: {e}")
                 break
 
             # -------------------- REAL GID DETECTION --------------------
             if metadata_gid is None:
-                with log_lock:
-                    recent_lines = aria2_log_buffer[-200:]
-                for log_line in recent_lines:
-                    found_gid = extract_gid_from_log_line(log_line)
-                    if found_gid:
-                        metadata_gid = found_gid
-                        print(f"Established metadata GID from logs: {metadata_gid}")
-                        break
+                found_gid = output.first_gid()
+                if found_gid:
+                    metadata_gid = found_gid
+                    print(f"Established metadata GID from logs: {metadata_gid}")
 
             if not real_gid_detected and metadata_gid:
-                with log_lock:
-                    recent_lines = aria2_log_buffer[-200:]
-                for log_line in recent_lines:
-                    found_gid = extract_gid_from_log_line(log_line)
-                    if found_gid and found_gid != metadata_gid:
-                        real_gid = found_gid
-                        real_gid_detected = True
-                        print(f"DETECTED REAL GID: {real_gid} (metadata was: {metadata_gid})")
-                        # CRITICAL: Reset speed calculation when GID changes
-                        last_reported_size = 0
-                        last_report_time = time.time()
-                        print(f"   Speed calculation reset for new GID")
-                        if update_session_with_real_gid(real_gid):
-                            print(f" Session saved with REAL GID: {real_gid}")
-                            if job_manager and job_id:
-                                try:
-                                    print(f"   Next resume will use this REAL GID: {real_gid}")
-                                except Exception:
-                                    pass
-                        break
+                found_gid = output.first_gid(exclude=metadata_gid)
+                if found_gid:
+                    real_gid = found_gid
+                    real_gid_detected = True
+                    print(f"DETECTED REAL GID: {real_gid} (metadata was: {metadata_gid})")
+                    # CRITICAL: Reset speed calculation when GID changes
+                    last_reported_size = 0
+                    last_report_time = time.time()
+                    print(f"   Speed calculation reset for new GID")
+                    torrent_cache.capture(dest.parent, infohash)
+                    if update_session_with_real_gid(real_gid):
+                        print(f" Session saved with REAL GID: {real_gid}")
+                        if job_manager and job_id:
+                            try:
+                                print(f"   Next resume will use this REAL GID: {real_gid}")
+                            except Exception:
+                                pass
 
             # -------------------- PROGRESS / SIZE --------------------
             # PRIORITY GID: Use real_gid if detected, otherwise fallback to metadata_gid
             active_gids = [real_gid] if real_gid_detected else ([metadata_gid] if metadata_gid else None)
-            progress_data = get_latest_progress_from_logs(allowed_gids=active_gids)
+            progress_data = output.progress(allowed_gids=active_gids)
             current_size_bytes = 0
 
             if progress_data:
@@ -998,7 +852,7 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
                     session_loaded_indicator = True
                     print(f" Session loaded! aria2 is continuing download ({current_size_bytes} bytes detected)")
                 if not final_download_path:
-                    actual_path = extract_download_path_from_logs()
+                    actual_path = output.download_path()
                     if actual_path:
                         final_download_path = actual_path
                         print(f"DEBUG: final_download_path set from logs: {final_download_path}")
@@ -1008,7 +862,7 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
                     # CRITICAL FIX: If we already have a path (e.g. from filesystem scan), 
                     # but logs provide a BETTER one (e.g. [NOTICE] Root Folder), prefer the logs.
                     # This fixes the resume bug where it locks onto a single RAR file instead of the folder.
-                    newer_path = extract_download_path_from_logs()
+                    newer_path = output.download_path()
                     if newer_path and str(newer_path) != str(final_download_path):
                         # If the log path is a parent of the scan path, definitely take it (it's the root)
                         try:
@@ -1204,10 +1058,24 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
                 proc.kill()
                 raise RuntimeError("Download exceeded 2 hours with no progress")
 
-            await asyncio.sleep(0.1)
+            await wait_for_activity()
 
     finally:
         # -------------------- FINALIZATION --------------------
+        try:
+            await proc.wait(10)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+        exit_task.cancel()
+        try:
+            await asyncio.wait_for(reader_task, 2)  # resto da saída já emitida
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            reader_task.cancel()
+
+        # Antes da limpeza de resíduos (que apaga o <infohash>.torrent do destino)
+        torrent_cache.capture(dest.parent, infohash)
+
         paused = stop_event and stop_event.is_set()
         job_paused = job_id and job_manager and job_manager.is_job_paused(job_id)
         canceled = job_id and job_manager and job_manager.is_job_canceled(job_id)
@@ -1250,48 +1118,18 @@ async def download_magnet_cli(magnet_url: str, dest_path: str, progress_cb: Opti
             except Exception as e:
                 print(f"Could not remove aria2 control files: {e}")
                 
-            try:
-                # Standard residual cleanup using the actual detected path
-                actual_root = final_download_path or detected_candidate or dest
-                parent_dir = actual_root.parent
-                base_name = actual_root.name.lower()
-                
-                # Clean specific patterns linked to this download
-                for pattern in ['.aria2', '.aria2c', '.torrent']:
-                    # 1. Direct match (Path + pattern)
-                    target = Path(str(actual_root) + pattern)
-                    if target.exists():
-                        target.unlink()
-                        print(f"   [OK] Removed direct residual: {target.name}")
-                    
-                    # 2. Aggressive substring match in parent dir (Online-Fix fix)
-                    # Search for any file.aria2 that contains the download's base name
-                    if parent_dir.exists():
-                        for item in parent_dir.iterdir():
-                            if item.is_file() and item.name.lower().endswith(pattern):
-                                # If filename matches or is contained within our root name (e.g. hytale.aria2 vs Hytale folder)
-                                if base_name in item.name.lower() or item.name.lower().replace(pattern, '') in base_name:
-                                    try:
-                                        item.unlink()
-                                        print(f"   [OK] Removed orphan residual via name matching: {item.name}")
-                                    except: pass
-            except Exception as cleanup_err:
-                print(f"Error during aggressive cleanup: {cleanup_err}")
-
-        try:
-            proc.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            proc.wait()
+            # Standard residual cleanup using the actual detected path
+            cleanup_aria2_residuals(Path(final_download_path or detected_candidate or dest))
 
-        with log_lock:
-            if aria2_log_buffer:
-                print(f"aria2 produced {len(aria2_log_buffer)} log lines")
+        if output.lines:
+            print(f"aria2 produced {output.lines} log lines")
 
     paused = stop_event and stop_event.is_set()
     if proc.returncode not in (0, None) and not paused:
         error_msg = f"aria2 exit code: {proc.returncode}"
         print(f"aria2 failed: {error_msg}")
+        for line in output.recent(20):
+            print(f"   [aria2-tail] {line}")
         raise RuntimeError(error_msg)
 
     # -------------------- RETURN FINAL PATH --------------------
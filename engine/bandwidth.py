@@ -0,0 +1,279 @@
+import time
+import asyncio
+from typing import Optional, Dict, Callable
+
+
+# ============================================================
+# AGENDADOR DE BANDA ENTRE JOBS (TOKEN BUCKET + FAIR SHARE)
+# ============================================================
+
+class JobBandwidth:
+    """
+    Token bucket de um job. Todos os caminhos de download do job (workers do
+    UltraMax, serial) chamam `consume(n)` depois de receber n bytes; quando o job
+    tem taxa definida, o consumo abaixo de zero vira espera, e a leitura atrasada
+    segura o TCP do outro lado.
+
+    Jobs que não passam bytes por aqui (aria2) recebem a taxa por `on_rate`,
+    chamado a cada mudança.
+    """
+
+    BURST_SECONDS = 0.5
+    MIN_BURST = 64 * 1024
+
+    def __init__(self, scheduler: "BandwidthScheduler", job_id: int, limit: Optional[int], weight: float):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.limit = limit if limit and limit > 0 else None
+        self.weight = max(0.01, float(weight or 1.0))
+        self.rate: Optional[float] = None  # taxa efetiva atribuída pelo agendador (None = ilimitado)
+        self.metered = False  # passa bytes por consume (aria2 limita sozinho e não entra na medição)
+        self.on_rate: Optional[Callable[[Optional[float]], None]] = None
+        # Medição por janela do agendador: vazão real, se esperou no bucket e teto de demanda
+        self.measured: Optional[float] = None
+        self.saturated = False
+        self.demand_cap: Optional[float] = None
+        self._window_bytes = 0
+        self._held = False
+        self._tokens = 0.0
+        self._last = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.rate is not None
+
+    def _refill(self, now: float):
+        if self.rate is None:
+            return
+        burst = max(self.MIN_BURST, self.rate * self.BURST_SECONDS)
+        self._tokens = min(burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def consume(self, nbytes: int):
+        """Debita n bytes do bucket; dorme o tempo necessário para respeitar a taxa."""
+        if nbytes <= 0:
+            return
+        if not self.metered:
+            self.metered = True
+            self.scheduler._rebalance()
+        self._window_bytes += nbytes
+        self.scheduler._account(nbytes)
+        rate = self.rate
+        if rate is None:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= nbytes
+        if self._tokens < 0:
+            # Dívida paga com espera: vários workers do mesmo job entram na fila naturalmente
+            self._held = True
+            await asyncio.sleep(-self._tokens / rate)
+
+    def _set_rate(self, rate: Optional[float]):
+        now = time.monotonic()
+        self._refill(now)
+        self._last = now
+        changed = rate != self.rate
+        self.rate = rate
+        if rate is not None:
+            self._tokens = min(self._tokens, max(self.MIN_BURST, rate * self.BURST_SECONDS))
+        if changed and self.on_rate:
+            try:
+                self.on_rate(rate)
+            except Exception as e:
+                print(f"[BANDA] Falha ao repassar taxa do job #{self.job_id}: {e}")
+
+    def _sample(self, dt: float, headroom: float, demand_ratio: float):
+        """Fecha a janela de medição e atualiza o teto de demanda (water-filling por demanda)."""
+        self.measured = self._window_bytes / dt
+        self.saturated = self._held
+        self._window_bytes = 0
+        self._held = False
+        if self.saturated:
+            # Esperou no bucket: quer mais do que recebe, volta a concorrer pela fatia inteira
+            self.demand_cap = None
+        elif self.rate is not None and self.measured < self.rate * demand_ratio:
+            # Bem abaixo da fatia sem nunca esperar: o limite é o servidor, a sobra vai para os outros
+            self.demand_cap = max(self.MIN_BURST, self.measured * headroom)
+        elif self.demand_cap is not None:
+            self.demand_cap = max(self.demand_cap, self.measured * headroom)
+
+
+class BandwidthScheduler:
+    """
+    Distribui a banda entre os jobs ativos.
+
+    - `global_limit`: teto total (bytes/s, None = sem teto).
+    - `limit` por job: teto individual (Job.limit_bandwidth).
+    - `weight` por job: divisão proporcional do teto global (water-filling: a
+      banda que um job com teto baixo não usa é redistribuída aos outros).
+    - Demanda: job medido que fica bem abaixo da própria fatia sem esperar no
+      bucket (limitado pelo servidor) passa a ter teto de demanda (vazão × folga),
+      e a sobra vai para os outros no water-filling.
+    - Sem teto global, a vazão agregada medida em `consume` estima a capacidade
+      do link (pico; só decai quando nenhum job está preso no bucket). Com jobs
+      medidos de pesos diferentes e disputa real (link cheio ou job preso no
+      bucket), essa estimativa × PROBE_HEADROOM faz o papel do teto global. Sem
+      disputa não há teto nenhum.
+    Sem teto (global, estimado ou do job), o job fica ilimitado e `consume` só conta bytes.
+    """
+
+    SAMPLE_INTERVAL = 1.0
+    CAPACITY_DECAY = 0.99  # por amostra, quando a vazão medida fica abaixo da estimativa
+    PROBE_HEADROOM = 1.2
+    DEMAND_RATIO = 0.5  # abaixo disso da própria taxa, sem esperar no bucket, o job é limitado pela demanda
+    CONTENTION_RATIO = 0.85  # vazão agregada acima disso da capacidade = link cheio
+
+    def __init__(self, global_limit: Optional[int] = None):
+        self.global_limit = global_limit if global_limit and global_limit > 0 else None
+        self._jobs: Dict[int, JobBandwidth] = {}
+        self.estimated_capacity: Optional[float] = None  # bytes/s
+        self._contended = False
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+
+    # ---------------------- registro de jobs ----------------------
+
+    def register(self, job_id: int, limit: Optional[int] = None, weight: float = 1.0) -> JobBandwidth:
+        handle = self._jobs.get(job_id)
+        if handle is None:
+            handle = JobBandwidth(self, job_id, limit, weight)
+            self._jobs[job_id] = handle
+        else:
+            handle.limit = limit if limit and limit > 0 else None
+            handle.weight = max(0.01, float(weight or 1.0))
+        self._rebalance()
+        return handle
+
+    def unregister(self, job_id: int):
+        if self._jobs.pop(job_id, None) is not None:
+            self._rebalance()
+
+    def get(self, job_id: int) -> Optional[JobBandwidth]:
+        return self._jobs.get(job_id)
+
+    # ---------------------- ajustes em tempo real ----------------------
+
+    def set_global_limit(self, limit: Optional[int]):
+        self.global_limit = limit if limit and limit > 0 else None
+        self._rebalance()
+
+    def set_job_limit(self, job_id: int, limit: Optional[int]):
+        handle = self._jobs.get(job_id)
+        if handle:
+            handle.limit = limit if limit and limit > 0 else None
+            self._rebalance()
+
+    def set_job_weight(self, job_id: int, weight: float):
+        handle = self._jobs.get(job_id)
+        if handle:
+            handle.weight = max(0.01, float(weight or 1.0))
+            self._rebalance()
+
+    def rate_for(self, job_id: int) -> Optional[int]:
+        handle = self._jobs.get(job_id)
+        return int(handle.rate) if handle and handle.rate is not None else None
+
+    # ---------------------- capacidade estimada ----------------------
+
+    def _account(self, nbytes: int):
+        self._window_bytes += nbytes
+        now = time.monotonic()
+        dt = now - self._window_start
+        if dt < self.SAMPLE_INTERVAL:
+            return
+        rate = self._window_bytes / dt
+        self._window_bytes = 0
+        self._window_start = now
+        metered = [h for h in self._jobs.values() if h.metered]
+        for h in metered:
+            h._sample(dt, self.PROBE_HEADROOM, self.DEMAND_RATIO)
+        held = any(h.saturated for h in metered)
+        cap = self.estimated_capacity
+        if cap is None or rate > cap:
+            self.estimated_capacity = rate
+        elif not held:
+            # Job preso no bucket segura a vazão abaixo do link: aí a queda não é do link
+            self.estimated_capacity = max(rate, cap * self.CAPACITY_DECAY)
+        self._contended = held or rate >= self.estimated_capacity * self.CONTENTION_RATIO
+        if metered and (self.global_limit is not None or self._weighted() or any(h.rate is not None for h in metered)):
+            self._rebalance()
+
+    def _weighted(self) -> bool:
+        """Pesos só mudam algo sem teto global se há 2+ jobs medidos com pesos diferentes."""
+        if self.global_limit is not None:
+            return False
+        metered = [h for h in self._jobs.values() if h.metered]
+        return len(metered) > 1 and len({h.weight for h in metered}) > 1
+
+    @property
+    def weighting(self) -> str:
+        if self.global_limit is not None:
+            return "global_limit"
+        if self._weighted() and self.estimated_capacity and self._contended:
+            return "estimated"
+        return "off"
+
+    def _rebalance(self):
+        jobs = list(self._jobs.values())
+        if not jobs:
+            return
+        limit = self.global_limit
+        if limit is None and self.weighting == "estimated":
+            # Sem teto global: pesos dividem a capacidade estimada (com folga) entre os jobs medidos
+            limit = self.estimated_capacity * self.PROBE_HEADROOM
+            for h in jobs:
+                if not h.metered:
+                    h._set_rate(float(h.limit) if h.limit else None)
+            jobs = [h for h in jobs if h.metered]
+        if limit is None:
+            for h in jobs:
+                h._set_rate(float(h.limit) if h.limit else None)
+            return
+
+        # Water-filling: jobs cujo teto (próprio ou de demanda) é menor que a fatia justa
+        # ficam no teto; o que sobra é redividido entre os demais pelo peso.
+        remaining = float(limit)
+        pending = jobs[:]
+        rates: Dict[int, float] = {}
+        while pending:
+            total_weight = sum(h.weight for h in pending)
+            ceilings = {h.job_id: min(c for c in (h.limit, h.demand_cap) if c) for h in pending if h.limit or h.demand_cap}
+            capped = [h for h in pending if h.job_id in ceilings and ceilings[h.job_id] < remaining * h.weight / total_weight]
+            if not capped:
+                for h in pending:
+                    rates[h.job_id] = remaining * h.weight / total_weight
+                break
+            for h in capped:
+                rates[h.job_id] = float(ceilings[h.job_id])
+                remaining -= ceilings[h.job_id]
+                pending.remove(h)
+        for h in jobs:
+            h._set_rate(max(1024.0, rates.get(h.job_id, 0.0)))
+
+    def snapshot(self) -> dict:
+        return {
+            "global_limit": self.global_limit,
+            "estimated_capacity": int(self.estimated_capacity) if self.estimated_capacity else None,
+            # global_limit: pesos dividem o teto global; estimated: dividem a capacidade medida
+            # (link disputado); off: sem teto (um job só, pesos iguais ou link com folga)
+            "weighting": self.weighting,
+            "jobs": {
+                jid: {"limit": h.limit, "weight": h.weight, "rate": (int(h.rate) if h.rate is not None else None),
+                      "metered": h.metered,
+                      "measured": (int(h.measured) if h.measured is not None else None),
+                      "demand_cap": (int(h.demand_cap) if h.demand_cap is not None else None)}
+                for jid, h in self._jobs.items()
+            },
+        }
+
+
+def _initial_global_limit() -> Optional[int]:
+    try:
+        from backend import config as backend_config
+        return getattr(backend_config, "GLOBAL_BANDWIDTH_LIMIT", None)
+    except Exception:
+        return None
+
+
+bandwidth_scheduler = BandwidthScheduler(_initial_global_limit())
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import asyncio
+import unicodedata
+from typing import Optional, Callable, List
+
+from .download import download_serial, log
+from .bandwidth import JobBandwidth
+from .checksums import StreamingChecksum, ChecksumMismatch
+
+
+# ============================================================
+# LOTE DE ARQUIVOS PEQUENOS (UM JOB, VÁRIAS URLs)
+# ============================================================
+
+BATCH_URL_PREFIX = "batch:"
+DEFAULT_BATCH_CONCURRENCY = 8
+FILE_RETRIES = 3
+
+
+def _safe_name(name: str) -> str:
+    name = unicodedata.normalize('NFKC', str(name or ""))
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', name)
+    name = re.sub(r'\s+', ' ', name).strip().rstrip('. ')
+    return name[:200]
+
+
+def plan_batch_files(files: List[dict]) -> List[dict]:
+    """Normaliza a lista do lote: nome de arquivo seguro e único, tamanho inteiro ou None."""
+    planned = []
+    used = set()
+    for i, f in enumerate(files):
+        url = (f.get("url") or "").strip()
+        if not url:
+            continue
+        name = _safe_name(f.get("name") or os.path.basename(url.split("?")[0])) or f"file_{i}"
+        base, ext = os.path.splitext(name)
+        counter = 1
+        while name.lower() in used:
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+        used.add(name.lower())
+        size = f.get("size")
+        planned.append({
+            "url": url,
+            "name": name,
+            "size": int(size) if isinstance(size, (int, float)) and size > 0 else None,
+            "checksums": f.get("checksums") or None,
+        })
+    return planned
+
+
+class _FileState:
+    __slots__ = ("index", "name", "path", "url", "size", "downloaded", "status", "error", "dirty")
+
+    def __init__(self, index: int, spec: dict, dest_dir: str):
+        self.index = index
+        self.name = spec["name"]
+        self.url = spec["url"]
+        self.path = os.path.join(dest_dir, spec["name"])
+        self.size = spec.get("size")
+        self.downloaded = 0
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.dirty = True
+
+
+async def download_batch(
+    files: List[dict],
+    dest_dir: str,
+    progress_cb: Optional[Callable] = None,
+    on_file_progress: Optional[Callable] = None,
+    stop_event: Optional[asyncio.Event] = None,
+    verify: bool = True,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    bandwidth: Optional[JobBandwidth] = None,
+    checksum_algorithms: Optional[List[str]] = None
+) -> Optional[str]:
+    """
+    Baixa muitos arquivos pequenos com concorrência limitada, todos pelos clientes
+    do pool por host (keep-alive compartilhado: sem handshake por arquivo).
+
+    Progresso:
+    - `progress_cb(downloaded, total)`: agregado do lote.
+    - `on_file_progress(index, downloaded, size, status)`: por arquivo (só os que mudaram).
+
+    Arquivos que já existem com o tamanho esperado são pulados (resume do lote).
+    Retorna `dest_dir` quando tudo terminou; None se foi interrompido.
+    """
+    specs = plan_batch_files(files)
+    os.makedirs(dest_dir, exist_ok=True)
+    states = [_FileState(i, spec, dest_dir) for i, spec in enumerate(specs)]
+    log(f"[LOTE] {len(states)} arquivos -> {dest_dir} (concorrência {concurrency})")
+
+    for st in states:
+        if os.path.isfile(st.path) and (st.size is None or os.path.getsize(st.path) == st.size):
+            st.size = os.path.getsize(st.path)
+            st.downloaded = st.size
+            st.status = "completed"
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    start = time.time()
+
+    async def fetch(st: _FileState, spec: dict):
+        if st.status == "completed":
+            return
+        async with sem:
+            for attempt in range(FILE_RETRIES):
+                if stop_event and stop_event.is_set():
+                    return
+                st.status = "running"
+                st.dirty = True
+
+                async def file_cb(downloaded, total, *args, **kwargs):
+                    st.downloaded = downloaded
+                    if total:
+                        st.size = total
+                    st.dirty = True
+
+                checksum = None
+                if spec.get("checksums") or checksum_algorithms:
+                    checksum = StreamingChecksum(checksum_algorithms, expected=spec.get("checksums"))
+                try:
+                    result = await download_serial(st.url, st.path, progress_cb=file_cb, resume=True, verify=verify,
+                                                   checksum=checksum, bandwidth=bandwidth, stop_event=stop_event)
+                    if result:
+                        st.size = os.path.getsize(st.path)
+                except Exception as e:
+                    # Erro de um arquivo (checksum, disco, rename) falha só ele: os irmãos seguem
+                    # e o lote termina com o estado real de cada arquivo
+                    st.status, st.error = "failed", str(e) if isinstance(e, ChecksumMismatch) else f"{type(e).__name__}: {e}"
+                    st.dirty = True
+                    log(f"[LOTE] {st.name} falhou: {st.error}")
+                    return
+                if result:
+                    st.downloaded = st.size
+                    st.status = "completed"
+                    st.dirty = True
+                    return
+                if stop_event and stop_event.is_set():
+                    st.status = "paused"
+                    st.dirty = True
+                    return
+                await asyncio.sleep(min(2 ** attempt, 5))
+            st.status, st.error = "failed", f"falhou após {FILE_RETRIES} tentativas"
+            st.dirty = True
+
+    async def report():
+        done_bytes = sum(st.downloaded for st in states)
+        total = sum(st.size or 0 for st in states)
+        if progress_cb and total:
+            try:
+                await progress_cb(done_bytes, total)
+            except Exception as e:
+                log(f"[WARN] Falha ao reportar progresso do lote: {e}")
+        if on_file_progress:
+            for st in states:
+                if st.dirty:
+                    st.dirty = False
+                    try:
+                        await on_file_progress(st.index, st.downloaded, st.size, st.status)
+                    except Exception as e:
+                        log(f"[WARN] Falha ao reportar arquivo {st.name}: {e}")
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(1.0)
+            await report()
+            done = sum(1 for st in states if st.status == "completed")
+            log(f"[LOTE] {done}/{len(states)} arquivos concluídos")
+
+    await report()
+    reporter_task = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(fetch(st, spec) for st, spec in zip(states, specs)))
+    finally:
+        reporter_task.cancel()
+        try:
+            await reporter_task
+        except asyncio.CancelledError:
+            pass
+        await report()
+
+    if stop_event and stop_event.is_set():
+        log(f"[LOTE] Interrompido: arquivos concluídos ficam para o resume")
+        return None
+
+    failed = [st for st in states if st.status != "completed"]
+    if failed:
+        names = ", ".join(f"{st.name} ({st.error})" for st in failed[:5])
+        raise Exception(f"{len(failed)} de {len(states)} arquivo(s) do lote falharam: {names}")
+
+    elapsed = time.time() - start
+    total = sum(st.size or 0 for st in states)
+    log(f"[CONCLUÍDO] Lote: {len(states)} arquivos, {total/1024/1024:.2f} MB em {elapsed:.1f}s")
+    return dest_dir
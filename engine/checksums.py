@@ -0,0 +1,229 @@
+import zlib
+import hashlib
+import threading
+from typing import Optional, Dict, List, Iterable
+
+
+# ============================================================
+# CHECKSUMS EM STREAMING (HASH DURANTE O DOWNLOAD)
+# ============================================================
+
+SUPPORTED_ALGORITHMS = ("md5", "sha1", "sha256", "crc32")
+
+# Nomes que aparecem nos JSONs de fontes -> nome interno
+_ALIASES = {
+    "md5": "md5", "md5sum": "md5",
+    "sha1": "sha1", "sha-1": "sha1", "sha1sum": "sha1",
+    "sha256": "sha256", "sha-256": "sha256", "sha256sum": "sha256",
+    "crc32": "crc32", "crc": "crc32",
+}
+
+# Tamanho hexadecimal de cada digest (para adivinhar campos genéricos como "hash")
+_HEX_LEN = {32: "md5", 40: "sha1", 64: "sha256", 8: "crc32"}
+
+
+class ChecksumMismatch(Exception):
+    """Digest calculado não bate com o informado pela fonte."""
+
+    def __init__(self, algorithm: str, expected: str, actual: str):
+        super().__init__(f"Checksum {algorithm.upper()} não confere: esperado {expected}, obtido {actual}")
+        self.algorithm = algorithm
+        self.expected = expected
+        self.actual = actual
+
+
+def _clean_hex(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    v = value.strip().lower()
+    if ":" in v:
+        # Formatos "sha256:abcd..."
+        v = v.split(":", 1)[1].strip()
+    if v and all(c in "0123456789abcdef" for c in v):
+        return v
+    return None
+
+
+def extract_checksums(raw: dict) -> Dict[str, str]:
+    """Lê digests de um item do JSON da fonte (md5/sha1/sha256/crc32, "hashes": {...} ou "hash"/"checksum")."""
+    found: Dict[str, str] = {}
+    if not isinstance(raw, dict):
+        return found
+
+    candidates = dict(raw)
+    for key in ("hashes", "checksums", "digests"):
+        if isinstance(raw.get(key), dict):
+            candidates.update(raw[key])
+
+    for key, value in candidates.items():
+        algo = _ALIASES.get(str(key).lower())
+        hexval = _clean_hex(value) if algo else None
+        if algo and hexval:
+            found[algo] = hexval
+
+    for key in ("hash", "checksum", "digest"):
+        value = raw.get(key)
+        if isinstance(value, str):
+            prefix = value.split(":", 1)[0].strip().lower() if ":" in value else None
+            hexval = _clean_hex(value)
+            algo = _ALIASES.get(prefix) if prefix else _HEX_LEN.get(len(hexval or ""))
+            if algo and hexval and algo not in found:
+                found[algo] = hexval
+    return found
+
+
+def normalize_checksums(expected: Optional[Dict[str, str]]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for key, value in (expected or {}).items():
+        algo = _ALIASES.get(str(key).lower())
+        hexval = _clean_hex(value)
+        if algo and hexval:
+            out[algo] = hexval
+    return out
+
+
+class _Crc32:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value & 0xFFFFFFFF:08x}"
+
+
+def _new_hasher(algo: str):
+    if algo == "crc32":
+        return _Crc32()
+    return hashlib.new(algo)
+
+
+class StreamingChecksum:
+    """
+    Calcula digests enquanto os bytes ainda estão na memória.
+
+    Hashes como MD5/SHA precisam dos bytes em ordem. Os blocos chegam fora de
+    ordem no UltraMax, então cada bloco é estacionado por offset até que o
+    cursor do hash chegue nele. O estacionamento tem teto fixo e pequeno
+    (`max_parked`; a memória dele se soma ao `max_pending` do writer): o que
+    passar disso é descartado e relido do arquivo depois (`catch_up`), de
+    preferência enquanto o download ainda está rodando, quando o trecho ainda
+    está no cache de páginas do sistema.
+
+    `feed` é chamado das threads de escrita; o estado é protegido por um lock
+    (a releitura do arquivo acontece fora dele).
+    """
+
+    READ_CHUNK = 8 * 1024 * 1024
+
+    def __init__(self, algorithms: Optional[Iterable[str]] = None, expected: Optional[Dict[str, str]] = None,
+                 max_parked: int = 64 * 1024 * 1024):
+        self.expected = normalize_checksums(expected)
+        algos: List[str] = []
+        for a in list(algorithms or []) + list(self.expected.keys()):
+            a = _ALIASES.get(str(a).lower())
+            if a and a not in algos:
+                algos.append(a)
+        self.algorithms = algos or ["sha256"]
+        self._hashers = {a: _new_hasher(a) for a in self.algorithms}
+        self.max_parked = max_parked
+        self.cursor = 0
+        self._parked: Dict[int, bytes] = {}
+        self._parked_bytes = 0
+        self._lock = threading.Lock()
+        self.digests: Optional[Dict[str, str]] = None
+
+    def reset(self):
+        """Recomeça do zero (download reiniciado)."""
+        with self._lock:
+            self._hashers = {a: _new_hasher(a) for a in self.algorithms}
+            self.cursor = 0
+            self._parked.clear()
+            self._parked_bytes = 0
+            self.digests = None
+
+    # ---------------------- entrada de dados ----------------------
+
+    def _update(self, data):
+        for h in self._hashers.values():
+            h.update(data)
+        self.cursor += len(data)
+
+    def _drain_parked(self):
+        while self._parked:
+            data = self._parked.pop(self.cursor, None)
+            if data is None:
+                # Bloco estacionado pode começar antes do cursor (sobreposição após retry)
+                overlap = next((o for o in self._parked if o < self.cursor < o + len(self._parked[o])), None)
+                if overlap is None:
+                    break
+                data = self._parked.pop(overlap)
+                self._parked_bytes -= len(data)
+                self._update(memoryview(data)[self.cursor - overlap:])
+                continue
+            self._parked_bytes -= len(data)
+            self._update(data)
+
+    def feed(self, offset: int, data):
+        """Entrega o bloco [offset, offset+len) ao hash (em ordem ou estacionado)."""
+        n = len(data)
+        if n == 0:
+            return
+        with self._lock:
+            end = offset + n
+            if end <= self.cursor:
+                return
+            if offset <= self.cursor:
+                self._update(memoryview(data)[self.cursor - offset:])
+                self._drain_parked()
+                return
+            if offset in self._parked or self._parked_bytes + n > self.max_parked:
+                return  # será relido do arquivo por catch_up
+            self._parked[offset] = bytes(data)
+            self._parked_bytes += n
+
+    def catch_up(self, path: str, upto: int):
+        """Lê do arquivo o trecho [cursor, upto) que não chegou pela memória (roda em thread)."""
+        if upto <= self.cursor:
+            return
+        with open(path, "rb") as f:
+            while True:
+                with self._lock:
+                    self._drain_parked()
+                    if self.cursor >= upto:
+                        return
+                    pos = self.cursor
+                    nxt = min([o for o in self._parked if o > pos] or [upto])
+                    length = min(self.READ_CHUNK, nxt - pos, upto - pos)
+                # Leitura fora do lock: as threads de escrita continuam chamando feed
+                f.seek(pos)
+                data = f.read(length)
+                if not data:
+                    return
+                with self._lock:
+                    # Só aplica se ninguém avançou o cursor enquanto o trecho era lido
+                    if self.cursor == pos:
+                        self._update(data)
+
+    # ---------------------- resultado ----------------------
+
+    def finish(self, path: str, size: int) -> Dict[str, str]:
+        """Completa o hash com o que faltar no arquivo e retorna {algoritmo: hex}."""
+        self.catch_up(path, size)
+        with self._lock:
+            self._parked.clear()
+            self._parked_bytes = 0
+            self.digests = {a: h.hexdigest() for a, h in self._hashers.items()}
+        return self.digests
+
+    def verify(self):
+        """Levanta ChecksumMismatch se algum digest esperado não conferir."""
+        if self.digests is None:
+            return
+        for algo, expected in self.expected.items():
+            actual = self.digests.get(algo)
+            if actual and actual != expected:
+                raise ChecksumMismatch(algo, expected, actual)
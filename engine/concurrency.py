@@ -0,0 +1,176 @@
+import time
+import asyncio
+from typing import Optional, Dict, Callable
+
+from .writer import write_latency
+from .bandwidth import bandwidth_scheduler
+
+
+# ============================================================
+# CONCORRÊNCIA DE JOBS AUTO-AJUSTÁVEL
+# ============================================================
+
+class ConcurrencyTuner:
+    """
+    Decide quantos jobs rodam ao mesmo tempo, olhando a vazão agregada e a
+    latência de escrita em disco (subida de encosta, como o AIMD por host do
+    ConnectionController, mas no nível dos jobs):
+
+    - Há fila, todos os slots ocupados e nada indica gargalo: abre mais um slot
+      e anota a vazão de antes.
+    - Depois de SETTLE_TICKS amostras, se a vazão não subiu pelo menos GAIN_THRESHOLD,
+      os jobs estão disputando o mesmo gargalo (link ou disco): o slot é retirado e
+      novas tentativas esperam COOLDOWN segundos.
+    - Latência de escrita muito acima da referência também retira um slot.
+
+    Retirar um slot não interrompe ninguém: o próximo job só sai da fila quando
+    sobrar vaga. Com `override` a concorrência fica fixa (ajuste manual).
+    """
+
+    INTERVAL = 5.0
+    SETTLE_TICKS = 3
+    GAIN_THRESHOLD = 0.10
+    COOLDOWN = 120.0
+    DISK_LATENCY_FACTOR = 2.5
+    DISK_LATENCY_FLOOR_MS = 20.0  # ms/MB: abaixo disso o disco não é considerado gargalo
+    MIN_THROUGHPUT = 256 * 1024  # abaixo disso não dá para julgar ganho (jobs parados/iniciando)
+    HARD_MAX_SLOTS = 32  # teto absoluto (manual ou limites): cada slot é um worker asyncio
+
+    def __init__(self, min_slots: int = 1, max_slots: int = 4, override: Optional[int] = None, auto: bool = True):
+        self.min_slots = min(max(1, min_slots), self.HARD_MAX_SLOTS)
+        self.max_slots = min(max(self.min_slots, max_slots), self.HARD_MAX_SLOTS)
+        self.override = min(override, self.HARD_MAX_SLOTS) if override else None
+        self.auto = auto
+        self.slots = self.min_slots
+        self.throughput = 0.0  # bytes/s agregado (EWMA)
+        self.disk_baseline: Optional[float] = None
+        self.last_decision: Optional[str] = None
+        self._trial_from: Optional[float] = None  # vazão antes do slot em teste
+        self._trial_ticks = 0
+        self._cooldown_until = 0.0
+        self._last_bytes: Dict[int, int] = {}
+        self._finished: Dict[int, int] = {}  # job encerrado desde a última amostra -> bytes finais
+
+    # ---------------------- configuração ----------------------
+
+    def target(self) -> int:
+        if self.override:
+            return self.override
+        return self.slots if self.auto else self.min_slots
+
+    def set_bounds(self, min_slots: Optional[int] = None, max_slots: Optional[int] = None):
+        if min_slots is not None:
+            self.min_slots = max(1, int(min_slots))
+        if max_slots is not None:
+            self.max_slots = max(1, int(max_slots))
+        self.min_slots = min(self.min_slots, self.HARD_MAX_SLOTS)
+        self.max_slots = min(max(self.min_slots, self.max_slots), self.HARD_MAX_SLOTS)
+        self.slots = min(max(self.slots, self.min_slots), self.max_slots)
+
+    def set_override(self, value: Optional[int]):
+        self.override = min(max(1, int(value)), self.HARD_MAX_SLOTS) if value else None
+        self._trial_from = None
+
+    # ---------------------- amostragem ----------------------
+
+    def job_finished(self, job_id: int, downloaded: int):
+        """Job saiu (entrada de progresso apagada): guarda os bytes finais para a próxima amostra."""
+        self._finished[job_id] = downloaded
+
+    def _aggregate_rate(self, progress: Dict[int, dict], running, dt: float) -> float:
+        delta = 0
+        seen = {}
+        finished, self._finished = self._finished, {}
+        for jid, downloaded in finished.items():
+            prev = self._last_bytes.get(jid)
+            if prev is not None and downloaded > prev:
+                delta += downloaded - prev
+        for jid in running:
+            if jid in finished:
+                continue
+            downloaded = (progress.get(jid) or {}).get("downloaded") or 0
+            seen[jid] = downloaded
+            prev = self._last_bytes.get(jid)
+            if prev is not None and downloaded > prev:
+                delta += downloaded - prev
+        self._last_bytes = seen
+        return delta / dt if dt > 0 else 0.0
+
+    def step(self, rate: float, running: int, queued: int, now: Optional[float] = None) -> Optional[str]:
+        """Uma amostra; retorna a decisão tomada ("add", "retire", "keep") ou None."""
+        now = time.time() if now is None else now
+        self.throughput = rate if self.throughput == 0 else 0.5 * rate + 0.5 * self.throughput
+        disk = write_latency.ms_per_mb
+        if disk is not None:
+            # Referência: menor latência vista, subindo devagar para acompanhar mudanças de disco
+            self.disk_baseline = disk if self.disk_baseline is None else min(disk, self.disk_baseline * 1.02)
+
+        if self.override or not self.auto:
+            return None
+
+        if self._trial_from is not None:
+            self._trial_ticks += 1
+            if self._trial_ticks < self.SETTLE_TICKS:
+                return None
+            before, self._trial_from = self._trial_from, None
+            if before < self.MIN_THROUGHPUT or self.throughput >= before * (1 + self.GAIN_THRESHOLD):
+                return self._decide("keep", f"vazão {before/1024/1024:.1f} -> {self.throughput/1024/1024:.1f} MB/s")
+            self.slots = max(self.min_slots, self.slots - 1)
+            self._cooldown_until = now + self.COOLDOWN
+            return self._decide("retire", f"slot extra não rendeu ({before/1024/1024:.1f} -> "
+                                          f"{self.throughput/1024/1024:.1f} MB/s): jobs disputando o mesmo gargalo")
+
+        if (disk is not None and self.disk_baseline and running >= self.slots > self.min_slots
+                and disk > max(self.DISK_LATENCY_FLOOR_MS, self.disk_baseline * self.DISK_LATENCY_FACTOR)):
+            self.slots -= 1
+            self._cooldown_until = now + self.COOLDOWN
+            return self._decide("retire", f"latência de escrita {disk:.0f} ms/MB (referência {self.disk_baseline:.0f})")
+
+        if queued <= 0 or running < self.slots or self.slots >= self.max_slots or now < self._cooldown_until:
+            return None
+        limit = bandwidth_scheduler.global_limit
+        if limit and self.throughput >= 0.9 * limit:
+            return None  # teto global já cheio: mais jobs só dividiriam a mesma banda
+        self._trial_from = self.throughput
+        self._trial_ticks = 0
+        self.slots += 1
+        return self._decide("add", f"fila com {queued} job(s) e capacidade sobrando "
+                                   f"({self.throughput/1024/1024:.1f} MB/s)")
+
+    def _decide(self, decision: str, reason: str) -> str:
+        self.last_decision = f"{decision}: {reason}"
+        print(f"[CONCORRÊNCIA] {self.slots} slot(s) - {self.last_decision}")
+        return decision
+
+    async def run(self, progress: Dict[int, dict], running: Callable[[], Dict[int, int]],
+                  queued: Callable[[], int], on_change: Callable):
+        """Loop de amostragem; `on_change()` é aguardado sempre que o alvo muda."""
+        last = time.time()
+        while True:
+            await asyncio.sleep(self.INTERVAL)
+            now = time.time()
+            jobs = running()
+            rate = self._aggregate_rate(progress, jobs, now - last)
+            last = now
+            before = self.target()
+            try:
+                self.step(rate, len(jobs), queued(), now)
+            except Exception as e:
+                print(f"[WARN] Ajuste de concorrência falhou: {e}")
+            if self.target() != before:
+                await on_change()
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": "manual" if self.override else ("auto" if self.auto else "fixed"),
+            "target": self.target(),
+            "slots": self.slots,
+            "min": self.min_slots,
+            "max": self.max_slots,
+            "override": self.override,
+            "throughput": int(self.throughput),
+            "disk_ms_per_mb": round(write_latency.ms_per_mb, 2) if write_latency.ms_per_mb is not None else None,
+            "disk_baseline_ms_per_mb": round(self.disk_baseline, 2) if self.disk_baseline is not None else None,
+            "trial_in_progress": self._trial_from is not None,
+            "last_decision": self.last_decision,
+        }
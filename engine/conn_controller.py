@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Optional, Dict
+from urllib.parse import urlparse
+
+
+# ============================================================
+# CONTROLE ADAPTATIVO DE CONEXÕES (AIMD) DO ULTRAMAX
+# ============================================================
+
+def _tuning_file() -> Path:
+    env_path = os.environ.get("HOST_TUNING_FILE")
+    if env_path:
+        return Path(env_path)
+    app_data_dir = os.environ.get("APP_DATA_DIR")
+    if app_data_dir:
+        return Path(app_data_dir) / "host_tuning.json"
+    return Path("host_tuning.json")
+
+
+class HostTuningStore:
+    """
+    Memória por host do número de conexões que funcionou no último download.
+
+    `put` só marca como sujo; a gravação sai SAVE_DELAY segundos depois numa
+    thread (mesmo esquema do cache de probe) e `save()` grava na hora (shutdown).
+    """
+
+    SAVE_DELAY = 5.0
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._data: Optional[Dict[str, dict]] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _file(self) -> Path:
+        return self.path or _tuning_file()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._data is None:
+            try:
+                with open(self._file(), "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except Exception:
+                self._data = {}
+        return self._data
+
+    def get(self, host: str) -> Optional[dict]:
+        return self._load().get(host)
+
+    def put(self, host: str, workers: int, throttled: bool):
+        self._load()[host] = {"workers": int(workers), "throttled": bool(throttled), "updated_at": time.time()}
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+        except RuntimeError:
+            self.save()  # fora do loop: grava na hora
+
+    def _snapshot(self) -> Dict[str, dict]:
+        self._dirty = False
+        return dict(self._load())
+
+    def _write(self, data: Dict[str, dict]):
+        try:
+            f = self._file()
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = str(f) + ".new"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, f)
+        except Exception as e:
+            print(f"[TUNING] Falha ao salvar ajuste de hosts: {e}")
+
+    def save(self):
+        if self._dirty:
+            self._write(self._snapshot())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.SAVE_DELAY)
+        if self._dirty:
+            await asyncio.to_thread(self._write, self._snapshot())
+
+
+host_tuning = HostTuningStore()
+
+
+class ConnectionController:
+    """
+    Ajusta quantos workers ficam ativos durante um download segmentado.
+
+    - Começa pequeno (ou no valor lembrado para o host).
+    - A cada janela de avaliação, se a vazão agregada subiu mais que GROWTH_GAIN
+      desde o último aumento, soma ADDITIVE_STEP workers (additive increase).
+    - Se o aumento não trouxe ganho, desfaz o último passo e estabiliza
+      (re-sonda de tempos em tempos).
+    - Em 429/503 corta pela metade (multiplicative decrease) e fixa um teto.
+    Workers com wid >= target ficam estacionados até ganharem vaga.
+    """
+
+    INITIAL_WORKERS = 4
+    MIN_WORKERS = 2
+    ADDITIVE_STEP = 2
+    EVAL_INTERVAL = 3.0
+    GROWTH_GAIN = 1.10
+    REPROBE_INTERVAL = 30.0
+
+    def __init__(self, url: str, max_workers: int, store: Optional[HostTuningStore] = None):
+        self.host = (urlparse(url).hostname or "").lower()
+        self.max_workers = max(1, max_workers)
+        self.min_workers = min(self.MIN_WORKERS, self.max_workers)
+        self.store = store or host_tuning
+
+        self.ceiling = self.max_workers
+        self.throttled = False
+        initial = self.INITIAL_WORKERS
+        remembered = self.store.get(self.host) if self.host else None
+        if remembered:
+            initial = int(remembered.get("workers") or initial)
+            if remembered.get("throttled"):
+                # Servidor limitou da última vez: não passar do valor que funcionou
+                self.ceiling = max(self.min_workers, min(self.ceiling, initial))
+        self.target = max(self.min_workers, min(initial, self.ceiling))
+
+        self._changed = asyncio.Event()
+        self._throttle_events = 0
+        self._last_eval_ts = time.time()
+        self._last_eval_bytes: Optional[int] = None
+        self._rate_before_step: Optional[float] = None
+        self._last_step = 0
+        self._settled_at: Optional[float] = None
+        self._last_decrease_ts = 0.0
+
+    # ---------------------- workers ----------------------
+
+    def allowed(self, wid: int) -> bool:
+        return wid < self.target
+
+    async def wait_for_slot(self, timeout: float = 1.0):
+        """Estaciona um worker excedente até o alvo mudar (ou timeout para re-checar parada)."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def wake_all(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _set_target(self, value: int, reason: str):
+        value = max(self.min_workers, min(value, self.ceiling))
+        if value != self.target:
+            print(f"[TUNING] {self.host}: workers {self.target} -> {value} ({reason})")
+            self.target = value
+            self.wake_all()
+
+    # ---------------------- sinais ----------------------
+
+    def on_throttle(self, status_code: int):
+        """Servidor respondeu 429/503: reduzir imediatamente."""
+        self._throttle_events += 1
+        self.throttled = True
+        now = time.time()
+        # Vários workers recebem 429 ao mesmo tempo: cortar só uma vez por rajada
+        if now - self._last_decrease_ts < 1.0:
+            return
+        self._last_decrease_ts = now
+        self.ceiling = max(self.min_workers, self.target - 1)
+        self._settled_at = time.time()
+        self._rate_before_step = None
+        self._last_step = 0
+        self._set_target(self.target // 2, f"HTTP {status_code}")
+
+    def sample(self, downloaded_total: int, active_workers: int):
+        """Chamado periodicamente com o total baixado; decide crescer/encolher."""
+        now = time.time()
+        if self._last_eval_bytes is None:
+            self._last_eval_bytes = downloaded_total
+            self._last_eval_ts = now
+            return
+        dt = now - self._last_eval_ts
+        if dt < self.EVAL_INTERVAL:
+            return
+
+        rate = (downloaded_total - self._last_eval_bytes) / dt
+        self._last_eval_bytes = downloaded_total
+        self._last_eval_ts = now
+        per_conn = rate / active_workers if active_workers else 0
+        print(f"[TUNING] {self.host}: {rate/1024/1024:.1f} MB/s agregado, "
+              f"{per_conn/1024/1024:.2f} MB/s por conexão, alvo={self.target}")
+
+        if self._throttle_events:
+            # Ainda recebendo 429/503 nesta janela: não crescer
+            self._throttle_events = 0
+            return
+
+        if self._settled_at is not None:
+            if now - self._settled_at < self.REPROBE_INTERVAL:
+                return
+            # Re-sondar: talvez o servidor/rede agora aguente mais
+            self._settled_at = None
+            self._rate_before_step = None
+
+        if self._rate_before_step is not None and self._last_step:
+            if rate < self._rate_before_step * self.GROWTH_GAIN:
+                # Mais conexões não ajudaram: desfazer o passo e estabilizar
+                self._set_target(self.target - self._last_step, "sem ganho de vazão")
+                self._last_step = 0
+                self._settled_at = now
+                return
+
+        if self.target < self.ceiling:
+            step = min(self.ADDITIVE_STEP, self.ceiling - self.target)
+            self._rate_before_step = rate
+            self._last_step = step
+            self._set_target(self.target + step, "vazão ainda crescendo")
+        else:
+            self._settled_at = now
+
+    def remember(self):
+        if self.host:
+            self.store.put(self.host, self.target, self.throttled)
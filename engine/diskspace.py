@@ -0,0 +1,167 @@
+import os
+import time
+import shutil
+from typing import Optional, Dict, Tuple
+
+
+# ============================================================
+# MONITOR DE ESPAÇO LIVRE POR VOLUME (COM RESERVAS ENTRE JOBS)
+# ============================================================
+
+def existing_dir(path: str) -> str:
+    """Sobe até o primeiro diretório que existe (destino ainda não criado)."""
+    p = os.path.abspath(path or ".")
+    while p and not os.path.isdir(p):
+        parent = os.path.dirname(p)
+        if parent == p:
+            break
+        p = parent
+    return p or "."
+
+
+def _belongs_to(path: str, root: str) -> bool:
+    """`path` é o próprio destino, o seu .tmp ou algo dentro da pasta dele (não "/dl/game_1.tmp" para "/dl/game")."""
+    return path == root or path == root + ".tmp" or path.startswith(root + os.sep)
+
+
+class _Reservation:
+    __slots__ = ("path", "volume", "total", "downloaded")
+
+    def __init__(self, path: str, volume, total: int, downloaded: int):
+        self.path = path
+        self.volume = volume
+        self.total = total
+        self.downloaded = downloaded
+
+
+class DiskSpaceMonitor:
+    """
+    Espaço livre compartilhado por todos os jobs.
+
+    - Um `disk_usage` por volume a cada TTL segundos (cache), em vez de cada job
+      consultar o disco sozinho no seu progress_cb.
+    - Cada job ativo registra uma reserva: bytes que ainda vai escrever
+      (total - baixado). O espaço útil para um job é o livre do volume menos o
+      que os OUTROS jobs do mesmo volume ainda vão escrever; assim dois jobs não
+      "enxergam" o mesmo espaço livre e estouram o disco juntos.
+    - Arquivos pré-alocados (fallocate) já saíram do livre do volume: a parte
+      alocada não conta de novo na reserva.
+    """
+
+    TTL = 2.0
+
+    def __init__(self):
+        self._free: Dict[object, Tuple[float, int]] = {}  # volume -> (ts, livre)
+        self._volumes: Dict[str, Tuple[object, str]] = {}  # caminho -> (volume, diretório)
+        self._reservations: Dict[int, _Reservation] = {}
+        self._allocated: Dict[str, int] = {}  # arquivo pré-alocado -> bytes
+        self.refreshes = 0
+
+    # ---------------------- volumes ----------------------
+
+    def volume_of(self, path: str) -> Tuple[object, str]:
+        """(volume, diretório existente) de `path`; resolvido uma vez por caminho."""
+        cached = self._volumes.get(path)
+        if cached is not None:
+            return cached
+        directory = existing_dir(path)
+        try:
+            vol = os.stat(directory).st_dev
+        except OSError:
+            vol = directory
+        self._volumes[path] = (vol, directory)
+        return vol, directory
+
+    def free(self, path: str, max_age: Optional[float] = None) -> int:
+        """Livre no volume de `path` (cache de até `max_age`/TTL segundos)."""
+        vol, directory = self.volume_of(path)
+        now = time.time()
+        cached = self._free.get(vol)
+        if cached and now - cached[0] < (self.TTL if max_age is None else max_age):
+            return cached[1]
+        free = shutil.disk_usage(directory).free
+        self._free[vol] = (now, free)
+        self.refreshes += 1
+        return free
+
+    def invalidate(self, path: Optional[str] = None):
+        if path is None:
+            self._free.clear()
+        else:
+            self._free.pop(self.volume_of(path)[0], None)
+
+    # ---------------------- reservas ----------------------
+
+    def reserve(self, job_id: int, path: str, total: Optional[int] = None, downloaded: int = 0):
+        """Registra (ou atualiza o destino de) a reserva do job."""
+        vol, _ = self.volume_of(path)
+        r = self._reservations.get(job_id)
+        if r is None:
+            self._reservations[job_id] = _Reservation(path, vol, total or 0, downloaded or 0)
+        else:
+            r.path, r.volume = path, vol
+            self.update(job_id, downloaded, total)
+
+    def update(self, job_id: int, downloaded: Optional[int] = None, total: Optional[int] = None):
+        r = self._reservations.get(job_id)
+        if r is None:
+            return
+        if total and total > 0:
+            r.total = total
+        if downloaded is not None:
+            r.downloaded = downloaded
+
+    def release(self, job_id: int):
+        r = self._reservations.pop(job_id, None)
+        if r is not None:
+            root = os.path.abspath(r.path)
+            for p in [p for p in list(self._allocated) if _belongs_to(p, root)]:
+                del self._allocated[p]
+
+    def note_allocated(self, path: str, size: int):
+        """Arquivo pré-alocado: esses bytes já não estão no livre do volume."""
+        self._allocated[os.path.abspath(path)] = size
+        self.invalidate(path)
+
+    def outstanding(self, r: _Reservation) -> int:
+        """Bytes que o job ainda vai tirar do volume."""
+        root = os.path.abspath(r.path)
+        allocated = sum(size for p, size in list(self._allocated.items()) if _belongs_to(p, root))
+        return max(0, r.total - max(r.downloaded, allocated))
+
+    def reserved(self, path: str, exclude_job: Optional[int] = None, exclude_path: Optional[str] = None) -> int:
+        vol, _ = self.volume_of(path)
+        exclude_path = os.path.abspath(exclude_path) if exclude_path else None
+        total = 0
+        for jid, r in list(self._reservations.items()):
+            if r.volume != vol or jid == exclude_job:
+                continue
+            if exclude_path and _belongs_to(exclude_path, os.path.abspath(r.path)):
+                continue
+            total += self.outstanding(r)
+        return total
+
+    def net_free(self, path: str, exclude_job: Optional[int] = None, exclude_path: Optional[str] = None) -> int:
+        """Livre do volume menos o que os outros jobs ativos ainda vão escrever nele."""
+        return max(0, self.free(path) - self.reserved(path, exclude_job, exclude_path))
+
+    def shortfall(self, job_id: int) -> Tuple[int, int, int]:
+        """(faltando, necessário, disponível) para o job terminar; faltando > 0 = não cabe."""
+        r = self._reservations.get(job_id)
+        if r is None or r.total <= 0:
+            return 0, 0, 0
+        needed = self.outstanding(r)
+        available = self.net_free(r.path, exclude_job=job_id)
+        return max(0, needed - available), needed, available
+
+    def snapshot(self, path: str) -> dict:
+        vol, _ = self.volume_of(path)
+        return {
+            "free": self.free(path),
+            "reserved": self.reserved(path),
+            "available": self.net_free(path),
+            "jobs": [jid for jid, r in self._reservations.items() if r.volume == vol],
+        }
+
+
+disk_monitor = DiskSpaceMonitor()
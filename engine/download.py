@@ -3,57 +3,128 @@ import asyncio
 import time
 import httpx
 import aiofiles
-from typing import Optional, Callable
+from typing import Optional, Callable, List
+from .range_map import RangeMap, MAP_SUFFIX
+from .conn_controller import ConnectionController
+from .writer import PositionalWriter, BufferPool, write_latency
+from .mirrors import MirrorPool, normalize_mirrors
+from .checksums import StreamingChecksum, ChecksumMismatch
+from .bandwidth import JobBandwidth
+from .http_pool import http_pool
+from .prealloc import preallocate_file, ensure_free_space, default_preallocate
+from .probe_cache import probe_cache, if_range_value, validators_from_headers, load_validator, save_validator, remove_validator
 
 
 def log(msg: str):
     print(msg, flush=True)
 
 
+class SegmentedDownloadFailed(Exception):
+    """Workers esgotaram os retries; o que já foi gravado fica no .tmp/mapa para o resume."""
+
+    def __init__(self, reason: str, written: int, size: int):
+        super().__init__(f"Download segmentado falhou ({written}/{size} bytes gravados): {reason}")
+        self.reason = reason
+        self.written = written
+        self.size = size
+
+
+class ServerThrottled(Exception):
+    """Servidor pediu para reduzir (HTTP 429/503)."""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Server throttled {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class MirrorRejected(Exception):
+    """Mirror não serve o mesmo arquivo (status, HTML, sem Range ou tamanho diferente)."""
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    # Formato: bytes 0-1023/12345
+    if not value or "/" not in value:
+        return None
+    try:
+        return int(value.rsplit("/", 1)[-1])
+    except ValueError:
+        return None
+
+
+class _Segment:
+    """Range [start, end] em andamento; `end` pode encolher quando outro worker rouba a cauda."""
+    __slots__ = ("start", "end", "pos")
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.pos = start
+
+
+def _parse_retry_after(value: Optional[str], cap: float = 30.0) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return min(cap, max(0.0, float(value)))
+    except ValueError:
+        return None
+
+
 # ============================================================
 # SUPORTE A RANGE
 # ============================================================
 
-async def supports_range(url: str, verify: bool = True) -> dict:
+async def supports_range(url: str, verify: bool = True, use_cache: bool = True) -> dict:
     """
     Verifica se o servidor suporta downloads parciais e determina o tamanho REAL.
     Usa 'Range: bytes=0-0' para obter 'Content-Range', que é a fonte mais confiável de tamanho.
+    O resultado (com ETag/Last-Modified) fica no cache de probe; dentro do TTL o probe é pulado.
     """
-    # Browser-like headers to avoid server blocks
-    browser_headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive"
-    }
+    if use_cache:
+        cached = probe_cache.get(url)
+        if cached and cached.get("size"):
+            log(f"[INFO] Probe em cache: {cached['size']} bytes, range={cached['accept_ranges']}")
+            return {
+                "accept_ranges": cached["accept_ranges"],
+                "size": cached["size"],
+                "status_code": 206 if cached["accept_ranges"] else 200,
+                "etag": cached.get("etag"),
+                "last_modified": cached.get("last_modified"),
+                "cached": True
+            }
+
+    probe_timeout = httpx.Timeout(15, read=30)
+
+    def _result(accept_ranges: bool, size: Optional[int], r) -> dict:
+        validators = validators_from_headers(r.headers)
+        if r.status_code < 400 and size:
+            probe_cache.put(url, size, accept_ranges, **validators)
+        return {"accept_ranges": accept_ranges, "size": size, "status_code": r.status_code, **validators}
     
     try:
-        async with httpx.AsyncClient(verify=verify, timeout=httpx.Timeout(15, read=30), follow_redirects=True, headers=browser_headers) as client:
+        # Cliente do pool por host: a conexão aberta aqui é a mesma que o download vai usar
+        async with http_pool.lease(url, verify) as client:
             # Estrutura robusta: Tenta Range 0-0 primeiro (Melhor para tamanho exato)
             headers = {"Range": "bytes=0-0"}
             try:
-                r = await client.get(url, headers=headers)
-                
-                # Check for Content-Range (Authoritative)
-                content_range = r.headers.get("content-range", "")
-                # Format: bytes 0-0/12345
-                if r.status_code == 206 and "bytes" in content_range and "/" in content_range:
-                    try:
-                        size = int(content_range.split("/")[-1])
-                        log(f"[INFO] Tamanho confirmado via Content-Range: {size} bytes")
-                        return {
-                            "accept_ranges": True,
-                            "size": size,
-                            "status_code": r.status_code
-                        }
-                    except:
-                        pass
+                # stream: se o servidor ignorar o Range e mandar 200, o corpo não é baixado
+                async with client.stream("GET", url, headers=headers, timeout=probe_timeout) as r:
+                    # Check for Content-Range (Authoritative)
+                    content_range = r.headers.get("content-range", "")
+                    # Format: bytes 0-0/12345
+                    if r.status_code == 206 and "bytes" in content_range and "/" in content_range:
+                        try:
+                            size = int(content_range.split("/")[-1])
+                            log(f"[INFO] Tamanho confirmado via Content-Range: {size} bytes")
+                            return _result(True, size, r)
+                        except:
+                            pass
             except:
                 pass
 
             # Fallback: HEAD request (Old methods)
-            r = await client.head(url)
+            r = await client.head(url, timeout=probe_timeout)
             # r.raise_for_status() # Don't raise, just analyze
             
             accept = r.headers.get("accept-ranges", "").lower()
@@ -61,18 +132,7 @@ async def supports_range(url: str, verify: bool = True) -> dict:
             size = int(size_header) if size_header else None
             
             # Se Range funcionou no HEAD (raro, mas possivel)
-            if accept == "bytes":
-                return {
-                    "accept_ranges": True,
-                    "size": size,
-                    "status_code": r.status_code
-                }
-                
-            return {
-                "accept_ranges": accept == "bytes",
-                "size": size,
-                "status_code": r.status_code
-            }
+            return _result(accept == "bytes", size, r)
     except Exception as e:
         status_code = None
         if hasattr(e, 'response') and e.response:
@@ -90,38 +150,73 @@ async def supports_range(url: str, verify: bool = True) -> dict:
 # SERIAL – DOWNLOAD CLÁSSICO
 # ============================================================
 
+# Blocos do download serial, compartilhados entre downloads (lotes reaproveitam em vez de alocar por arquivo)
+SERIAL_BLOCK_SIZE = 4 * 1024 * 1024
+_serial_buffers = BufferPool(SERIAL_BLOCK_SIZE, max_free=16)
+
+
+async def _flush_serial_block(f, block: bytearray, length: int, offset: int,
+                              checksum: Optional[StreamingChecksum], hash_task):
+    """Grava o bloco e entrega ao hash numa thread (espera o hash anterior: o outro bloco fica livre)."""
+    view = memoryview(block)[:length]
+    t0 = time.perf_counter()
+    await f.write(view)
+    write_latency.record(length, time.perf_counter() - t0)
+    if checksum:
+        if hash_task:
+            await hash_task
+        hash_task = asyncio.ensure_future(asyncio.to_thread(checksum.feed, offset, view))
+    return hash_task
+
+
 async def download_serial(
     url: str,
     dest_path: str,
     progress_cb: Optional[Callable] = None,
     resume: bool = True,
-    verify: bool = True
+    verify: bool = True,
+    checksum: Optional[StreamingChecksum] = None,
+    bandwidth: Optional[JobBandwidth] = None,
+    stop_event: Optional[asyncio.Event] = None
 ):
     temp_path = dest_path + ".part"
+    stopped = False
     
-    # Browser-like headers to avoid server blocks
-    browser_headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive"
-    }
-    
-    headers = browser_headers.copy()
+    # Browser-like headers já vêm do cliente do pool
+    headers = {}
     existing = 0
     mode = "wb"
 
-    # Resume
+    # Resume: If-Range com o validador de quando o .part começou.
+    # Se o arquivo remoto mudou, o servidor responde 200 (arquivo inteiro) em vez de 206.
     if resume and os.path.exists(temp_path):
         existing = os.path.getsize(temp_path)
-        headers["Range"] = f"bytes={existing}-"
-        mode = "ab"
+        if existing:
+            headers["Range"] = f"bytes={existing}-"
+            validator = load_validator(temp_path) or {}
+            if_range = if_range_value(validator.get("etag"), validator.get("last_modified"))
+            if if_range:
+                headers["If-Range"] = if_range
+            mode = "ab"
 
     try:
-        async with httpx.AsyncClient(verify=verify, timeout=httpx.Timeout(30, read=300), follow_redirects=True) as client:
+        async with http_pool.lease(url, verify) as client:
             async with client.stream("GET", url, headers=headers) as resp:
                 resp.raise_for_status()
 
+                if existing and resp.status_code != 206:
+                    # Remoto mudou (If-Range falhou) ou servidor ignorou o Range: recomeçar do zero
+                    # em vez de emendar bytes de outro arquivo no .part
+                    log(f"[RESUME] Servidor respondeu {resp.status_code} ao resume; reiniciando download do zero")
+                    probe_cache.invalidate(url)
+                    existing = 0
+                    mode = "wb"
+                    if checksum:
+                        checksum.reset()
+                if not existing:
+                    v = validators_from_headers(resp.headers)
+                    await asyncio.to_thread(save_validator, temp_path, v["etag"], v["last_modified"])
+
                 ctype = resp.headers.get("content-type", "").lower()
                 if "text/html" in ctype:
                     raise ValueError(
@@ -145,31 +240,77 @@ async def download_serial(
 
                 start = time.time()
                 last = start
-                CHUNK = 4 * 1024 * 1024  # 4 MB
 
                 # Inicializar UI com 0%
                 if progress_cb and total:
                     await progress_cb(0, total)
 
-                async with aiofiles.open(temp_path, mode) as f:
-                    async for chunk in resp.aiter_bytes(chunk_size=CHUNK):
-                        await f.write(chunk)
-                        downloaded += len(chunk)
-
-                        now = time.time()
-                        # Reduzido para 0.5s para mostrar progresso em downloads rápidos
-                        if total and (now - last >= 0.5):
-                            spd = downloaded / (now - start)
-                            pct = downloaded / total * 100
-                            eta = (total - downloaded) / spd if spd > 0 else 0
-
-                            log(f"[DL] {downloaded/1024/1024:.1f}/{total/1024/1024:.1f}MB "
-                                f"({pct:.1f}%) | {spd/1024/1024:.1f} MB/s | "
-                                f"ETA {int(eta//60)}m {int(eta%60):02d}s")
-                            last = now
-
-                            if progress_cb:
-                                await progress_cb(downloaded, total)
+                # Checksum: o trecho já baixado (resume) é lido do disco uma vez; o resto é hasheado
+                # numa thread em paralelo com o preenchimento do outro bloco
+                hash_task = None
+                if checksum and existing:
+                    await asyncio.to_thread(checksum.catch_up, temp_path, existing)
+
+                # Dois blocos reaproveitados (um enchendo, outro sendo hasheado): cada leitura do
+                # socket é copiada uma vez para o bloco, e o bloco cheio vira um único write
+                blocks = [_serial_buffers.acquire(), _serial_buffers.acquire()]
+                block = blocks[0]
+                fill = 0
+                flushed = downloaded
+                try:
+                    async with aiofiles.open(temp_path, mode) as f:
+                        async for chunk in resp.aiter_bytes():
+                            if stop_event and stop_event.is_set():
+                                stopped = True
+                                break
+                            view = memoryview(chunk)
+                            while view:
+                                n = min(len(view), len(block) - fill)
+                                block[fill:fill + n] = view[:n]
+                                fill += n
+                                view = view[n:]
+                                if fill == len(block):
+                                    hash_task = await _flush_serial_block(f, block, fill, flushed, checksum, hash_task)
+                                    flushed += fill
+                                    fill = 0
+                                    blocks.reverse()
+                                    block = blocks[0]
+                            downloaded += len(chunk)
+                            # Limite de banda por leitura do socket (ritmo suave, sem rajadas do tamanho do bloco)
+                            if bandwidth:
+                                await bandwidth.consume(len(chunk))
+
+                            now = time.time()
+                            # Reduzido para 0.5s para mostrar progresso em downloads rápidos
+                            if total and (now - last >= 0.5):
+                                spd = downloaded / (now - start)
+                                pct = downloaded / total * 100
+                                eta = (total - downloaded) / spd if spd > 0 else 0
+
+                                log(f"[DL] {downloaded/1024/1024:.1f}/{total/1024/1024:.1f}MB "
+                                    f"({pct:.1f}%) | {spd/1024/1024:.1f} MB/s | "
+                                    f"ETA {int(eta//60)}m {int(eta%60):02d}s")
+                                last = now
+
+                                if progress_cb:
+                                    await progress_cb(downloaded, total)
+                        # Pausa ou fim: o que está no bloco vai para o .part (o resume parte do tamanho dele)
+                        if fill:
+                            hash_task = await _flush_serial_block(f, block, fill, flushed, checksum, hash_task)
+                            flushed += fill
+                            fill = 0
+                    if hash_task:
+                        await hash_task
+                finally:
+                    # A thread de hash pode estar lendo um dos blocos: só devolver depois dela
+                    if hash_task and not hash_task.done():
+                        try:
+                            await hash_task
+                        except Exception:
+                            pass
+                    for b in blocks:
+                        _serial_buffers.release(b)
+                    downloaded = flushed
     except httpx.HTTPStatusError as e:
         log(f"[ERRO] Status HTTP {e.response.status_code} para {url}")
         return None
@@ -177,7 +318,26 @@ async def download_serial(
         log(f"[ERRO] Download falhou: {e}")
         return None
 
+    if stopped:
+        # Pausa/cancelamento: .part (e validador) ficam para o resume
+        log(f"[AVISO] Download serial interrompido em {downloaded/1024/1024:.1f}MB")
+        return None
+
+    if checksum:
+        digests = await asyncio.to_thread(checksum.finish, temp_path, downloaded)
+        log(f"[CHECKSUM] {digests}")
+        try:
+            checksum.verify()
+        except ChecksumMismatch as e:
+            log(f"[ERRO] {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
     os.replace(temp_path, dest_path)
+    remove_validator(temp_path)
     
     # Log de conclusão com estatísticas
     elapsed = time.time() - start
@@ -206,96 +366,229 @@ async def download_segmented(
     stop_event: Optional[asyncio.Event] = None,
     verify: bool = True,
     known_size: Optional[int] = None,
-    preallocate: bool = False  # PERF: Disabled by default to avoid startup delay
+    preallocate: Optional[bool] = None,  # None = automático (fallocate no Linux; desligado no Windows pelo delay)
+    mirrors: Optional[List[str]] = None,
+    checksum: Optional[StreamingChecksum] = None,
+    bandwidth: Optional[JobBandwidth] = None
 ):
     log(f"HTTP UltraMax: {url}")
     log(f"Destino: {dest_path}")
+    mirror_pool = MirrorPool(normalize_mirrors(url, mirrors))
+    if len(mirror_pool.mirrors) > 1:
+        log(f"Mirrors: {len(mirror_pool.mirrors)} URIs para o mesmo arquivo")
 
     # Tamanho do arquivo
     size = known_size
     if not size:
         try:
-            # PERF: HTTP/2 enabled + reduced timeout for faster HEAD request
-            async with httpx.AsyncClient(verify=verify, timeout=httpx.Timeout(10, read=30), follow_redirects=True, http2=True) as client:
-                h = await client.head(url)
+            # PERF: HTTP/2 (cliente do pool) + reduced timeout for faster HEAD request
+            async with http_pool.lease(url, verify) as client:
+                h = await client.head(url, timeout=httpx.Timeout(10, read=30))
                 h.raise_for_status()
                 cl = h.headers.get("content-length")
                 if not cl:
-                    return await download_serial(url, dest_path, progress_cb)
+                    return await download_serial(url, dest_path, progress_cb, verify=verify, checksum=checksum, bandwidth=bandwidth, stop_event=stop_event)
                 size = int(cl)
                 log(f"Tamanho: {size/1024/1024:.2f} MB")
         except Exception as e:
             log(f"[WARN] Não foi possível obter tamanho via HEAD: {e}. Usando download serial.")
-            return await download_serial(url, dest_path, progress_cb)
+            return await download_serial(url, dest_path, progress_cb, verify=verify, checksum=checksum, bandwidth=bandwidth, stop_event=stop_event)
     else:
         log(f"Tamanho (cache): {size/1024/1024:.2f} MB")
 
     # Arquivos pequenos → Serial
     if size < 50 * 1024 * 1024:
-        return await download_serial(url, dest_path, progress_cb)
+        return await download_serial(url, dest_path, progress_cb, verify=verify, checksum=checksum, bandwidth=bandwidth, stop_event=stop_event)
 
     temp_path = dest_path + ".tmp"
+    map_path = temp_path + MAP_SUFFIX
+
+    # RESUME: Carregar mapa de ranges já gravados (sidecar .tmp.ranges)
+    range_map = None
+    if resume and os.path.exists(temp_path):
+        range_map = RangeMap.load(map_path, size, url)
+        if range_map:
+            log(f"[RESUME] Retomando: {range_map.done_bytes/1024/1024:.1f}/{size/1024/1024:.1f}MB já gravados "
+                f"({len(range_map.missing())} ranges pendentes)")
+
+    if range_map is None:
+        range_map = RangeMap(map_path, size, url)
+        # Create empty file - will grow as chunks are written (ou é pré-alocado abaixo)
+        open(temp_path, "wb").close()
+        range_map.flush()
 
-    # PERF: Pré-alocar arquivo apenas se solicitado (evita delay de minutos no Windows)
+    # Espaço em disco: checar ANTES de baixar (falha rápida em vez de ENOSPC no meio de 50 GB).
+    # PERF: Pré-alocação (padrão só no Linux: fallocate, sem escrever zeros) reserva o arquivo
+    # inteiro de uma vez e dá extents contíguos mesmo com 32 workers gravando fora de ordem.
+    if preallocate is None:
+        preallocate = default_preallocate()
     if preallocate:
-        try:
-            with open(temp_path, "wb") as f:
-                f.seek(size - 1)
-                f.write(b"\0")
-            log(f" Arquivo pré-alocado: {size/1024/1024:.2f} MB")
-        except Exception as e:
-            log(f"[WARN] Pré-alocação falhou (continuando sem): {e}")
+        method = await asyncio.to_thread(preallocate_file, temp_path, size)
+        log(f" Arquivo pré-alocado ({method}): {size/1024/1024:.2f} MB")
     else:
-        # Create empty file - will grow as chunks are written
-        open(temp_path, "wb").close()
+        ensure_free_space(temp_path, size)
+
+    # Pedidos ao host principal levam If-Range com o validador gravado no mapa (desde o primeiro 206);
+    # se o arquivo remoto mudou, o servidor responde 200 e o download recomeça limpo em vez de
+    # misturar versões no .tmp
+    remote_changed = False
+
+    # Fila de ranges pendentes (em ordem). Workers recortam chunks do início da fila.
+    pending_ranges = range_map.missing()
+
+    # Um descritor para o job inteiro; bytes chegam ao disco em blocos via pwrite
+    writer = PositionalWriter(
+        temp_path,
+        on_written=lambda offset, length: range_map.mark_done(offset, offset + length - 1),
+        # Checksum recebe cada bloco na thread de escrita, ainda na memória
+        on_data=checksum.feed if checksum else None
+    )
+    hash_catchup = None
 
     # PERF: Progressive chunk sizing - start small for quick feedback, grow for efficiency
     CHUNK_INITIAL = 4 * 1024 * 1024   # 4 MB for first 10% (quick progress)
     CHUNK_STEADY = 16 * 1024 * 1024    # 16 MB for rest (balanced I/O)
     CHUNK_BATCH_SIZE = 4  # PERF: Grab 4 chunks per lock acquisition to reduce contention
+    MIN_STEAL_SIZE = 2 * 1024 * 1024  # TAIL: não dividir ranges com menos de 2x isso restante
     
-    # Restoring full power: 32 workers
-    WORKERS = min(32, n_conns * 4) 
-    log(f"Iniciando download com {WORKERS} workers simultâneos (Chunk progressivo 4-16MB, HTTP/2=ATIVADO)...")
+    # Até 32 workers, mas quantos ficam ativos é decidido pelo controle adaptativo (AIMD por host)
+    WORKERS = min(32, n_conns * 4)
+    controller = ConnectionController(url, WORKERS)
+    log(f"Iniciando download com {controller.target}/{WORKERS} workers (adaptativo, Chunk progressivo 4-16MB, HTTP/2=ATIVADO)...")
 
-    # Initialize UI with 0/total to avoid "unknown" state
+    # Initialize UI with current/total to avoid "unknown" state
+    downloaded_total = range_map.done_bytes
     if progress_cb:
-        await progress_cb(0, size)
-
-    next_offset = 0
-    downloaded_total = 0
-    lock = asyncio.Lock()
+        await progress_cb(downloaded_total, size)
+
+    part_size = -(-size // max(1, k))
+
+    async def report_parts():
+        # JobParts espelham o mapa de ranges: bytes gravados dentro de cada parte
+        if not on_part_progress:
+            return
+        for i in range(max(1, k)):
+            p_start = i * part_size
+            if p_start >= size:
+                break
+            p_end = min(p_start + part_size - 1, size - 1)
+            await on_part_progress(i, range_map.covered(p_start, p_end), p_end - p_start + 1)
+
+    await report_parts()
+
+    lock = asyncio.Lock()  # só para reservar/dividir ranges; nunca no caminho dos bytes
+    REPORT_INTERVAL = 1.0
+    base_downloaded = downloaded_total
+    worker_bytes = [0] * WORKERS
+    inflight: set = set()  # _Segment em andamento (ou reservados em lote) - alvo do work-stealing
     stop_flag = False
     active_workers = 0
+    # Falha de worker (retries esgotados, HTTP 4xx, HTML) também para os demais, mas não é pausa
+    worker_failure: Optional[str] = None
+    failure_resumable = True
+
+    def fail(reason: str, resumable: bool):
+        nonlocal stop_flag, worker_failure, failure_resumable
+        if worker_failure is None:
+            worker_failure = reason
+            failure_resumable = resumable
+        stop_flag = True
     
     start_time = time.time()
-    last_log = start_time
 
-    connector_limits = httpx.Limits(
-        max_connections=200,
-        max_keepalive_connections=200,
-        keepalive_expiry=300.0
-    )
+    # PERF: Um cliente por host, compartilhado por todos os workers E por outros jobs do mesmo host
+    # (engine/http_pool.py). Segurar o empréstimo durante o download mantém as conexões quentes.
+    async with http_pool.lease(url, verify):
 
-    # PERF: Use SINGLE shared client for all workers to avoid overhead of 32 SSL contexts
-    # pooling is efficient this way.
-    async with httpx.AsyncClient(
-        verify=verify,
-        timeout=httpx.Timeout(30, read=300),
-        limits=connector_limits,
-        follow_redirects=True,
-        http2=True 
-    ) as main_client:
+        def take_segments() -> list:
+            # PERF: Batch chunk acquisition (chamado sob o lock)
+            segs = []
+            for _ in range(CHUNK_BATCH_SIZE):
+                if not pending_ranges:
+                    break
+                
+                gap_start, gap_end = pending_ranges[0]
+                progress_pct = (gap_start / size) * 100 if size > 0 else 0
+                current_chunk_size = CHUNK_INITIAL if progress_pct < 10 else CHUNK_STEADY
+                
+                start = gap_start
+                end = min(start + current_chunk_size - 1, gap_end)
+                if end >= gap_end:
+                    pending_ranges.pop(0)
+                else:
+                    pending_ranges[0] = (end + 1, gap_end)
+                seg = _Segment(start, end)
+                inflight.add(seg)
+                segs.append(seg)
+            return segs
+
+        def steal_segment() -> Optional["_Segment"]:
+            # TAIL: Fila vazia -> dividir o maior range ainda em andamento (chamado sob o lock).
+            # O dono original passa a terminar no meio; quem rouba baixa a segunda metade.
+            victim = None
+            victim_remaining = 0
+            for seg in inflight:
+                remaining = seg.end - seg.pos + 1
+                if remaining > victim_remaining:
+                    victim, victim_remaining = seg, remaining
+            if not victim or victim_remaining < 2 * MIN_STEAL_SIZE:
+                return None
+            mid = victim.pos + victim_remaining // 2
+            stolen = _Segment(mid, victim.end)
+            victim.end = mid - 1
+            inflight.add(stolen)
+            return stolen
+
+        async def reporter():
+            # Amostra os contadores dos workers em cadência fixa: log, velocidade/ETA,
+            # callbacks, flush do mapa e controle adaptativo ficam fora do caminho dos bytes.
+            nonlocal downloaded_total, hash_catchup
+            last_ts = time.time()
+            last_total = downloaded_total
+            last_mirror_log = last_ts
+            spd = 0.0
+            while True:
+                await asyncio.sleep(REPORT_INTERVAL)
+                now = time.time()
+                downloaded_total = base_downloaded + sum(worker_bytes)
+                dt = now - last_ts
+                if dt > 0:
+                    inst = (downloaded_total - last_total) / dt
+                    spd = inst if spd == 0 else (0.3 * inst + 0.7 * spd)
+                last_ts, last_total = now, downloaded_total
+                pct = downloaded_total / size * 100
+                eta = (size - downloaded_total) / spd if spd > 0 else 0
+                active = min(active_workers, controller.target)
+                log(f"[DL] {downloaded_total/1024/1024:.0f}/{size/1024/1024:.0f}MB "
+                    f"({pct:.1f}%) | {spd/1024/1024:.1f} MB/s | "
+                    f"Workers: {active}/{WORKERS} | "
+                    f"ETA {int(eta//60)}m {int(eta%60):02d}s")
+                range_map.flush(min_interval=2.0)
+                controller.sample(downloaded_total, active)
+                # Hash parado num buraco que já foi preenchido (blocos descartados por memória ou resume):
+                # reler agora, enquanto o trecho ainda está no cache do sistema
+                if checksum and (hash_catchup is None or hash_catchup.done()):
+                    prefix = range_map.contiguous_prefix
+                    if prefix - checksum.cursor >= 32 * 1024 * 1024:
+                        hash_catchup = asyncio.create_task(asyncio.to_thread(checksum.catch_up, temp_path, prefix))
+                if len(mirror_pool.mirrors) > 1 and now - last_mirror_log >= 10:
+                    last_mirror_log = now
+                    log(f"[MIRROR] {mirror_pool.summary()}")
+                try:
+                    if progress_cb:
+                        await progress_cb(downloaded_total, size)
+                    await report_parts()
+                except Exception as e:
+                    log(f"[WARN] Falha ao reportar progresso: {e}")
 
         async def worker(wid: int):
-            nonlocal next_offset, downloaded_total, stop_flag, last_log, active_workers
+            nonlocal stop_flag, active_workers, remote_changed
             
             # PERF: Quick staggered start
             await asyncio.sleep(wid * 0.005) 
             
-            # Use shared client
-            client = main_client
             active_workers += 1
+            my_segments: list = []
             
             # log(f"[DEBUG] Worker {wid} iniciado")
 
@@ -307,42 +600,68 @@ async def download_segmented(
                     if stop_flag:
                         break
 
-                    # PERF: Batch chunk acquisition
-                    chunks_to_download = []
-                    
+                    # Worker excedente: estacionar até o controle liberar vaga
+                    if not controller.allowed(wid):
+                        if not pending_ranges:
+                            break
+                        await controller.wait_for_slot()
+                        continue
+
                     async with lock:
-                        for _ in range(CHUNK_BATCH_SIZE):
-                            if next_offset >= size:
-                                break
-                            
-                            progress_pct = (next_offset / size) * 100 if size > 0 else 0
-                            current_chunk_size = CHUNK_INITIAL if progress_pct < 10 else CHUNK_STEADY
-                            
-                            start = next_offset
-                            end = min(start + current_chunk_size - 1, size - 1)
-                            next_offset = end + 1
-                            chunks_to_download.append((start, end))
+                        my_segments = take_segments()
+                        if not my_segments:
+                            stolen = steal_segment()
+                            if stolen:
+                                my_segments = [stolen]
+                                log(f"[TAIL] W{wid} dividiu range lento: assumindo {stolen.start}-{stolen.end} "
+                                    f"({(stolen.end - stolen.start + 1)/1024/1024:.1f}MB)")
                     
-                    if not chunks_to_download:
+                    if not my_segments:
                         break
                     
-                    for start, end in chunks_to_download:
-                        headers = {"Range": f"bytes={start}-{end}"}
-                        expected_chunk_size = end - start + 1
-                        
+                    throttled = False
+                    for seg_idx, seg in enumerate(my_segments):
                         MAX_RETRIES = 5
                         success = False
                         
                         # Streaming direto para o disco para evitar "congelamento" visual e pico de memória
-                        for attempt in range(MAX_RETRIES):
+                        failed_mirror = None
+                        failures = 0  # falhas seguidas sem avançar nenhum byte
+                        while True:
+                            # Retry continua de seg.pos: o que já foi entregue ao writer não é pedido de novo.
+                            # O fim pode encolher a qualquer momento (work-stealing)
+                            if seg.pos > seg.end:
+                                success = True
+                                break
+                            headers = {"Range": f"bytes={seg.pos}-{seg.end}"}
+                            # Cada tentativa escolhe o melhor mirror no momento (evitando o que acabou de falhar)
+                            mirror = mirror_pool.acquire(avoid=failed_mirror)
+                            # Validadores (ETag) variam entre hosts: If-Range só no principal
+                            if_range = if_range_value(range_map.etag, range_map.last_modified)
+                            sent_if_range = bool(if_range and mirror is mirror_pool.primary)
+                            if sent_if_range:
+                                headers["If-Range"] = if_range
+                            stream_start = time.time()
+                            stream_start_pos = seg.pos
                             try:
-                                # log(f"[DEBUG] W{wid} REQ {start}-{end}")
-                                async with client.stream("GET", url, headers=headers) as r:
+                                # Host em backoff (falhas recentes de qualquer worker): esperar a vez
+                                wait = mirror_pool.wait_time(mirror)
+                                if wait > 0:
+                                    await asyncio.sleep(wait)
+                                    if stop_flag or (stop_event and stop_event.is_set()):
+                                        break
+                                # log(f"[DEBUG] W{wid} REQ {seg.pos}-{seg.end} @ {mirror.host}")
+                                async with http_pool.lease(mirror.url, verify) as client, \
+                                        client.stream("GET", mirror.url, headers=headers) as r:
+                                    if r.status_code in (429, 503):
+                                        raise ServerThrottled(r.status_code, _parse_retry_after(r.headers.get("retry-after")))
                                     if r.status_code not in (200, 206):
-                                        log(f"[ERRO] HTTP {r.status_code} no worker {wid}")
+                                        log(f"[ERRO] HTTP {r.status_code} no worker {wid} ({mirror.host})")
                                         if r.status_code >= 500:
                                              raise Exception(f"Server error {r.status_code}")
-                                        stop_flag = True
+                                        if mirror is not mirror_pool.primary or len(mirror_pool) > 1:
+                                            raise MirrorRejected(f"HTTP {r.status_code}")
+                                        fail(f"HTTP {r.status_code}", resumable=False)
                                         return
 
                                     # Confirm connection established
@@ -350,144 +669,278 @@ async def download_segmented(
                                     
                                     ctype = r.headers.get("content-type", "").lower()
                                     if "text/html" in ctype:
+                                        if len(mirror_pool) > 1:
+                                            raise MirrorRejected("pagina HTML")
                                         log(f"[ERRO] Link invalido! Pagina HTML detectada.")
-                                        stop_flag = True
+                                        fail("pagina HTML em vez do arquivo", resumable=False)
                                         return
 
-                                    bytes_read = 0
-                                    
-                                    async with aiofiles.open(temp_path, "r+b") as f:
-                                        await f.seek(start)
+                                    # 200 para um range parcial traria o arquivo desde o byte 0: nunca gravar em seg.pos
+                                    if r.status_code == 200 and (seg.pos > 0 or seg.end < size - 1):
+                                        if sent_if_range:
+                                            log(f"[RESUME] If-Range falhou: arquivo remoto mudou desde o início do download")
+                                            remote_changed = True
+                                            stop_flag = True
+                                            return
+                                        raise MirrorRejected("sem suporte a Range")
+                                    if mirror is mirror_pool.primary:
+                                        v = validators_from_headers(r.headers)
+                                        range_map.set_validators(v["etag"], v["last_modified"])
+                                    # Mirror precisa servir exatamente o mesmo arquivo
+                                    if mirror is not mirror_pool.primary:
+                                        remote_total = _content_range_total(r.headers.get("content-range"))
+                                        if remote_total is not None and remote_total != size:
+                                            raise MirrorRejected(f"tamanho diferente ({remote_total} != {size})")
+
+                                    # Sem chunk_size: o httpx entrega cada leitura do socket como veio (sem
+                                    # reagrupar/copiar); o writer copia uma vez para o bloco reaproveitado
+                                    async for chunk in r.aiter_bytes():
+                                        if not chunk:
+                                            break
+                                        
+                                        # CRITICAL: Check cancellation inside the inner loop!
+                                        if stop_event and stop_event.is_set():
+                                            stop_flag = True
+                                            break
+                                        if stop_flag:
+                                            break
+
+                                        # Range pode ter sido dividido: não gravar além do novo fim
+                                        limit = seg.end - seg.pos + 1
+                                        if limit <= 0:
+                                            break
+                                        if len(chunk) > limit:
+                                            chunk = memoryview(chunk)[:limit]
+
+                                        # PERF: vai para o buffer do worker; o writer faz pwrite em blocos grandes
+                                        # (o mapa de ranges é marcado só quando o bloco chega ao disco)
+                                        await writer.write(wid, seg.pos, chunk)
                                         
-                                        async for chunk in r.aiter_bytes(chunk_size=64*1024): # 64KB chunks
-                                            if not chunk:
-                                                break
-                                            
-                                            # CRITICAL: Check cancellation inside the inner loop!
-                                            if stop_event and stop_event.is_set():
-                                                stop_flag = True
-                                                break
-                                            if stop_flag:
-                                                break
-
-                                            # Write immediately
-                                            await f.write(chunk)
-                                            
-                                            len_chunk = len(chunk)
-                                            bytes_read += len_chunk
-                                            
-                                            # Update stats safely
-                                            async with lock:
-                                                downloaded_total += len_chunk
-                                                now = time.time()
-                                                # Log apenas a cada 1 segundo para não floodar
-                                                if now - last_log >= 1:
-                                                    elapsed = now - start_time
-                                                    spd = downloaded_total / elapsed if elapsed > 0 else 0
-                                                    pct = downloaded_total / size * 100
-                                                    eta = (size - downloaded_total) / spd if spd > 0 else 0
-                                                    log(f"[DL] {downloaded_total/1024/1024:.0f}/{size/1024/1024:.0f}MB "
-                                                        f"({pct:.1f}%) | {spd/1024/1024:.1f} MB/s | "
-                                                        f"Workers: {active_workers}/{WORKERS} | "
-                                                        f"ETA {int(eta//60)}m {int(eta%60):02d}s")
-                                                    last_log = now
-                                                    if progress_cb:
-                                                        await progress_cb(downloaded_total, size)
-                                                    if on_part_progress:
-                                                        await on_part_progress(0, downloaded_total, size)
-
-                                            if bytes_read >= expected_chunk_size:
-                                                break
-                                            
-                                            if stop_flag:
-                                                break
+                                        len_chunk = len(chunk)
+                                        seg.pos += len_chunk
+                                        
+                                        # PERF: contador próprio do worker (sem lock); o reporter soma
+                                        worker_bytes[wid] += len_chunk
+
+                                        # Limite de banda do job: a espera aqui segura a leitura do socket
+                                        if bandwidth:
+                                            await bandwidth.consume(len_chunk)
+
+                                        if seg.pos > seg.end:
+                                            break
+                                        
+                                        if stop_flag:
+                                            break
+
+                                    # Conexão fechada antes do fim do range não é sucesso: retry continua de seg.pos
+                                    if seg.pos <= seg.end and not stop_flag and not (stop_event and stop_event.is_set()):
+                                        raise Exception(f"conexão terminou antes do fim do range "
+                                                        f"(faltam {seg.end - seg.pos + 1} bytes)")
                                 
+                                mirror_pool.report_transfer(mirror, seg.pos - stream_start_pos, time.time() - stream_start)
                                 success = True
                                 break
+                            except MirrorRejected as e:
+                                log(f"[MIRROR] W{wid} {mirror.host} rejeitado: {e}")
+                                mirror_pool.disable(mirror, str(e))
+                                mirror_pool.report_failure(mirror, str(e))
+                                failed_mirror = mirror
+                                failures += 1
+                                if failures >= MAX_RETRIES:
+                                    log(f"[ERRO] Worker {wid} sem mirror válido: {e}")
+                                    fail(f"sem mirror válido: {e}", resumable=False)
+                                    return
+                            except ServerThrottled as e:
+                                # Devolver o que falta deste lote para a fila e deixar o controle reduzir
+                                mirror_pool.report_failure(mirror, f"HTTP {e.status_code}")
+                                controller.on_throttle(e.status_code)
+                                async with lock:
+                                    for pending_seg in my_segments[seg_idx:]:
+                                        inflight.discard(pending_seg)
+                                    # Só o que falta: bytes já entregues ao writer não voltam para a fila
+                                    pending_ranges[0:0] = [(s.pos, s.end) for s in my_segments[seg_idx:] if s.pos <= s.end]
+                                throttled = True
+                                log(f"[TUNING] W{wid} recebeu HTTP {e.status_code}, aguardando {e.retry_after or 2:.0f}s")
+                                await asyncio.sleep(e.retry_after or 2)
+                                break
                             except Exception as e:
-                                log(f"[DEBUG] W{wid} Error: {e}")
-                                if attempt < MAX_RETRIES - 1:
-                                    await asyncio.sleep(1)
-                                else:
+                                if writer.error:
+                                    # Erro de disco (ex: ENOSPC) não melhora com retry
                                     stop_flag = True
+                                    return
+                                progressed = seg.pos - stream_start_pos
+                                if progressed > 0:
+                                    # Falha no meio do range: o trecho recebido conta como transferência boa
+                                    mirror_pool.report_transfer(mirror, progressed, time.time() - stream_start)
+                                    failures = 0
+                                mirror_pool.report_failure(mirror, str(e))
+                                failed_mirror = mirror
+                                failures += 1
+                                if failures >= MAX_RETRIES:
                                     log(f"[ERRO] Worker {wid} falhou: {e}")
+                                    fail(f"{mirror.host}: {e}", resumable=True)
                                     return
+                                delay = mirror_pool.backoff(mirror)
+                                log(f"[RETRY] W{wid} ({mirror.host}): {e} - retomando em {seg.pos} "
+                                    f"({progressed/1024/1024:.1f}MB aproveitados) após {delay:.1f}s")
+                            finally:
+                                mirror_pool.release(mirror)
                         
-                        if not success:
+                        if throttled or not success:
                             break
+
+                        inflight.discard(seg)
                         
                         if stop_flag:
                              break
 
+                    if not throttled and not success:
+                        break
+
             finally:
+                for seg in my_segments:
+                    inflight.discard(seg)
                 active_workers -= 1
+                # Acordar estacionados para que percebam o fim da fila/parada
+                controller.wake_all()
                 log(f"[DEBUG] Worker {wid} encerrado")
 
-        tasks = [asyncio.create_task(worker(i)) for i in range(WORKERS)]
-        
-        if stop_event:
-            # Create a wrapper for gather to wait on it
-            # FIXED: gather returns a Future, do not wrap in create_task
-            gather_task = asyncio.gather(*tasks, return_exceptions=True)
-            stop_waiter = asyncio.create_task(stop_event.wait())
+        tasks: List[asyncio.Task] = []
+        reporter_task = None
+        stop_waiter = None
+        results: list = []
+        # try/finally: se o próprio job for cancelado (JobManager.stop), workers e reporter param
+        # e o writer fecha (fd e threads) em vez de continuarem rodando soltos
+        try:
+            tasks = [asyncio.create_task(worker(i)) for i in range(WORKERS)]
+            reporter_task = asyncio.create_task(reporter())
+
+            if stop_event:
+                # Create a wrapper for gather to wait on it
+                # FIXED: gather returns a Future, do not wrap in create_task
+                gather_task = asyncio.gather(*tasks, return_exceptions=True)
+                stop_waiter = asyncio.create_task(stop_event.wait())
             
-            # Race: Either all tasks finish OR stop_event is triggered
-            done, _ = await asyncio.wait(
-                [gather_task, stop_waiter], 
-                return_when=asyncio.FIRST_COMPLETED
-            )
+                # Race: Either all tasks finish OR stop_event is triggered
+                done, _ = await asyncio.wait(
+                    [gather_task, stop_waiter], 
+                    return_when=asyncio.FIRST_COMPLETED
+                )
             
-            if stop_waiter in done:
-                log("[DEBUG] Cancelamento FORÇADO detectado. Parando workers...")
-                stop_flag = True # Flag global
-                for t in tasks:
-                    if not t.done():
-                        t.cancel()
+                if stop_waiter in done:
+                    log("[DEBUG] Cancelamento FORÇADO detectado. Parando workers...")
+                    stop_flag = True # Flag global
+                    for t in tasks:
+                        if not t.done():
+                            t.cancel()
                 
-                # Wait for tasks to handle cancellation (cleanup finally blocks)
-                try:
-                    await gather_task
-                except:
-                    pass
-            else:
-                # Tasks finished normally, cancel the waiter
-                stop_waiter.cancel()
-                try:
-                    await stop_waiter
-                except asyncio.CancelledError:
-                    pass
+                    # Wait for tasks to handle cancellation (cleanup finally blocks)
+                    try:
+                        await gather_task
+                    except:
+                        pass
+                else:
+                    # Tasks finished normally, cancel the waiter
+                    stop_waiter.cancel()
+                    try:
+                        await stop_waiter
+                    except asyncio.CancelledError:
+                        pass
             
-            # Get results from the gather task
-            results = await gather_task
-        else:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        
+                # Get results from the gather task
+                results = await gather_task
+            else:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for t in (reporter_task, stop_waiter):
+                if t is not None and not t.done():
+                    t.cancel()
+                    await asyncio.gather(t, return_exceptions=True)
+            downloaded_total = base_downloaded + sum(worker_bytes)
+
+            # Descarregar buffers pendentes (inclusive de workers cancelados) antes de avaliar o mapa
+            try:
+                await writer.close()
+            except Exception as e:
+                log(f"[ERRO] Falha ao descarregar escrita: {e}")
+
         for r in results:
             if isinstance(r, Exception) and not isinstance(r, asyncio.CancelledError):
                 log(f"[CRÍTICO] Exceção não tratada no worker: {r}")
 
-    # Verificação de integridade CRÍTICA
-    if downloaded_total != size:
-        was_cancelled = stop_flag or (stop_event and stop_event.is_set())
+    if remote_changed and not (stop_event and stop_event.is_set()):
+        # O que já estava no .tmp é de outra versão do arquivo: descartar e baixar de novo
+        log(f"[RESUME] Descartando {range_map.done_bytes/1024/1024:.1f}MB da versão antiga e reiniciando")
+        probe_cache.invalidate(url)
+        range_map.remove()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if checksum:
+            checksum.reset()
+        return await download_segmented(
+            url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, on_part_progress=on_part_progress,
+            resume=False, stop_event=stop_event, verify=verify, known_size=None, preallocate=preallocate,
+            mirrors=mirrors, checksum=checksum, bandwidth=bandwidth
+        )
+
+    # Persistir estado final do mapa (pausa/restart retomam daqui) e o ajuste do host
+    range_map.flush()
+    controller.remember()
+    await report_parts()
+
+    if writer.error:
+        raise writer.error
+
+    # Verificação de integridade CRÍTICA (pelo mapa: bytes realmente gravados)
+    written_total = range_map.done_bytes
+    if written_total != size:
+        was_cancelled = (stop_event and stop_event.is_set()) or (stop_flag and worker_failure is None)
+
+        if not was_cancelled and worker_failure and failure_resumable:
+            # Retries esgotados: o .tmp e o mapa ficam, o próximo start retoma do que foi gravado
+            log(f"[ERRO] Download segmentado falhou em {written_total}/{size} bytes: {worker_failure}")
+            raise SegmentedDownloadFailed(worker_failure, written_total, size)
         
         if was_cancelled:
-             log(f"[AVISO] Download interrompido pelo usuário. {downloaded_total}/{size} bytes.")
+             log(f"[AVISO] Download interrompido pelo usuário. {written_total}/{size} bytes (mapa salvo para resume).")
              # Não raise Exception se foi cancelado intencionalmente
              return
 
-        error_msg = f"Download incompleto! Baixado: {downloaded_total}, Esperado: {size}"
+        error_msg = f"Download incompleto! Baixado: {written_total}, Esperado: {size}"
         log(f"[ERRO] {error_msg}")
         
         # Limpar arquivo temporário se falhou
         if os.path.exists(temp_path):
             os.remove(temp_path)
+        range_map.remove()
             
         raise Exception(error_msg)
 
+    if checksum:
+        if hash_catchup:
+            await hash_catchup
+        digests = await asyncio.to_thread(checksum.finish, temp_path, size)
+        log(f"[CHECKSUM] {digests}")
+        try:
+            checksum.verify()
+        except ChecksumMismatch as e:
+            # Não há como saber qual range veio errado: descartar tudo
+            log(f"[ERRO] {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            range_map.remove()
+            raise
+
     os.replace(temp_path, dest_path)
+    range_map.remove()
 
     elapsed = time.time() - start_time
-    avg = downloaded_total / elapsed if elapsed > 0 else 0
+    avg = (downloaded_total - base_downloaded) / elapsed if elapsed > 0 else 0
     
     success_msg = f"Concluído UltraMax: {size/1024/1024:.2f} MB em {elapsed:.1f}s ({avg/1024/1024:.1f} MB/s)"
     log(success_msg)
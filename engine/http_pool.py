@@ -0,0 +1,156 @@
+import ssl
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+
+# ============================================================
+# POOL DE CONEXÕES POR HOST (COMPARTILHADO ENTRE JOBS)
+# ============================================================
+
+# Headers de navegador usados por todos os downloads diretos (evita bloqueios de CDN)
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive"
+}
+
+
+class _PooledClient:
+    __slots__ = ("client", "leases", "last_used")
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+
+class HostClientPool:
+    """
+    Um `httpx.AsyncClient` de longa duração por host (esquema + host + porta + verify).
+
+    Probe, download serial e UltraMax do mesmo host pegam o mesmo cliente, então
+    a conexão aberta pelo probe (DNS, TCP, TLS, sessão HTTP/2) é reaproveitada
+    pelo download, e o próximo item da fila no mesmo CDN já encontra conexões
+    quentes. Os contextos SSL também são compartilhados (carregar a cadeia de CAs
+    uma vez só).
+
+    Clientes sem uso há mais de IDLE_TTL segundos e sem empréstimos ativos são
+    fechados pela tarefa de limpeza.
+    """
+
+    IDLE_TTL = 120.0
+    SWEEP_INTERVAL = 30.0
+    MAX_CONNECTIONS_PER_HOST = 200
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, int, bool], _PooledClient] = {}
+        self._ssl_contexts: Dict[bool, object] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(url: str, verify: bool) -> Tuple[str, str, int, bool]:
+        p = urlparse(url)
+        scheme = (p.scheme or "http").lower()
+        port = p.port or (443 if scheme == "https" else 80)
+        return scheme, (p.hostname or "").lower(), port, bool(verify)
+
+    def _ssl_context(self, verify: bool):
+        ctx = self._ssl_contexts.get(verify)
+        if ctx is None:
+            if verify:
+                try:
+                    import certifi  # dependência do httpx: mesma cadeia de CAs que ele usaria
+                    ctx = ssl.create_default_context(cafile=certifi.where())
+                except ImportError:
+                    ctx = ssl.create_default_context()
+            else:
+                ctx = ssl.create_default_context()
+                ctx.check_hostname = False
+                ctx.verify_mode = ssl.CERT_NONE
+            self._ssl_contexts[verify] = ctx
+        return ctx
+
+    def _create(self, verify: bool) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            verify=self._ssl_context(verify),
+            timeout=httpx.Timeout(30, read=300),
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=self.MAX_CONNECTIONS_PER_HOST,
+                keepalive_expiry=300.0
+            ),
+            follow_redirects=True,
+            http2=True,
+            headers=BROWSER_HEADERS
+        )
+
+    def _entry(self, url: str, verify: bool) -> _PooledClient:
+        key = self._key(url, verify)
+        entry = self._clients.get(key)
+        if entry is None or entry.client.is_closed:
+            entry = _PooledClient(self._create(verify))
+            self._clients[key] = entry
+            self._ensure_sweeper()
+        entry.last_used = time.monotonic()
+        return entry
+
+    @asynccontextmanager
+    async def lease(self, url: str, verify: bool = True):
+        """Empresta o cliente do host de `url` enquanto o bloco estiver ativo (não é fechado pela limpeza)."""
+        entry = self._entry(url, verify)
+        entry.leases += 1
+        try:
+            yield entry.client
+        finally:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+
+    # ---------------------- limpeza ----------------------
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            try:
+                self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+            except RuntimeError:
+                self._sweeper = None
+
+    async def _sweep_loop(self):
+        while self._clients:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            await self.evict_idle()
+
+    async def evict_idle(self, ttl: Optional[float] = None):
+        ttl = self.IDLE_TTL if ttl is None else ttl
+        now = time.monotonic()
+        for key, entry in list(self._clients.items()):
+            if entry.leases == 0 and now - entry.last_used >= ttl:
+                self._clients.pop(key, None)
+                try:
+                    await entry.client.aclose()
+                except Exception as e:
+                    print(f"[POOL] Falha ao fechar cliente de {key[1]}: {e}")
+
+    async def close_all(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for entry in clients:
+            try:
+                await entry.client.aclose()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {f"{k[0]}://{k[1]}:{k[2]}": {"leases": e.leases, "idle_s": round(time.monotonic() - e.last_used, 1)}
+                for k, e in self._clients.items()}
+
+
+http_pool = HostClientPool()
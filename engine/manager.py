@@ -1,9 +1,23 @@
 import asyncio
-from typing import Optional, Callable, Dict
-from backend.models.models import Job, Item, JobPart
+from typing import Optional, Callable, Dict, List
+from backend.models.models import Job, Item
 from backend.db import get_session
-from .download import download_serial, download_segmented, supports_range
+from .download import download_serial, download_segmented, supports_range, SegmentedDownloadFailed
+from .range_map import MAP_SUFFIX
+from .checksums import StreamingChecksum, ChecksumMismatch
+from .bandwidth import bandwidth_scheduler, JobBandwidth
+from .probe_cache import probe_cache, remove_validator
+from .prealloc import InsufficientSpace
+from .diskspace import disk_monitor
+from .batch import download_batch, plan_batch_files, BATCH_URL_PREFIX, DEFAULT_BATCH_CONCURRENCY
 from .aria2_wrapper import find_aria2_binary
+from .aria2_rpc import aria2_daemon, download_magnet_rpc
+from .trackers import tracker_registry
+from .torrent_cache import torrent_cache, magnet_infohash
+from .scheduler import JobScheduler, DEFAULT_PRIORITY
+from .concurrency import ConcurrencyTuner
+from .progress_store import ProgressStore
+from .conn_controller import host_tuning
 import os
 from backend import config as backend_config
 import math
@@ -20,13 +34,21 @@ import errno
 
 
 class JobManager:
-    def __init__(self, concurrency: int = 2):
-        self.queue: asyncio.Queue = asyncio.Queue()
-        self.concurrency = concurrency
+    def __init__(self, concurrency: int = 2, preemption: bool = True, max_concurrency: Optional[int] = None,
+                 auto_concurrency: bool = False):
+        self.scheduler = JobScheduler()
+        # Slots de jobs simultâneos: fixo em `concurrency` ou ajustado entre concurrency..max_concurrency
+        self.tuner = ConcurrencyTuner(min_slots=concurrency, max_slots=max_concurrency or concurrency,
+                                      auto=auto_concurrency)
+        self._tuner_task: Optional[asyncio.Task] = None
+        self.progress_store = ProgressStore(interval=backend_config.PROGRESS_FLUSH_INTERVAL)
+        self.preemption = preemption
+        self._preempted: set = set()  # jobs pausados para dar vez a outro: voltam para a fila sozinhos
         self.workers: list[asyncio.Task] = []
         self.running = False
         self._in_memory_progress: Dict[int, dict] = {}
         self._stop_tokens: Dict[int, asyncio.Event] = {}
+        self._bandwidth_weights: Dict[int, float] = {}
         self._cancel_flags: Dict[int, bool] = {}  # Track if job was canceled (not paused)
         self._pause_flags: Dict[int, bool] = {}   # Track if job was explicitly paused (vs canceled)
 
@@ -124,13 +146,47 @@ class JobManager:
             lines.append(tb)
         return "\n".join(lines)
 
+    @property
+    def concurrency(self) -> int:
+        return self.tuner.target()
+
+    def _ensure_workers(self):
+        # Um worker por slot possível; quem não tem slot fica esperando no scheduler
+        while self.running and len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.create_task(self._worker()))
+
+    async def _on_concurrency_change(self):
+        self._ensure_workers()
+        await self.scheduler.wake()
+
     async def start(self):
         if self.running:
             return
         self.running = True
-        for _ in range(self.concurrency):
-            t = asyncio.create_task(self._worker())
-            self.workers.append(t)
+        self.progress_store.start()
+        tracker_registry.start()
+        self._ensure_workers()
+        self._tuner_task = asyncio.create_task(self.tuner.run(
+            self._in_memory_progress, lambda: self.scheduler.running, lambda: len(self.scheduler),
+            self._on_concurrency_change
+        ))
+
+    async def set_concurrency(self, mode: Optional[str] = None, value: Optional[int] = None,
+                              min_slots: Optional[int] = None, max_slots: Optional[int] = None) -> dict:
+        """
+        mode="manual" + value: concorrência fixa; mode="auto": volta ao ajuste automático
+        entre min_slots e max_slots. Aplicado na hora (slots retirados esperam jobs terminarem).
+        """
+        self.tuner.set_bounds(min_slots, max_slots)
+        if mode == "manual":
+            self.tuner.set_override(value or self.concurrency)
+        elif mode == "auto":
+            self.tuner.set_override(None)
+            self.tuner.auto = True
+        print(f"[CONCORRÊNCIA] Configuração: {self.tuner.snapshot()['mode']}, alvo {self.concurrency} "
+              f"(limites {self.tuner.min_slots}-{self.tuner.max_slots})")
+        await self._on_concurrency_change()
+        return self.tuner.snapshot()
 
     async def stop(self):
         self.running = False
@@ -150,28 +206,144 @@ class JobManager:
         except Exception:
             pass
 
+        if self._tuner_task:
+            self._tuner_task.cancel()
+            self._tuner_task = None
         for w in self.workers:
             w.cancel()
         await asyncio.gather(*self.workers, return_exceptions=True)
         self.workers = []
+        # Shutdown: gravar o progresso que ainda estava só na memória
+        await self.progress_store.close()
+        # Daemon aria2: salva a sessão (magnets pausados voltam no próximo start) e encerra
+        await aria2_daemon.shutdown()
+        # Registro de trackers: para o re-probe e grava latência/sucesso acumulados
+        await tracker_registry.close()
+        # Cache de probe e ajuste por host: grava o que ainda não saiu pela gravação adiada
+        await asyncio.to_thread(probe_cache.save)
+        await asyncio.to_thread(host_tuning.save)
+
+    async def enqueue_job(self, job_id: int, priority: Optional[int] = None):
+        if priority is None:
+            priority = await asyncio.to_thread(self._load_priority, job_id)
+        await self.scheduler.push(job_id, priority)
+        self._maybe_preempt()
 
-    async def enqueue_job(self, job_id: int):
-        await self.queue.put(job_id)
+    def _load_priority(self, job_id: int) -> int:
+        session = get_session()
+        try:
+            j = session.get(Job, job_id)
+            return (j.priority if j and j.priority is not None else DEFAULT_PRIORITY)
+        finally:
+            session.close()
+
+    def _maybe_preempt(self):
+        """
+        Todos os slots ocupados e o próximo da fila tem prioridade maior que o pior job
+        rodando: pausar esse job (estado salvo como numa pausa normal) e devolvê-lo à
+        fila quando ele parar. O slot liberado pega o job mais prioritário.
+        """
+        if not self.preemption:
+            return
+        waiting = self.scheduler.peek_priority()
+        if waiting is None:
+            return
+        busy = len(self.scheduler.running) - len(self._preempted)
+        if busy < self.concurrency:
+            return
+        # Só jobs que já criaram o stop_event (um job ainda inicializando perderia o sinal)
+        starting = {jid for jid in self.scheduler.running if jid not in self._stop_tokens}
+        victim = self.scheduler.lowest_running(exclude=self._preempted | starting)
+        if victim is None or victim[1] >= waiting:
+            return
+        job_id, prio = victim
+        print(f"[FILA] Preempção: job {job_id} (prioridade {prio}) pausado para dar vez a prioridade {waiting}")
+        self.stop_job(job_id, pause=True)
+        self._preempted.add(job_id)
+
+    async def set_priority(self, job_id: int, priority: int) -> bool:
+        """Persiste a prioridade, reordena a fila e preempta se for o caso. False se o job não existe."""
+        def _save():
+            session = get_session()
+            try:
+                j = session.get(Job, job_id)
+                if not j:
+                    return False
+                j.priority = priority
+                session.add(j)
+                session.commit()
+                return True
+            finally:
+                session.close()
+
+        if not await asyncio.to_thread(_save):
+            return False
+        self.scheduler.reprioritize(job_id, priority)
+        self._maybe_preempt()
+        return True
+
+    def queue_snapshot(self) -> dict:
+        snap = self.scheduler.snapshot()
+        snap["concurrency"] = self.concurrency
+        snap["concurrency_tuning"] = self.tuner.snapshot()
+        snap["preemption"] = self.preemption
+        for r in snap["running"]:
+            r["preempting"] = r["job_id"] in self._preempted
+        return snap
+
+    def _requeue_preempted(self, job_id: int) -> Optional[int]:
+        """Job preemptado terminou a pausa: volta para 'queued'. Retorna a prioridade (None se não deve voltar)."""
+        session = get_session()
+        try:
+            j = session.get(Job, job_id)
+            if not j or j.status != "paused" or j.status_reason:
+                # Concluiu/falhou antes de parar, ou foi pausado por outro motivo (ex: falta de espaço)
+                return None
+            j.status = "queued"
+            j.status_reason = "preempted"
+            j.updated_at = datetime.now()
+            session.add(j)
+            session.commit()
+            return j.priority if j.priority is not None else DEFAULT_PRIORITY
+        finally:
+            session.close()
+
+    def _still_queued(self, job_id: int) -> bool:
+        # Pausado/cancelado enquanto esperava na fila: não iniciar
+        session = get_session()
+        try:
+            j = session.get(Job, job_id)
+            return bool(j) and j.status in ("queued", "running")
+        finally:
+            session.close()
 
     async def _worker(self):
         while self.running:
             try:
-                job_id = await self.queue.get()
+                job_id, priority = await self.scheduler.pop(capacity=lambda: self.concurrency)
             except asyncio.CancelledError:
                 break
             try:
+                if not await asyncio.to_thread(self._still_queued, job_id):
+                    print(f"[FILA] Job {job_id} saiu da fila (não está mais 'queued')")
+                    continue
                 await self._run_job(job_id)
             except Exception as e:
                 import traceback
                 traceback.print_exc()
                 print(f"Job failed: {e}")
             finally:
-                self.queue.task_done()
+                await self.scheduler.finish(job_id)
+                if job_id in self._preempted:
+                    self._preempted.discard(job_id)
+                    self._pause_flags.pop(job_id, None)
+                    try:
+                        prio = await asyncio.to_thread(self._requeue_preempted, job_id)
+                        if prio is not None and self.running:
+                            await self.scheduler.push(job_id, prio)
+                            print(f"[FILA] Job {job_id} devolvido à fila (prioridade {prio})")
+                    except Exception as e:
+                        print(f"[WARN] Falha ao devolver job {job_id} à fila: {e}")
 
     async def _run_job(self, job_id: int):
         # fetch job & item
@@ -253,6 +425,11 @@ class JobManager:
             filename = sanitize_filename(raw_name) or f"job_{job_id}"
             dest_path = os.path.join(dest, filename)
             dest_to_save = dest_path
+        elif url.startswith(BATCH_URL_PREFIX):
+            # Lote: uma pasta com o nome do item, arquivos dentro
+            folder = sanitize_filename(it.name) or f"batch_{job_id}"
+            dest_path = os.path.join(dest, folder)
+            dest_to_save = dest_path
         else:
             if is_custom_name:
                 # Criar pasta com nome customizado, arquivo original dentro
@@ -286,7 +463,9 @@ class JobManager:
         print(f"Dest: {dest_path}")
 
         # Se arquivo já existe, criar novo nome (não sobrescrever)
-        if os.path.exists(dest_path) and not url.startswith("magnet:"):
+        # Lote já iniciado: a pasta existente é o próprio resume
+        batch_resume = url.startswith(BATCH_URL_PREFIX) and (j.downloaded or 0) > 0
+        if os.path.exists(dest_path) and not url.startswith("magnet:") and not batch_resume:
             base, ext = os.path.splitext(dest_path)
             counter = 1
             while os.path.exists(f"{base}_{counter}{ext}"):
@@ -326,8 +505,8 @@ class JobManager:
             if phase_progress is not None:
                 info["phase_progress"] = phase_progress
             self._in_memory_progress[job_id] = info
-            # update DB periodically (less frequently to minimize writes)
-            await asyncio.to_thread(self._update_job_db, job_id, p, downloaded=downloaded, total=total)
+            # Banco: só marca como sujo; o ProgressStore grava todos os jobs numa transação a cada ciclo
+            self.progress_store.update(job_id, p, downloaded=downloaded, total=total)
 
             # CRITICAL FIX: Hot-update job destination if aria2 discovered the REAL path (Online-Fix fix)
             if real_path and j.dest != real_path:
@@ -341,39 +520,52 @@ class JobManager:
                     print(f"WARN: Could not update real path in DB: {e}")
 
             # Backend-side emergency stop if size explodes (e.g. metadata resolved)
-            # Check every ~5 seconds or if total size significantly increases
+            # O monitor de disco é compartilhado: livre do volume em cache, menos o que os outros jobs ainda vão escrever
+            disk_monitor.update(job_id, downloaded=downloaded, total=total)
             last_disk_check = info.get("last_disk_check", 0)
-            if total > 0 and (now_ts - last_disk_check > 5.0 or total > info.get("last_checked_total", 0) * 1.1):
+            if total > 0 and not info.get("disk_blocked") and (
+                    now_ts - last_disk_check >= disk_monitor.TTL or total > info.get("last_checked_total", 0) * 1.1):
                 info["last_disk_check"] = now_ts
                 info["last_checked_total"] = total
                 try:
-                    import shutil
-                    from pathlib import Path
-                    # Use dest or fallback to downloads dir
-                    check_p = dest or str(Path.home() / "Downloads")
-                    if os.path.exists(check_p):
-                        _, _, free = shutil.disk_usage(check_p)
-                        # Threshold: Exact remaining size (user requested no margin after metadata resolution)
-                        needed_to_finish = total - downloaded
-                        if free < needed_to_finish:
-                            print(f"[BLOQUEIO-BACKEND] Job {job_id} pausado por falta de espaço real: Restante={needed_to_finish}, Free={free}")
-                            try:
-                                # Usar a própria sessão do loop se possível para evitar conflitos
-                                j.status_reason = "insufficient_space"
-                                j.size = total
-                                j.free_space_at_pause = free
-                                session.add(j)
-                                session.commit()
-                                print(f"[OK] Job {job_id} bloqueado com sucesso (Salvo: Free={free})")
-                            except Exception as db_err:
-                                print(f"[DiskCheck-DB-Error] Ocorreu um erro ao salvar o bloqueio: {db_err}")
+                    missing, needed_to_finish, free = disk_monitor.shortfall(job_id)
+                    # Threshold: Exact remaining size (user requested no margin after metadata resolution)
+                    if missing > 0:
+                        info["disk_blocked"] = True
+                        print(f"[BLOQUEIO-BACKEND] Job {job_id} pausado por falta de espaço real: Restante={needed_to_finish}, Free={free}")
+                        try:
+                            # Usar a própria sessão do loop se possível para evitar conflitos
+                            j.status_reason = "insufficient_space"
+                            j.size = total
+                            j.free_space_at_pause = free
+                            session.add(j)
+                            session.commit()
+                            print(f"[OK] Job {job_id} bloqueado com sucesso (Salvo: Free={free})")
+                        except Exception as db_err:
+                            print(f"[DiskCheck-DB-Error] Ocorreu um erro ao salvar o bloqueio: {db_err}")
                             
-                            # Use o mesmo fluxo de parada que o usuário usaria manualmente
-                            self.stop_job(job_id, pause=True)
+                        # Use o mesmo fluxo de parada que o usuário usaria manualmente
+                        self.stop_job(job_id, pause=True)
                 except Exception as e:
                     print(f"[DiskCheck-Error] {e}")
 
+        # Fatia de banda do job (teto próprio + divisão justa do teto global)
+        bw = bandwidth_scheduler.register(job_id, limit=j.limit_bandwidth, weight=self._bandwidth_weights.get(job_id, 1.0))
+        keep_partial = False  # falha de rede retomável: .tmp e mapa de ranges ficam para o próximo start
+        if bw.limited:
+            print(f"[BANDA] Job #{job_id} limitado a {bw.rate/1024/1024:.2f} MB/s")
+
         try:
+            # Admissão: o que falta baixar precisa caber no livre do volume menos o que os outros jobs ainda vão escrever
+            known_size = it.size or j.size
+            if not known_size and url.startswith("magnet:"):
+                # Magnet já resolvido antes: tamanho do .torrent em cache (reserva e progresso desde o início)
+                known_size = torrent_cache.total_size(magnet_infohash(url))
+            disk_monitor.reserve(job_id, dest_path, total=known_size, downloaded=j.downloaded or 0)
+            missing, needed, available = disk_monitor.shortfall(job_id)
+            if missing > 0:
+                raise InsufficientSpace(dest_path, needed, available)
+
             if url.startswith("magnet:"):
                 # detect aria2 binary (prefer backend config path)
                 from backend import config as backend_config
@@ -399,22 +591,40 @@ class JobManager:
                     session.close()
                     return
 
-                # Download magnet using aria2 CLI (not RPC)
+                # Download magnet: daemon aria2 compartilhado (RPC); CLI por job se o daemon não subir
                 from .aria2_wrapper import download_magnet_cli
 
                 try:
-                    result = await download_magnet_cli(
-                        url,
-                        dest_path,
-                        progress_cb=progress_cb,
-                        stop_event=stop_event,
-                        aria2_path=aria_path,
-                        project_root=project_root,
-                        total_size_hint=it.size,  # Pass item's known size
-                        job_id=job_id,  # Pass job_id to track cancel vs pause
-                        job_manager=self  # Pass job_manager to check cancel status
-                    )
+                    if backend_config.ARIA2_RPC and await aria2_daemon.ensure(aria_path):
+                        result = await download_magnet_rpc(
+                            url,
+                            dest_path,
+                            aria2_daemon,
+                            progress_cb=progress_cb,
+                            stop_event=stop_event,
+                            total_size_hint=known_size,
+                            job_id=job_id,
+                            job_manager=self,
+                            max_download_limit=bandwidth_scheduler.rate_for(job_id),
+                            bandwidth=bw
+                        )
+                    else:
+                        result = await download_magnet_cli(
+                            url,
+                            dest_path,
+                            progress_cb=progress_cb,
+                            stop_event=stop_event,
+                            aria2_path=aria_path,
+                            project_root=project_root,
+                            total_size_hint=known_size,  # Pass item's known size
+                            job_id=job_id,  # Pass job_id to track cancel vs pause
+                            job_manager=self,  # Pass job_manager to check cancel status
+                            max_download_limit=bandwidth_scheduler.rate_for(job_id)
+                        )
                     
+                    # Progresso pendente vai para o banco antes do status final (nunca depois dele)
+                    await self.progress_store.flush([job_id])
+
                     # Result is now a tuple (final_path, status)
                     if isinstance(result, tuple):
                         final_path, download_status = result
@@ -521,18 +731,33 @@ class JobManager:
                 # other urls: use size from item if available, otherwise discover
                 size = it.size if it.size and it.size > 0 else None
                 accept_range = True  # Assume support unless proven otherwise
+                mirrors = None
+                if getattr(it, "mirrors", None):
+                    try:
+                        mirrors = json.loads(it.mirrors)
+                    except Exception:
+                        mirrors = None
+                checksum = self._new_checksum(it)
                 
+                if url.startswith(BATCH_URL_PREFIX):
+                    # Lote de arquivos pequenos: um job, conexões compartilhadas
+                    await self._download_batch_job(j, it, dest_path, progress_cb, stop_event, bw)
                 # Try segmented first if size is known and large enough
-                if size and size > 1_000_000:
+                elif size and size > 1_000_000:
                     # Start download immediately with segmented (even before confirming range support)
                     k = j.k or 4
                     n_conns = j.n_conns or 4
                     try:
-                        await self._download_segmented_job(j, url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl)
+                        await self._download_segmented_job(j, url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl, mirrors=mirrors, checksum=checksum, bandwidth=bw)
+                    except (ChecksumMismatch, InsufficientSpace, SegmentedDownloadFailed):
+                        # SegmentedDownloadFailed: rede falhou depois dos retries; o .tmp/mapa ficam para o
+                        # resume (cair no serial jogaria fora o que já foi baixado)
+                        raise
                     except Exception as e:
                         # Segmented failed (maybe no range support), fall back to serial
                         print(f"Segmented failed ({e}), falling back to serial download...")
-                        await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl)
+                        checksum = self._new_checksum(it)
+                        await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl, checksum=checksum, bandwidth=bw, stop_event=stop_event)
                 else:
                     # Size unknown or too small - discover it
                     info = await supports_range(url, verify=j.verify_ssl)
@@ -542,8 +767,8 @@ class JobManager:
                         error_msg = info.get('error', f"HTTP {info.get('status_code')}")
                         print(f"[WARN] Falha ao verificar suporte a range: {error_msg}. Tentando download serial...")
                         # Fallback to serial download (more robust for problematic servers)
-                        result = await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl)
-                        if result is None:
+                        result = await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl, checksum=checksum, bandwidth=bw, stop_event=stop_event)
+                        if result is None and not stop_event.is_set():
                             raise Exception(f"Download serial falhou: {error_msg}")
                     else:
                         size = info.get("size")
@@ -553,11 +778,13 @@ class JobManager:
                             # segmented - use job configured k/n_conns
                             k = j.k or 4
                             n_conns = j.n_conns or 4
-                            await self._download_segmented_job(j, url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl)
+                            await self._download_segmented_job(j, url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl, mirrors=mirrors, checksum=checksum, bandwidth=bw)
                         else:
-                            result = await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl)
-                            if result is None:
+                            result = await download_serial(url, dest_path, progress_cb=progress_cb, resume=j.resume_on_start, verify=j.verify_ssl, checksum=checksum, bandwidth=bw, stop_event=stop_event)
+                            if result is None and not stop_event.is_set():
                                 raise Exception("Download serial falhou sem erro específico")
+                # Progresso pendente vai para o banco antes do status final (nunca depois dele)
+                await self.progress_store.flush([job_id])
                 # check if stop was requested
                 if stop_event and stop_event.is_set():
                     j.status = "paused"
@@ -576,6 +803,8 @@ class JobManager:
                     j.status = "completed"
                     j.dest = dest_to_save
                     print(f"[DEBUG] Finalizing job.dest = {dest_to_save}")
+                    if checksum and checksum.digests:
+                        j.checksums = json.dumps(checksum.digests)
                     
                     # Update size on completion
                     try:
@@ -597,12 +826,40 @@ class JobManager:
                     j.progress = 100.0
                     session.add(j)
                     session.commit()
-                
-                j.progress = 100.0
-                j.updated_at = datetime.now()
-                j.completed_at = datetime.now()
-                session.add(j)
-                session.commit()
+
+                if j.status == "paused":
+                    # Pausado (usuário ou preempção): progresso real fica, sem data de conclusão
+                    j.updated_at = datetime.now()
+                    session.add(j)
+                    session.commit()
+        except InsufficientSpace as e:
+            # Sem espaço para o arquivo inteiro (checado antes de baixar): mesmo bloqueio do monitor de disco,
+            # o job fica pausado com o motivo e pode ser retomado depois de liberar espaço
+            print(f"[BLOQUEIO-BACKEND] Job {job_id} pausado antes de baixar: {e}")
+            try:
+                session.refresh(j)
+            except Exception:
+                pass
+            j.status = "paused"
+            j.status_reason = "insufficient_space"
+            j.free_space_at_pause = e.free
+            j.last_error = str(e)
+            j.updated_at = datetime.now()
+            session.add(j)
+            session.commit()
+        except SegmentedDownloadFailed as e:
+            print(f"[ERRO] Job {job_id}: {e}")
+            keep_partial = True
+            try:
+                session.refresh(j)
+            except Exception:
+                pass
+            j.status = "failed"
+            j.last_error = str(e)
+            j.dest = dest_to_save
+            j.updated_at = datetime.now()
+            session.add(j)
+            session.commit()
         except Exception as e:
             # record failure
             import traceback
@@ -629,15 +886,22 @@ class JobManager:
                 pass
         finally:
             # cleanup
+            # Falha/cancelamento: último progresso conhecido ainda vai para o banco
+            await self.progress_store.flush([job_id])
+            self.progress_store.drop_parts(job_id)
+            disk_monitor.release(job_id)
+            bandwidth_scheduler.unregister(job_id)
             if job_id in self._stop_tokens:
                 del self._stop_tokens[job_id]
             # Remove from memory progress
             if job_id in self._in_memory_progress:
+                # Bytes desde a última amostra do tuner ainda contam na vazão agregada
+                self.tuner.job_finished(job_id, self._in_memory_progress[job_id].get("downloaded") or 0)
                 del self._in_memory_progress[job_id]
             
             # CRITICAL: Only cleanup partial files if NOT paused
             # If paused, we MUST preserve .aria2 metadata for resume!
-            should_cleanup = True
+            should_cleanup = not keep_partial
             try:
                 session = get_session()
                 j = session.get(Job, job_id)
@@ -656,6 +920,8 @@ class JobManager:
                     await self._cleanup_partial_files(dest_to_save, job_id)
                 except Exception as e:
                     print(f"[WARN] Error during final cleanup: {e}")
+            elif keep_partial:
+                print(f"[RESUME] Progresso parcial preservado: o próximo start retoma do mapa de ranges")
             else:
                 print(f"[PAUSE] Metadata preserved: download can be resumed later")
 
@@ -664,15 +930,20 @@ class JobManager:
         import shutil
         
         try:
-            # Clean up .part file if exists
+            # Clean up .part file if exists (+ .part.meta resume validator)
             if os.path.exists(dest_path + ".part"):
                 os.remove(dest_path + ".part")
                 print(f"[OK] Removed partial file: {dest_path}.part")
+            remove_validator(dest_path + ".part")
             
-            # Direct Download Engine uses .tmp
+            # Direct Download Engine uses .tmp (+ .tmp.ranges resume map)
             if os.path.exists(dest_path + ".tmp"):
                 os.remove(dest_path + ".tmp")
                 print(f"[OK] Removed temporary file: {dest_path}.tmp")
+            for map_file in (dest_path + ".tmp" + MAP_SUFFIX, dest_path + ".tmp" + MAP_SUFFIX + ".new"):
+                if os.path.exists(map_file):
+                    os.remove(map_file)
+                    print(f"[OK] Removed resume map: {map_file}")
 
             # Also check for .part.tmp (rare edge case)
             if os.path.exists(dest_path + ".part.tmp"):
@@ -739,7 +1010,42 @@ class JobManager:
         except Exception as e:
             print(f"[WARN] Error in deep metadata cleanup: {e}")
 
-    async def _download_segmented_job(self, job: Job, url: str, dest_path: str, k: int, n_conns: int, progress_cb: Optional[Callable], resume: bool = True, verify: bool = True):
+    async def _download_batch_job(self, job: Job, item: Item, dest_dir: str, progress_cb: Optional[Callable], stop_event: asyncio.Event, bandwidth: Optional[JobBandwidth] = None):
+        """Lote de arquivos pequenos: cada arquivo vira um JobPart (progresso por arquivo) no mesmo job."""
+        try:
+            files = plan_batch_files(json.loads(item.batch_files or "[]"))
+        except Exception as e:
+            raise Exception(f"Lista de arquivos do lote inválida: {e}")
+        if not files:
+            raise Exception("Lote sem arquivos")
+
+        await self.progress_store.ensure_parts(job.id, [
+            dict(index=i, size=f["size"], path=os.path.join(dest_dir, f["name"])) for i, f in enumerate(files)
+        ])
+
+        async def on_file_progress(index, downloaded, size, status):
+            # Só memória: o ProgressStore grava as partes junto com o progresso do job
+            self.progress_store.update_part(job.id, index, downloaded=downloaded, size=size, status=status)
+
+        algorithms = getattr(backend_config, "CHECKSUM_ALGORITHMS", [])
+        await download_batch(files, dest_dir, progress_cb=progress_cb, on_file_progress=on_file_progress,
+                             stop_event=stop_event, verify=job.verify_ssl, concurrency=job.n_conns or DEFAULT_BATCH_CONCURRENCY,
+                             bandwidth=bandwidth, checksum_algorithms=algorithms)
+
+    def _new_checksum(self, item: Item) -> Optional[StreamingChecksum]:
+        """Checksum em streaming para downloads diretos (algoritmos do config + os que a fonte informa)."""
+        expected = {}
+        if getattr(item, "checksums", None):
+            try:
+                expected = json.loads(item.checksums) or {}
+            except Exception:
+                expected = {}
+        algorithms = getattr(backend_config, "CHECKSUM_ALGORITHMS", [])
+        if not algorithms and not expected:
+            return None
+        return StreamingChecksum(algorithms, expected=expected)
+
+    async def _download_segmented_job(self, job: Job, url: str, dest_path: str, k: int, n_conns: int, progress_cb: Optional[Callable], resume: bool = True, verify: bool = True, mirrors: Optional[List[str]] = None, checksum: Optional[StreamingChecksum] = None, bandwidth: Optional[JobBandwidth] = None):
         session = get_session()
         
         # Get size from item if available
@@ -750,53 +1056,25 @@ class JobManager:
         
         session.close()
         
-        # Create parts in background (don't block download)
-        async def create_parts_async():
+        # Partes: um select + um insert em lote, depois ficam na memória do ProgressStore
+        if size and size > 1_000_000:  # Skip part creation for small files
             try:
-                if not size or size <= 1_000_000:
-                    return  # Skip part creation for small files
-                    
-                session = get_session()
                 part_size = math.ceil(size / k)
+                specs = []
                 for i in range(k):
                     s = i * part_size
                     e = min((i + 1) * part_size - 1, size - 1)
-                    existing = session.exec(
-                        select(JobPart).where(
-                            (JobPart.job_id == job.id) & (JobPart.index == i)
-                        )
-                    ).one_or_none()
-                    
-                    if not existing:
-                        p = JobPart(
-                            job_id=job.id, 
-                            index=i, 
-                            start=s, 
-                            end=e, 
-                            downloaded=0, 
-                            path=os.path.join(dest_path + ".parts", f"part_{i}"), 
-                            size=(e - s + 1), 
-                            status="pending"
-                        )
-                        session.add(p)
-                session.commit()
+                    specs.append(dict(index=i, start=s, end=e, size=(e - s + 1),
+                                      path=os.path.join(dest_path + ".parts", f"part_{i}")))
+                await self.progress_store.ensure_parts(job.id, specs)
                 print(f" Created {k} JobParts for segmented download (total size: {size} bytes)")
-                session.close()
             except Exception as e:
                 print(f"Error creating JobParts: {e}")
         
-        # Start creating parts in background immediately
-        asyncio.create_task(create_parts_async())
-        
-        # Start download immediately without waiting for parts creation
-        await self._start_download(job, url, dest_path, size, k, n_conns, progress_cb, resume, verify)
+        await self._start_download(job, url, dest_path, size, k, n_conns, progress_cb, resume, verify, mirrors, checksum, bandwidth)
 
-    async def _start_download(self, job: Job, url: str, dest_path: str, size: Optional[int], k: int, n_conns: int, progress_cb: Optional[Callable], resume: bool, verify: bool):
+    async def _start_download(self, job: Job, url: str, dest_path: str, size: Optional[int], k: int, n_conns: int, progress_cb: Optional[Callable], resume: bool, verify: bool, mirrors: Optional[List[str]] = None, checksum: Optional[StreamingChecksum] = None, bandwidth: Optional[JobBandwidth] = None):
         """Start the actual download immediately"""
-        session = get_session()
-        jp_list = session.exec(select(JobPart).where(JobPart.job_id == job.id)).all()
-        session.close()
-        
         # PERF: Skip HEAD if size is already known (avoid 3s timeout wait)
         if not size:
             try:
@@ -813,79 +1091,61 @@ class JobManager:
 
 
         # perform segmented download using underlying engine.download functions and update DB accordingly
+        # O engine reporta bytes gravados por parte a partir do mapa de ranges (inclui o que veio do resume)
         async def on_part_progress(index, downloaded_bytes, part_total):
-            # update JobPart downloaded size in DB
-            try:
-                session_up = get_session()
-                part = session_up.exec(select(JobPart).where((JobPart.job_id == job.id) & (JobPart.index == index))).one_or_none()
-                if part:
-                    part.downloaded = min(downloaded_bytes, part.size or downloaded_bytes)
-                    if downloaded_bytes >= (part.size or 0) if part.size else False:
-                        part.status = "completed"
-                    else:
-                        part.status = "running"
-                    part.updated_at = datetime.utcnow()
-                    session_up.add(part)
-                    session_up.commit()
-            except Exception as e:
-                print(f"Error updating JobPart progress: {e}")
-            finally:
-                try:
-                    session_up.close()
-                except Exception:
-                    pass
+            # Só memória: o ProgressStore grava as partes em lote junto com o progresso do job
+            if part_total and downloaded_bytes >= part_total:
+                status = "completed"
+            elif downloaded_bytes > 0:
+                status = "running"
+            else:
+                status = "pending"
+            self.progress_store.update_part(job.id, index, downloaded=downloaded_bytes, status=status)
 
         stop_event = self._stop_tokens.get(job.id)
         try:
-            await download_segmented(url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, on_part_progress=on_part_progress, resume=resume, stop_event=stop_event, verify=verify, known_size=size)
+            await download_segmented(url, dest_path, k=k, n_conns=n_conns, progress_cb=progress_cb, on_part_progress=on_part_progress, resume=resume, stop_event=stop_event, verify=verify, known_size=size, mirrors=mirrors, checksum=checksum, bandwidth=bandwidth)
         except Exception as e:
             print(f" Segmented download failed: {e}")
             # Mark all parts as failed
-            session = get_session()
-            parts = session.exec(select(JobPart).where(JobPart.job_id == job.id)).all()
-            for p in parts:
-                p.status = "failed"
-                session.add(p)
-            session.commit()
-            session.close()
+            self.progress_store.set_parts_status(job.id, "failed")
+            await self.progress_store.flush([job.id])
             raise
-        
-        # update JobParts DB: mark as downloaded
-        session = get_session()
-        parts = session.exec(select(JobPart).where(JobPart.job_id == job.id)).all()
-        for p in parts:
-            p.downloaded = p.size
-            p.status = "completed"
-            p.updated_at = datetime.utcnow()
-            session.add(p)
-        session.commit()
-        session.close()
-        print(f" All JobParts marked as completed")
 
-    def _update_job_db(self, job_id, progress, downloaded=None, total=None):
-        session = get_session()
-        j = session.get(Job, job_id)
-        if not j:
+        # Pausado/cancelado: manter o estado reportado pelo mapa de ranges para o resume
+        if stop_event and stop_event.is_set():
+            print(f" Segmented download stopped, JobParts keep partial progress for resume")
             return
-        if progress is not None:
-            j.progress = progress
-        if downloaded is not None:
-            j.downloaded = downloaded
-        if total is not None and total > 0:
-            j.size = total
-        j.updated_at = datetime.now()
-        session.add(j)
-        session.commit()
-        try:
-            session.close()
-        except Exception:
-            pass
+        
+        # update JobParts: mark as downloaded (gravado no flush antes do status final)
+        self.progress_store.set_parts_status(job.id, "completed", complete=True)
+        print(f" All JobParts marked as completed")
 
     def get_progress(self, job_id: int) -> dict:
         return self._in_memory_progress.get(job_id, {})
 
+    def set_bandwidth(self, job_id: int, limit: Optional[int] = None, weight: Optional[float] = None):
+        """Atualiza teto (bytes/s, 0/None = sem teto) e peso do job; vale na hora se ele estiver rodando."""
+        if limit is not None:
+            session = get_session()
+            try:
+                j = session.get(Job, job_id)
+                if j:
+                    j.limit_bandwidth = limit if limit > 0 else None
+                    session.add(j)
+                    session.commit()
+            finally:
+                session.close()
+            bandwidth_scheduler.set_job_limit(job_id, limit)
+        if weight is not None:
+            self._bandwidth_weights[job_id] = weight
+            bandwidth_scheduler.set_job_weight(job_id, weight)
+
     def stop_job(self, job_id: int, cancel: bool = False, pause: bool = False):
         """Stop a job. If cancel=True, mark as canceled. If pause=True, mark as paused."""
+        # Ainda na fila: sai dela. Pausa/cancelamento explícito também anula uma preempção em curso
+        self.scheduler.remove(job_id)
+        self._preempted.discard(job_id)
         e = self._stop_tokens.get(job_id)
         if not e:
             e = asyncio.Event()
@@ -905,4 +1165,9 @@ class JobManager:
         return self._pause_flags.get(job_id, False)
 
 
-job_manager = JobManager(concurrency=1)
+job_manager = JobManager(
+    concurrency=backend_config.JOB_CONCURRENCY_MIN,
+    max_concurrency=backend_config.JOB_CONCURRENCY_MAX,
+    auto_concurrency=backend_config.JOB_CONCURRENCY_AUTO,
+    preemption=backend_config.JOB_PREEMPTION,
+)
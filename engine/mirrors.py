@@ -0,0 +1,135 @@
+import time
+import random
+from typing import Optional, List
+from urllib.parse import urlparse
+
+
+# ============================================================
+# MULTI-MIRROR (UM ARQUIVO, VÁRIAS URIs)
+# ============================================================
+
+def normalize_mirrors(url: str, mirrors: Optional[List[str]] = None) -> List[str]:
+    """URL principal primeiro, depois mirrors http(s) sem duplicatas."""
+    out = [url]
+    for m in mirrors or []:
+        if not isinstance(m, str):
+            continue
+        m = m.strip()
+        if m and m not in out and m.lower().startswith(("http://", "https://")):
+            out.append(m)
+    return out
+
+
+class Mirror:
+    __slots__ = ("url", "host", "ewma_speed", "bytes", "errors", "consecutive_errors", "in_use", "disabled", "disabled_reason",
+                 "retry_at")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.host = (urlparse(url).hostname or "").lower()
+        self.ewma_speed: Optional[float] = None  # bytes/s por conexão
+        self.bytes = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.in_use = 0
+        self.disabled = False
+        self.disabled_reason: Optional[str] = None
+        self.retry_at = 0.0  # backoff: nenhum worker pede a este host antes disso
+
+    def score(self, best_known: float) -> float:
+        # Mirror ainda não medido recebe nota otimista para ser experimentado
+        speed = self.ewma_speed if self.ewma_speed is not None else max(best_known, 1.0) * 1.5
+        penalty = 1.0 + 2.0 * self.consecutive_errors + 0.25 * self.errors
+        # Dividir pela carga atual espalha conexões entre mirrors (agrega banda)
+        return speed / penalty / (1 + self.in_use)
+
+
+class MirrorPool:
+    """
+    Escolhe de qual mirror cada range vai ser baixado.
+
+    A nota de cada mirror é a vazão por conexão observada (EWMA), penalizada por
+    erros e dividida pelas conexões que já estão nele. Depois de MAX_CONSECUTIVE_ERRORS
+    falhas seguidas o mirror é desativado (a não ser que seja o último disponível),
+    então o trabalho migra para os outros no meio do download.
+    """
+
+    MAX_CONSECUTIVE_ERRORS = 3
+    EWMA_ALPHA = 0.3
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30.0
+
+    def __init__(self, urls: List[str]):
+        self.mirrors = [Mirror(u) for u in urls]
+
+    def __len__(self):
+        return len([m for m in self.mirrors if not m.disabled])
+
+    @property
+    def primary(self) -> Mirror:
+        return self.mirrors[0]
+
+    def pick(self, avoid: Optional[Mirror] = None) -> Mirror:
+        active = [m for m in self.mirrors if not m.disabled] or [self.primary]
+        if avoid is not None and len(active) > 1:
+            active = [m for m in active if m is not avoid] or active
+        best_known = max((m.ewma_speed or 0.0) for m in self.mirrors)
+        return max(active, key=lambda m: m.score(best_known))
+
+    def acquire(self, avoid: Optional[Mirror] = None) -> Mirror:
+        m = self.pick(avoid)
+        m.in_use += 1
+        return m
+
+    def release(self, mirror: Mirror):
+        mirror.in_use = max(0, mirror.in_use - 1)
+
+    def report_transfer(self, mirror: Mirror, nbytes: int, seconds: float):
+        if nbytes <= 0 or seconds <= 0:
+            return
+        speed = nbytes / seconds
+        mirror.bytes += nbytes
+        mirror.consecutive_errors = 0
+        if mirror.ewma_speed is None:
+            mirror.ewma_speed = speed
+        else:
+            mirror.ewma_speed = self.EWMA_ALPHA * speed + (1 - self.EWMA_ALPHA) * mirror.ewma_speed
+
+    def report_failure(self, mirror: Mirror, reason: str = ""):
+        mirror.errors += 1
+        mirror.consecutive_errors += 1
+        if mirror.consecutive_errors >= self.MAX_CONSECUTIVE_ERRORS:
+            self.disable(mirror, reason or f"{mirror.consecutive_errors} falhas seguidas")
+
+    def backoff(self, mirror: Mirror) -> float:
+        """
+        Agenda a próxima tentativa no host depois de uma falha: exponencial nas falhas
+        seguidas (zera com a primeira transferência boa), com jitter para que os workers
+        que falharam juntos não voltem todos no mesmo instante. Vale para todos os
+        workers do host, não só para quem falhou.
+        """
+        streak = min(max(1, mirror.consecutive_errors), 16)
+        ceiling = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (streak - 1))
+        delay = random.uniform(ceiling / 2, ceiling)
+        mirror.retry_at = max(mirror.retry_at, time.time() + delay)
+        return delay
+
+    def wait_time(self, mirror: Mirror) -> float:
+        return max(0.0, mirror.retry_at - time.time())
+
+    def disable(self, mirror: Mirror, reason: str):
+        if mirror.disabled:
+            return
+        others = [m for m in self.mirrors if not m.disabled and m is not mirror]
+        if not others:
+            return  # nunca desativar o último mirror
+        mirror.disabled = True
+        mirror.disabled_reason = reason
+        print(f"[MIRROR] Desativado {mirror.host}: {reason}")
+
+    def summary(self) -> str:
+        parts = []
+        for m in self.mirrors:
+            state = "off" if m.disabled else f"{(m.ewma_speed or 0)/1024/1024:.1f}MB/s"
+            parts.append(f"{m.host}={m.bytes/1024/1024:.0f}MB({state},err={m.errors})")
+        return " | ".join(parts)
@@ -0,0 +1,99 @@
+import os
+import sys
+import errno
+import ctypes
+import ctypes.util
+
+from .diskspace import disk_monitor
+
+
+# ============================================================
+# PRÉ-ALOCAÇÃO DO ARQUIVO TEMPORÁRIO (ULTRAMAX)
+# ============================================================
+
+class InsufficientSpace(OSError):
+    """Não há espaço livre para o arquivo inteiro (detectado antes de baixar)."""
+
+    def __init__(self, path: str, needed: int, free: int):
+        super().__init__(errno.ENOSPC, f"Espaço insuficiente para {os.path.basename(path)}: "
+                                       f"faltam {(needed - free)/1024/1024:.1f} MB "
+                                       f"(necessário {needed/1024/1024:.1f} MB, livre {free/1024/1024:.1f} MB)")
+        self.path = path
+        self.needed = needed
+        self.free = free
+
+
+_libc = None
+
+
+def _linux_fallocate():
+    """fallocate(2) direto da libc: ao contrário do posix_fallocate da glibc, não emula escrevendo zeros."""
+    global _libc
+    if _libc is None:
+        try:
+            lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fn = lib.fallocate
+            fn.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+            fn.restype = ctypes.c_int
+            _libc = fn
+        except Exception:
+            _libc = False
+    return _libc or None
+
+
+def allocated_bytes(path: str) -> int:
+    """Bytes já reservados em disco para o arquivo (blocos reais, não o tamanho aparente)."""
+    try:
+        st = os.stat(path)
+        blocks = getattr(st, "st_blocks", None)
+        return blocks * 512 if blocks is not None else st.st_size
+    except OSError:
+        return 0
+
+
+def ensure_free_space(path: str, size: int, reserve: int = 0):
+    """
+    Levanta InsufficientSpace se o volume não comporta o que falta alocar para `path` (+ margem).
+    O livre considerado já desconta o que os outros jobs ativos do volume ainda vão escrever.
+    """
+    free = disk_monitor.net_free(path, exclude_path=path)
+    needed = max(0, size - allocated_bytes(path)) + reserve
+    if free < needed:
+        raise InsufficientSpace(path, needed, free)
+
+
+def preallocate_file(path: str, size: int) -> str:
+    """
+    Reserva `size` bytes para `path` de uma vez.
+
+    - Linux: fallocate(2) — extents contíguos, sem escrever zeros; ENOSPC aparece
+      aqui, no início, e não no meio do download.
+    - Sistema de arquivos sem suporte (EOPNOTSUPP) ou outro SO: arquivo esparso
+      (ftruncate), que ao menos fixa o tamanho final.
+    Retorna o método usado.
+    """
+    ensure_free_space(path, size)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+    try:
+        if sys.platform.startswith("linux"):
+            fallocate = _linux_fallocate()
+            if fallocate is not None:
+                if fallocate(fd, 0, 0, size) == 0:
+                    disk_monitor.note_allocated(path, size)
+                    return "fallocate"
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    free = disk_monitor.free(path, max_age=0)
+                    raise InsufficientSpace(path, size - allocated_bytes(path), free)
+                if err not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+                    raise OSError(err, os.strerror(err), path)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return "sparse"
+    finally:
+        os.close(fd)
+
+
+def default_preallocate() -> bool:
+    """Pré-alocação ligada por padrão só no Linux (no Windows o arquivo é preenchido com zeros e demora)."""
+    return sys.platform.startswith("linux")
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Optional, Dict
+
+
+# ============================================================
+# CACHE DE PROBE (TAMANHO / RANGE / VALIDADORES POR URL)
+# ============================================================
+
+VALIDATOR_SUFFIX = ".meta"  # sidecar do .part do download serial (validador do arquivo remoto)
+
+
+def _cache_file() -> Path:
+    env_path = os.environ.get("PROBE_CACHE_FILE")
+    if env_path:
+        return Path(env_path)
+    app_data_dir = os.environ.get("APP_DATA_DIR")
+    if app_data_dir:
+        return Path(app_data_dir) / "probe_cache.json"
+    return Path("probe_cache.json")
+
+
+def if_range_value(etag: Optional[str], last_modified: Optional[str]) -> Optional[str]:
+    """Valor para If-Range: ETag forte tem preferência; ETag fraca não vale para If-Range (RFC 9110)."""
+    if etag and not etag.startswith("W/"):
+        return etag
+    return last_modified or None
+
+
+def validators_from_headers(headers) -> Dict[str, Optional[str]]:
+    return {
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+    }
+
+
+class ProbeCache:
+    """
+    Resultado do probe de cada URL (tamanho, aceita Range, ETag, Last-Modified),
+    persistido em JSON. Entradas mais velhas que o TTL são ignoradas e o probe é
+    refeito. Gravação atômica (arquivo temporário + os.replace).
+
+    `put`/`invalidate` só marcam o cache como sujo: com o loop rodando, a
+    gravação sai SAVE_DELAY segundos depois numa thread (vários probes, uma
+    gravação); `save()` grava na hora (shutdown).
+    """
+
+    DEFAULT_TTL = float(os.environ.get("PROBE_CACHE_TTL", str(6 * 3600)))
+    MAX_ENTRIES = 2000
+    SAVE_DELAY = 5.0
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._data: Optional[Dict[str, dict]] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _file(self) -> Path:
+        return self.path or _cache_file()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._data is None:
+            try:
+                with open(self._file(), "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except Exception:
+                self._data = {}
+        return self._data
+
+    def _snapshot(self) -> Dict[str, dict]:
+        """Cópia para gravar (as entradas não são alteradas no lugar, só substituídas)."""
+        data = self._load()
+        if len(data) > self.MAX_ENTRIES:
+            # Descartar as entradas mais antigas
+            keep = sorted(data.items(), key=lambda kv: kv[1].get("probed_at", 0), reverse=True)[:self.MAX_ENTRIES]
+            self._data = data = dict(keep)
+        self._dirty = False
+        return dict(data)
+
+    def _write(self, data: Dict[str, dict]):
+        try:
+            f = self._file()
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = str(f) + ".new"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, f)
+        except Exception as e:
+            print(f"[PROBE] Falha ao salvar cache de probe: {e}")
+
+    def save(self):
+        if self._dirty:
+            self._write(self._snapshot())
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+        except RuntimeError:
+            self.save()  # fora do loop (scripts): grava na hora
+
+    async def _save_later(self):
+        await asyncio.sleep(self.SAVE_DELAY)
+        if self._dirty:
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def get(self, url: str, ttl: Optional[float] = None) -> Optional[dict]:
+        entry = self._load().get(url)
+        if not entry:
+            return None
+        ttl = self.DEFAULT_TTL if ttl is None else ttl
+        if time.time() - entry.get("probed_at", 0) > ttl:
+            return None
+        return entry
+
+    def put(self, url: str, size: Optional[int], accept_ranges: bool, etag: Optional[str] = None,
+            last_modified: Optional[str] = None):
+        self._load()[url] = {
+            "size": size,
+            "accept_ranges": bool(accept_ranges),
+            "etag": etag,
+            "last_modified": last_modified,
+            "probed_at": time.time(),
+        }
+        self._mark_dirty()
+
+    def invalidate(self, url: str):
+        if self._load().pop(url, None) is not None:
+            self._mark_dirty()
+
+
+probe_cache = ProbeCache()
+
+
+# ---------------------- validador do .part serial ----------------------
+
+def load_validator(part_path: str) -> Optional[dict]:
+    try:
+        with open(part_path + VALIDATOR_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_validator(part_path: str, etag: Optional[str], last_modified: Optional[str]):
+    if not etag and not last_modified:
+        remove_validator(part_path)
+        return
+    try:
+        with open(part_path + VALIDATOR_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "last_modified": last_modified}, f)
+    except Exception as e:
+        print(f"[WARN] Falha ao gravar validador de {part_path}: {e}")
+
+
+def remove_validator(part_path: str):
+    try:
+        if os.path.exists(part_path + VALIDATOR_SUFFIX):
+            os.remove(part_path + VALIDATOR_SUFFIX)
+    except Exception as e:
+        print(f"[WARN] Não foi possível remover validador de {part_path}: {e}")
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime
+from typing import Optional, Dict, Iterable, List
+
+from sqlmodel import select
+
+from backend.models.models import Job, JobPart
+from backend.db import get_session
+
+_PART_FIELDS = ("id", "index", "start", "end", "downloaded", "size", "path", "status")
+
+
+# ============================================================
+# PERSISTÊNCIA DE PROGRESSO EM LOTE (WRITE-BEHIND)
+# ============================================================
+
+class ProgressStore:
+    """
+    Buffer em memória do progresso dos jobs, gravado no banco por um único
+    escritor em segundo plano a cada `interval` segundos: todos os jobs com
+    mudanças vão numa transação só (um commit/fsync por ciclo em vez de um por
+    tick de progresso de cada job).
+
+    Cada `update` só sobrescreve o último valor do job. `flush(job_id)` grava na
+    hora; o JobManager chama isso antes de marcar pausa/conclusão, para que o
+    status final nunca seja sobrescrito por um progresso antigo.
+
+    Os JobParts dos jobs rodando também vivem aqui (`parts`): criados com um
+    insert em lote, atualizados só na memória e gravados no mesmo ciclo com um
+    único UPDATE em lote (executemany por id). O endpoint de partes lê daqui
+    enquanto o job roda.
+    """
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self._dirty: Dict[int, dict] = {}
+        self._parts: Dict[int, Dict[int, dict]] = {}  # job_id -> index -> estado da parte
+        self._dirty_parts: Dict[int, set] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def update(self, job_id: int, progress: Optional[float] = None, downloaded: Optional[int] = None,
+               total: Optional[int] = None):
+        entry = self._dirty.setdefault(job_id, {})
+        if progress is not None:
+            entry["progress"] = progress
+        if downloaded is not None:
+            entry["downloaded"] = downloaded
+        if total is not None and total > 0:
+            entry["size"] = total
+
+    def discard(self, job_id: int):
+        self._dirty.pop(job_id, None)
+
+    # ---------------------- partes ----------------------
+
+    @staticmethod
+    def _ensure_parts_sync(job_id: int, specs: List[dict]) -> List[dict]:
+        session = get_session()
+        try:
+            rows = session.exec(select(JobPart).where(JobPart.job_id == job_id)).all()
+            known = {p.index for p in rows}
+            new = [JobPart(job_id=job_id, downloaded=0, status="pending", **spec)
+                   for spec in specs if spec["index"] not in known]
+            if new:
+                session.add_all(new)
+                session.commit()
+                rows = session.exec(select(JobPart).where(JobPart.job_id == job_id)).all()
+            return [{f: getattr(p, f) for f in _PART_FIELDS} for p in rows]
+        finally:
+            session.close()
+
+    async def ensure_parts(self, job_id: int, specs: List[dict]) -> int:
+        """
+        Cria de uma vez as partes que ainda não existem (`specs`: index/start/end/size/path)
+        e carrega todas na memória. Retorna quantas partes o job tem.
+        """
+        rows = await asyncio.to_thread(self._ensure_parts_sync, job_id, specs)
+        self._parts[job_id] = {r["index"]: r for r in rows}
+        return len(rows)
+
+    def update_part(self, job_id: int, index: int, downloaded: Optional[int] = None,
+                    size: Optional[int] = None, status: Optional[str] = None):
+        part = self._parts.get(job_id, {}).get(index)
+        if part is None:
+            return
+        if size:
+            part["size"] = size
+        if downloaded is not None:
+            part["downloaded"] = min(downloaded, part["size"]) if part.get("size") else downloaded
+        if status is not None:
+            part["status"] = status
+        self._dirty_parts.setdefault(job_id, set()).add(index)
+
+    def set_parts_status(self, job_id: int, status: str, complete: bool = False):
+        for index, part in self._parts.get(job_id, {}).items():
+            part["status"] = status
+            if complete and part.get("size"):
+                part["downloaded"] = part["size"]
+            self._dirty_parts.setdefault(job_id, set()).add(index)
+
+    def get_parts(self, job_id: int) -> Optional[List[dict]]:
+        """Estado atual das partes de um job rodando (None se não está na memória)."""
+        parts = self._parts.get(job_id)
+        if parts is None:
+            return None
+        return [{k: v for k, v in p.items() if k != "id"} for _, p in sorted(parts.items())]
+
+    def drop_parts(self, job_id: int):
+        """Job terminou: as partes deixam a memória (chamar depois do flush final)."""
+        self._parts.pop(job_id, None)
+        self._dirty_parts.pop(job_id, None)
+
+    # ---------------------- gravação ----------------------
+
+    @staticmethod
+    def _write(batch: Dict[int, dict], part_rows: List[dict]) -> int:
+        session = get_session()
+        written = 0
+        try:
+            now = datetime.now()
+            for job_id, fields in batch.items():
+                j = session.get(Job, job_id)
+                if not j:
+                    continue
+                for key, value in fields.items():
+                    setattr(j, key, value)
+                j.updated_at = now
+                session.add(j)
+                written += 1
+            if part_rows:
+                session.bulk_update_mappings(JobPart, [{**row, "updated_at": now} for row in part_rows])
+                written += len(part_rows)
+            session.commit()
+        finally:
+            session.close()
+        return written
+
+    async def flush(self, job_ids: Optional[Iterable[int]] = None):
+        """Grava agora o progresso pendente (de todos os jobs ou só dos informados)."""
+        async with self._lock:
+            if job_ids is None:
+                batch, self._dirty = self._dirty, {}
+                dirty_parts, self._dirty_parts = self._dirty_parts, {}
+            else:
+                job_ids = list(job_ids)
+                batch = {jid: self._dirty.pop(jid) for jid in job_ids if jid in self._dirty}
+                dirty_parts = {jid: self._dirty_parts.pop(jid) for jid in job_ids if jid in self._dirty_parts}
+            part_rows = []
+            for jid, indexes in dirty_parts.items():
+                parts = self._parts.get(jid, {})
+                for index in indexes:
+                    part = parts.get(index)
+                    if part and part.get("id") is not None:
+                        part_rows.append({"id": part["id"], "downloaded": part["downloaded"],
+                                          "size": part["size"], "status": part["status"]})
+            if not batch and not part_rows:
+                return
+            try:
+                self.rows_written += await asyncio.to_thread(self._write, batch, part_rows)
+                self.flushes += 1
+            except Exception as e:
+                print(f"[WARN] Falha ao gravar progresso de {len(batch)} job(s) / {len(part_rows)} parte(s): {e}")
+                # Devolver ao buffer o que não foi substituído por valor mais novo
+                for jid, fields in batch.items():
+                    newer = self._dirty.get(jid, {})
+                    self._dirty[jid] = {**fields, **newer}
+                for jid, indexes in dirty_parts.items():
+                    self._dirty_parts.setdefault(jid, set()).update(indexes)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        """Para o escritor e grava o que sobrou (shutdown)."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
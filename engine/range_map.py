@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import bisect
+from typing import Optional, List, Tuple
+
+
+# ============================================================
+# MAPA DE RANGES (SIDECAR DE RESUME DO ULTRAMAX)
+# ============================================================
+
+MAP_SUFFIX = ".ranges"
+MAP_VERSION = 1
+
+
+class RangeMap:
+    """
+    Mapa de conclusão por range de um download segmentado.
+
+    Guarda intervalos fechados [start, end] já gravados no arquivo temporário,
+    sempre ordenados e mesclados (adjacentes viram um só). É persistido ao lado
+    do .tmp como JSON e regravado de forma atômica (arquivo temporário + os.replace),
+    então um crash no meio do flush nunca deixa um mapa corrompido.
+    """
+
+    def __init__(self, path: str, size: int, url: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.url = url
+        # Validadores do arquivo remoto quando o .tmp começou (enviados em If-Range no resume)
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._dirty = False
+        self._last_flush = 0.0
+
+    # ---------------------- persistência ----------------------
+
+    @classmethod
+    def load(cls, path: str, size: int, url: Optional[str] = None) -> Optional["RangeMap"]:
+        """Carrega o mapa do disco. Retorna None se não existir ou não bater com o tamanho."""
+        try:
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MAP_VERSION or int(data.get("size") or 0) != size:
+                print(f"[RESUME] Mapa de ranges incompatível (size={data.get('size')}, esperado={size}), ignorando")
+                return None
+            rm = cls(path, size, url)
+            rm.etag = data.get("etag")
+            rm.last_modified = data.get("last_modified")
+            for start, end in data.get("done", []):
+                rm.mark_done(int(start), int(end))
+            rm._dirty = False
+            return rm
+        except Exception as e:
+            print(f"[RESUME] Falha ao ler mapa de ranges {path}: {e}")
+            return None
+
+    def save(self):
+        """Grava o mapa de forma atômica."""
+        tmp = self.path + ".new"
+        data = {
+            "version": MAP_VERSION,
+            "size": self.size,
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "updated_at": time.time(),
+            "done": [[s, e] for s, e in zip(self._starts, self._ends)],
+        }
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._last_flush = time.time()
+
+    def flush(self, min_interval: float = 0.0) -> bool:
+        """Grava se houver mudanças e o intervalo mínimo tiver passado."""
+        if not self._dirty:
+            return False
+        if min_interval and (time.time() - self._last_flush) < min_interval:
+            return False
+        try:
+            self.save()
+            return True
+        except Exception as e:
+            print(f"[WARN] Falha ao gravar mapa de ranges: {e}")
+            return False
+
+    def set_validators(self, etag: Optional[str], last_modified: Optional[str]):
+        if (etag or last_modified) and not (self.etag or self.last_modified):
+            self.etag = etag
+            self.last_modified = last_modified
+            self._dirty = True
+
+    def remove(self):
+        for p in (self.path, self.path + ".new"):
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception as e:
+                print(f"[WARN] Não foi possível remover {p}: {e}")
+
+    # ---------------------- intervalos ----------------------
+
+    def mark_done(self, start: int, end: int):
+        """Marca [start, end] como gravado, mesclando com vizinhos."""
+        if end < start:
+            return
+        i = bisect.bisect_left(self._ends, start - 1)
+        j = i
+        while j < len(self._starts) and self._starts[j] <= end + 1:
+            start = min(start, self._starts[j])
+            end = max(end, self._ends[j])
+            j += 1
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+        self._dirty = True
+
+    def covered(self, start: int, end: int) -> int:
+        """Quantidade de bytes já gravados dentro de [start, end]."""
+        total = 0
+        i = bisect.bisect_left(self._ends, start)
+        while i < len(self._starts) and self._starts[i] <= end:
+            total += min(end, self._ends[i]) - max(start, self._starts[i]) + 1
+            i += 1
+        return total
+
+    def missing(self) -> List[Tuple[int, int]]:
+        """Lista de ranges [start, end] que ainda faltam baixar."""
+        gaps = []
+        pos = 0
+        for s, e in zip(self._starts, self._ends):
+            if s > pos:
+                gaps.append((pos, s - 1))
+            pos = max(pos, e + 1)
+        if pos < self.size:
+            gaps.append((pos, self.size - 1))
+        return gaps
+
+    @property
+    def contiguous_prefix(self) -> int:
+        """Quantos bytes a partir do 0 já estão gravados sem buracos."""
+        if self._starts and self._starts[0] == 0:
+            return self._ends[0] + 1
+        return 0
+
+    @property
+    def done_bytes(self) -> int:
+        return sum(e - s + 1 for s, e in zip(self._starts, self._ends))
+
+    @property
+    def complete(self) -> bool:
+        return self.done_bytes >= self.size
@@ -0,0 +1,106 @@
+import heapq
+import asyncio
+import itertools
+from typing import Optional, Dict, List, Tuple, Callable
+
+
+# ============================================================
+# FILA DE JOBS COM PRIORIDADE
+# ============================================================
+
+DEFAULT_PRIORITY = 0
+
+
+class JobScheduler:
+    """
+    Fila de jobs ordenada por prioridade (maior sai primeiro; empate = ordem de chegada).
+
+    Substitui o asyncio.Queue FIFO: a prioridade de um job ainda na fila pode mudar
+    a qualquer momento (a entrada antiga vira lixo no heap e é ignorada no `pop`).
+    Também guarda quais jobs estão rodando e com que prioridade, para o JobManager
+    decidir preempção.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, int]] = []  # (-prioridade, seq, job_id)
+        self._entries: Dict[int, Tuple[int, int, int]] = {}
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self.running: Dict[int, int] = {}  # job_id -> prioridade
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, job_id: int):
+        return job_id in self._entries
+
+    async def push(self, job_id: int, priority: int = DEFAULT_PRIORITY):
+        """Coloca (ou reposiciona) o job na fila."""
+        async with self._cond:
+            self._put(job_id, priority)
+            self._cond.notify()
+
+    def _put(self, job_id: int, priority: int, seq: Optional[int] = None):
+        entry = (-int(priority), next(self._seq) if seq is None else seq, job_id)
+        self._entries[job_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def reprioritize(self, job_id: int, priority: int) -> bool:
+        """Muda a prioridade de um job na fila (mantém a ordem de chegada no empate)."""
+        if job_id in self.running:
+            self.running[job_id] = int(priority)
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return False
+        self._put(job_id, priority, seq=entry[1])
+        return True
+
+    def remove(self, job_id: int) -> bool:
+        return self._entries.pop(job_id, None) is not None
+
+    async def pop(self, capacity: Optional[Callable[[], int]] = None) -> Tuple[int, int]:
+        """
+        Espera um job e um slot livre (menos de `capacity()` rodando) e retira o de maior
+        prioridade, já marcado como rodando. Retorna (job_id, prioridade).
+        """
+        async with self._cond:
+            while True:
+                if capacity is None or len(self.running) < capacity():
+                    while self._heap:
+                        entry = heapq.heappop(self._heap)
+                        if self._entries.get(entry[2]) is entry:
+                            del self._entries[entry[2]]
+                            self.running[entry[2]] = -entry[0]
+                            return entry[2], -entry[0]
+                await self._cond.wait()
+
+    async def wake(self):
+        """Acorda quem espera em `pop` (slot liberado ou capacidade mudou)."""
+        async with self._cond:
+            self._cond.notify_all()
+
+    def peek_priority(self) -> Optional[int]:
+        """Prioridade do próximo job da fila (None se vazia)."""
+        while self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+        return -self._heap[0][0] if self._heap else None
+
+    async def finish(self, job_id: int):
+        """Job parou de rodar: libera o slot."""
+        self.running.pop(job_id, None)
+        await self.wake()
+
+    def lowest_running(self, exclude=()) -> Optional[Tuple[int, int]]:
+        """(job_id, prioridade) do job rodando com menor prioridade (o mais recente no empate)."""
+        candidates = [(p, -i, jid) for i, (jid, p) in enumerate(self.running.items()) if jid not in exclude]
+        if not candidates:
+            return None
+        p, _, jid = min(candidates)
+        return jid, p
+
+    def snapshot(self) -> dict:
+        queued = sorted(self._entries.values())
+        return {
+            "running": [{"job_id": jid, "priority": p} for jid, p in self.running.items()],
+            "queued": [{"job_id": jid, "priority": -neg, "position": i} for i, (neg, _, jid) in enumerate(queued)],
+        }
@@ -0,0 +1,231 @@
+import os
+import re
+import base64
+import hashlib
+import shutil
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+
+# ============================================================
+# CACHE DE METADADOS .torrent POR INFOHASH
+# ============================================================
+
+def magnet_infohash(magnet_url: str) -> Optional[str]:
+    """Infohash (hex minúsculo) de um magnet btih; base32 é convertido."""
+    m = re.search(r'xt=urn:btih:([A-Za-z0-9]+)', magnet_url or "")
+    if not m:
+        return None
+    h = m.group(1)
+    if len(h) == 32:
+        try:
+            return base64.b32decode(h.upper()).hex()
+        except Exception:
+            return None
+    return h.lower() if len(h) == 40 else None
+
+
+def _bdecode(data: bytes, i: int = 0) -> Tuple[Any, int]:
+    """Bencode mínimo: (valor, posição final). Chaves de dicionário ficam em bytes."""
+    c = data[i:i + 1]
+    if c == b"i":
+        end = data.index(b"e", i)
+        return int(data[i + 1:end]), end + 1
+    if c == b"l":
+        i, items = i + 1, []
+        while data[i:i + 1] != b"e":
+            v, i = _bdecode(data, i)
+            items.append(v)
+        return items, i + 1
+    if c == b"d":
+        i, d = i + 1, {}
+        while data[i:i + 1] != b"e":
+            k, i = _bdecode(data, i)
+            d[k], i = _bdecode(data, i)
+        return d, i + 1
+    if c.isdigit():
+        colon = data.index(b":", i)
+        start = colon + 1
+        end = start + int(data[i:colon])
+        if end > len(data):
+            raise ValueError("string truncada")
+        return data[start:end], end
+    raise ValueError(f"bencode inválido na posição {i}")
+
+
+def parse_torrent(data: bytes) -> Dict[str, Any]:
+    """Infohash (sha1 do dicionário `info` original), nome, tamanho total e nº de arquivos."""
+    if data[:1] != b"d":
+        raise ValueError("não é um .torrent")
+    i, info, info_span = 1, None, None
+    while data[i:i + 1] != b"e":
+        key, i = _bdecode(data, i)
+        start = i
+        value, i = _bdecode(data, i)
+        if key == b"info":
+            info, info_span = value, (start, i)
+    if not isinstance(info, dict):
+        raise ValueError("sem dicionário info")
+    files = info.get(b"files")
+    if files:
+        total = sum(int(f.get(b"length", 0)) for f in files)
+    else:
+        total = int(info.get(b"length", 0))
+    return {
+        "infohash": hashlib.sha1(data[info_span[0]:info_span[1]]).hexdigest(),
+        "name": (info.get(b"name") or b"").decode("utf-8", "replace"),
+        "total_size": total,
+        "files": len(files) if files else 1,
+    }
+
+
+def _cache_dir() -> Path:
+    env_path = os.environ.get("TORRENT_CACHE_DIR")
+    if env_path:
+        return Path(env_path)
+    app_data_dir = os.environ.get("APP_DATA_DIR")
+    if app_data_dir:
+        return Path(app_data_dir) / "torrent_cache"
+    return Path("torrent_cache")
+
+
+class TorrentMetadataCache:
+    """
+    `.torrent` já resolvidos, um arquivo por infohash (`<infohash>.torrent`).
+
+    O aria2 grava os metadados com --bt-save-metadata ao lado do download e os
+    apaga a limpeza de resíduos; aqui uma cópia validada (sha1 do `info` bate com
+    o infohash) fica guardada. Num novo download do mesmo magnet a cópia volta
+    para a pasta de destino antes de o aria2 começar e --bt-load-saved-metadata
+    pula a busca de metadados no DHT. O tamanho total também sai daqui para
+    estimativas antes do download.
+
+    Entradas menos usadas (mtime) saem acima de MAX_ENTRIES.
+    """
+
+    MAX_ENTRIES = 1000
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = directory
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def _dir(self) -> Path:
+        return self.directory or _cache_dir()
+
+    def path_for(self, infohash: str) -> Path:
+        return self._dir() / f"{infohash.lower()}.torrent"
+
+    def get(self, infohash: Optional[str]) -> Optional[Path]:
+        if not infohash:
+            return None
+        path = self.path_for(infohash)
+        if path.exists():
+            try:
+                os.utime(path)  # LRU
+            except OSError:
+                pass
+            return path
+        return None
+
+    def info(self, infohash: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Nome/tamanho/arquivos do torrent em cache (None se não conhecido)."""
+        if not infohash:
+            return None
+        infohash = infohash.lower()
+        if infohash in self._info:
+            return self._info[infohash]
+        path = self.path_for(infohash)
+        try:
+            meta = parse_torrent(path.read_bytes())
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        self._info[infohash] = meta
+        return meta
+
+    def total_size(self, infohash: Optional[str]) -> Optional[int]:
+        meta = self.info(infohash)
+        return meta["total_size"] if meta and meta["total_size"] > 0 else None
+
+    # ---------------------- captura / restauração ----------------------
+
+    def store(self, infohash: str, data: bytes) -> bool:
+        infohash = infohash.lower()
+        try:
+            meta = parse_torrent(data)
+        except (ValueError, KeyError, IndexError) as e:
+            print(f"[TORRENT-CACHE] Metadados inválidos para {infohash}: {e}")
+            return False
+        if meta["infohash"] != infohash:
+            print(f"[TORRENT-CACHE] Infohash não confere ({meta['infohash']} != {infohash}), ignorado")
+            return False
+        path = self.path_for(infohash)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = str(path) + ".new"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[TORRENT-CACHE] Falha ao gravar {path}: {e}")
+            return False
+        self._info[infohash] = meta
+        self.stored += 1
+        print(f"[TORRENT-CACHE] Metadados guardados: {meta['name']} ({meta['total_size']/1024/1024:.1f} MB, {meta['files']} arquivo(s))")
+        self._evict()
+        return True
+
+    def capture(self, directory, infohash: Optional[str]) -> bool:
+        """Guarda o `<infohash>.torrent` que o aria2 salvou em `directory` (se ainda não estiver em cache)."""
+        if not infohash or self.path_for(infohash).exists():
+            return False
+        saved = Path(directory) / f"{infohash.lower()}.torrent"
+        try:
+            data = saved.read_bytes()
+        except OSError:
+            return False
+        return self.store(infohash, data)
+
+    def restore(self, infohash: Optional[str], directory) -> bool:
+        """Copia o .torrent em cache para `directory`, onde --bt-load-saved-metadata o encontra."""
+        cached = self.get(infohash)
+        if cached is None:
+            self.misses += 1
+            return False
+        target = Path(directory) / cached.name
+        try:
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(cached, target)
+        except OSError as e:
+            print(f"[TORRENT-CACHE] Falha ao restaurar {cached.name}: {e}")
+            self.misses += 1
+            return False
+        self.hits += 1
+        print(f"[TORRENT-CACHE] Metadados em cache para {infohash}: pulando a busca no DHT")
+        return True
+
+    def _evict(self):
+        try:
+            entries = sorted(self._dir().glob("*.torrent"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return
+        for path in entries[:max(0, len(entries) - self.MAX_ENTRIES)]:
+            try:
+                path.unlink()
+                self._info.pop(path.stem, None)
+            except OSError:
+                pass
+
+    def snapshot(self) -> dict:
+        try:
+            entries = len(list(self._dir().glob("*.torrent")))
+        except OSError:
+            entries = 0
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "stored": self.stored,
+                "directory": str(self._dir())}
+
+
+torrent_cache = TorrentMetadataCache()
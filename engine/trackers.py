@@ -0,0 +1,444 @@
+import os
+import json
+import time
+import random
+import struct
+import asyncio
+from pathlib import Path
+from typing import Optional, Dict, List, Iterable
+from urllib.parse import urlparse
+
+from .http_pool import http_pool
+
+
+# ============================================================
+# REGISTRO DE SAÚDE DOS TRACKERS (PERSISTIDO)
+# ============================================================
+
+# Lista semente: trackers públicos conhecidos. O registro decide quais deles (e dos que
+# aparecem nos magnets) são realmente entregues ao aria2 e ao scraper UDP.
+DEFAULT_TRACKERS = [
+    # Mais estáveis (listas "best" do ngosang/trackerslist e newtrackon): ordem usada enquanto nada foi medido
+    "udp://tracker.opentrackr.org:1337/announce",
+    "http://tracker.opentrackr.org:1337/announce",
+    "udp://open.demonii.com:1337/announce",
+    "udp://open.stealth.si:80/announce",
+    "udp://tracker.torrent.eu.org:451/announce",
+    "udp://exodus.desync.com:6969/announce",
+    "udp://explodie.org:6969/announce",
+    "udp://tracker.theoks.net:6969/announce",
+    "udp://tracker.qu.ax:6969/announce",
+    "udp://tracker.dler.org:6969/announce",
+    "udp://opentracker.io:6969/announce",
+    "udp://open.free-tracker.ga:6969/announce",
+    "udp://tracker.tryhackx.org:6969/announce",
+    "udp://tracker.srv00.com:6969/announce",
+    "udp://tracker.filemail.com:6969/announce",
+    "udp://tracker.fnix.net:6969/announce",
+    "udp://tracker.skynetcloud.site:6969/announce",
+    "udp://tracker.darkness.services:6969/announce",
+    "udp://tracker.deadorbit.nl:6969/announce",
+    "udp://retracker01-msk-virt.corbina.net:80/announce",
+    "udp://bt1.archive.org:6969/announce",
+    "udp://bt2.archive.org:6969/announce",
+
+    # Públicos ativos
+    "udp://ttk2.nbaonlineservice.com:6969/announce",
+    "udp://u.peer-exchange.download:6969/announce",
+    "udp://leet-tracker.moe:1337/announce",
+    "udp://isk.richardsw.club:6969/announce",
+    "udp://evan.im:6969/announce",
+    "udp://martin-gebhardt.eu:25/announce",
+    "udp://tracker.jamesthebard.net:6969/announce",
+    "udp://tracker.edkj.club:6969/announce",
+    "udp://tracker.farted.net:6969/announce",
+    "udp://tracker.0x7c0.com:6969/announce",
+    "udp://tracker.bittor.pw:1337/announce",
+    "udp://tracker1.myporn.club:9337/announce",
+    "udp://tracker2.dler.org:80/announce",
+    "udp://tracker.ccp.ovh:6969/announce",
+    "udp://bt.rer.lol:6969/announce",
+    "udp://bt.rer.lol:2710/announce",
+    "udp://ipv4.rer.lol:2710/announce",
+    "udp://moonburrow.club:6969/announce",
+    "udp://new-line.net:6969/announce",
+    "udp://1c.premierzal.ru:6969/announce",
+    "udp://d40969.acod.regrucolo.ru:6969/announce",
+    "udp://tamas3.ynh.fr:6969/announce",
+    "udp://ryjer.com:6969/announce",
+    "udp://run.publictracker.xyz:6969/announce",
+    "udp://p2p.publictracker.xyz:6969/announce",
+    "udp://open.publictracker.xyz:6969/announce",
+    "udp://public.tracker.vraphim.com:6969/announce",
+    "udp://open.u-p.pw:6969/announce",
+    "udp://open.dstud.io:6969/announce",
+    "udp://open.demonoid.ch:6969/announce",
+    "udp://odd-hd.fr:6969/announce",
+    "udp://jutone.com:6969/announce",
+    "udp://epider.me:6969/announce",
+    "udp://amigacity.xyz:6969/announce",
+    "udp://concen.org:6969/announce",
+    "udp://torrents.artixlinux.org:6969/announce",
+    "udp://mail.artixlinux.org:6969/announce",
+    "udp://aegir.sexy:6969/announce",
+
+    # HTTP/HTTPS (redes que bloqueiam UDP)
+    "https://tracker.tamersunion.org:443/announce",
+    "https://tracker.gcrenwp.top:443/announce",
+    "https://tracker.yemekyedim.com:443/announce",
+    "https://tracker.renfei.net:443/announce",
+    "https://tracker.pmman.tech:443/announce",
+    "https://tracker.lilithraws.org:443/announce",
+    "https://tracker.cloudit.top:443/announce",
+    "https://tracker.ipfsscan.io:443/announce",
+    "https://trackers.run:443/announce",
+    "https://www.peckservers.com:9443/announce",
+    "http://tracker.gbitt.info:80/announce",
+    "http://tracker.files.fm:6969/announce",
+    "http://tracker.dler.org:6969/announce",
+    "http://tracker2.dler.org:80/announce",
+    "http://tracker.bt4g.com:2095/announce",
+    "http://tracker.renfei.net:8080/announce",
+    "http://tracker.mywaifu.best:6969/announce",
+    "http://tracker.ipv6tracker.org:80/announce",
+    "http://tracker.edkj.club:6969/announce",
+    "http://t.overflow.biz:6969/announce",
+    "http://t1.aag.moe:17715/announce",
+    "http://www.peckservers.com:9000/announce",
+    "http://tracker1.itzmx.com:8080/announce",
+    "http://ch3oh.ru:6969/announce",
+    "http://bvarf.tracker.sh:2086/announce",
+]
+
+
+def _registry_file() -> Path:
+    env_path = os.environ.get("TRACKER_REGISTRY_FILE")
+    if env_path:
+        return Path(env_path)
+    app_data_dir = os.environ.get("APP_DATA_DIR")
+    if app_data_dir:
+        return Path(app_data_dir) / "trackers.json"
+    return Path("trackers.json")
+
+
+def normalize_tracker(url: str) -> Optional[str]:
+    """Forma canônica (esquema/host minúsculos, sem barra final); None se não for tracker válido."""
+    url = (url or "").strip()
+    try:
+        p = urlparse(url)
+    except Exception:
+        return None
+    scheme = p.scheme.lower()
+    if scheme not in ("udp", "http", "https") or not p.hostname:
+        return None
+    if scheme == "udp" and not p.port:
+        return None
+    netloc = p.hostname.lower() + (f":{p.port}" if p.port else "")
+    return f"{scheme}://{netloc}{p.path.rstrip('/')}"
+
+
+class TrackerStats:
+    __slots__ = ("url", "successes", "failures", "consecutive_failures", "latency_ms", "last_ok", "last_fail",
+                 "reprobe_at", "seed")
+
+    def __init__(self, url: str, seed: bool = False):
+        self.url = url
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ms: Optional[float] = None  # EWMA
+        self.last_ok = 0.0
+        self.last_fail = 0.0
+        self.reprobe_at = 0.0  # rebaixado: fora da lista até esse instante
+        self.seed = seed
+
+    @property
+    def demoted(self) -> bool:
+        return self.consecutive_failures >= TrackerRegistry.DEMOTE_AFTER
+
+    @property
+    def known(self) -> bool:
+        return self.successes + self.failures > 0
+
+    def score(self) -> float:
+        # Taxa de sucesso suavizada (tracker novo começa em 0.5) dividida pela latência
+        rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        latency = self.latency_ms if self.latency_ms is not None else 500.0
+        return rate / (1.0 + latency / 1000.0)
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrackerStats":
+        t = cls(data["url"])
+        for k in cls.__slots__:
+            if k in data:
+                setattr(t, k, data[k])
+        return t
+
+
+class TrackerRegistry:
+    """
+    Um registro só para todos os trackers (aria2 e scraper UDP), persistido em JSON.
+
+    - Cada resultado de scrape/probe entra com `record(url, ok, latency)`: taxa de
+      sucesso e latência (EWMA) definem a nota.
+    - `top(n)` entrega só os N melhores: primeiro os que já responderam, e os
+      nunca medidos só completam a lista enquanto não há medidos suficientes. A
+      primeira passada do probe mede todos os desconhecidos de uma vez
+      (PROBE_PARALLEL em paralelo) e `ready()` deixa o aria2 esperar por ela.
+    - Trackers com DEMOTE_AFTER falhas seguidas saem da lista e só voltam depois
+      de um re-probe bem-sucedido, feito em segundo plano com intervalo
+      crescente (REPROBE_BASE .. REPROBE_MAX).
+    - Trackers aprendidos dos magnets que nunca responderam são descartados.
+    """
+
+    DEMOTE_AFTER = 3
+    REPROBE_BASE = 15 * 60.0
+    REPROBE_MAX = 24 * 3600.0
+    PROBE_INTERVAL = 60.0
+    PROBE_BATCH = 16
+    PROBE_PARALLEL = 32
+    PROBE_TIMEOUT = 4.0
+    EWMA_ALPHA = 0.3
+    MAX_ENTRIES = 500
+
+    def __init__(self, path: Optional[Path] = None, seeds: Iterable[str] = DEFAULT_TRACKERS):
+        self.path = path
+        self._seeds = list(seeds)
+        self._data: Optional[Dict[str, TrackerStats]] = None
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._first_pass: Optional[asyncio.Event] = None
+
+    def _file(self) -> Path:
+        return self.path or _registry_file()
+
+    def _load(self) -> Dict[str, TrackerStats]:
+        if self._data is None:
+            data: Dict[str, TrackerStats] = {}
+            try:
+                with open(self._file(), "r", encoding="utf-8") as f:
+                    for entry in json.load(f):
+                        t = TrackerStats.from_dict(entry)
+                        t.seed = False
+                        data[t.url] = t
+            except Exception:
+                pass
+            for url in self._seeds:
+                n = normalize_tracker(url)
+                if n:
+                    data.setdefault(n, TrackerStats(n)).seed = True
+            self._data = data
+        return self._data
+
+    def save(self):
+        if not self._dirty:
+            return
+        data = self._load()
+        # Aprendidos que nunca responderam não ficam; acima do teto, os piores saem
+        entries = [t for t in data.values() if t.seed or t.successes > 0 or t.consecutive_failures < 10]
+        if len(entries) > self.MAX_ENTRIES:
+            entries.sort(key=lambda t: (t.seed, t.score()), reverse=True)
+            entries = entries[:self.MAX_ENTRIES]
+        self._data = {t.url: t for t in entries}
+        try:
+            f = self._file()
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = str(f) + ".new"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump([t.to_dict() for t in entries], fh)
+            os.replace(tmp, f)
+            self._dirty = False
+        except Exception as e:
+            print(f"[TRACKERS] Falha ao salvar registro: {e}")
+
+    # ---------------------- resultados ----------------------
+
+    def record(self, url: str, ok: bool, latency: Optional[float] = None):
+        """Resultado de um scrape/announce/probe (`latency` em segundos)."""
+        n = normalize_tracker(url)
+        if not n:
+            return
+        data = self._load()
+        t = data.get(n)
+        if t is None:
+            t = data[n] = TrackerStats(n)
+        now = time.time()
+        if ok:
+            was_demoted = t.demoted
+            t.successes += 1
+            t.consecutive_failures = 0
+            t.last_ok = now
+            t.reprobe_at = 0.0
+            if latency is not None:
+                ms = latency * 1000.0
+                t.latency_ms = ms if t.latency_ms is None else self.EWMA_ALPHA * ms + (1 - self.EWMA_ALPHA) * t.latency_ms
+            if was_demoted:
+                print(f"[TRACKERS] {n} voltou a responder ({t.latency_ms or 0:.0f} ms)")
+        else:
+            t.failures += 1
+            t.consecutive_failures += 1
+            t.last_fail = now
+            if t.demoted:
+                backoff = min(self.REPROBE_MAX, self.REPROBE_BASE * 2 ** (t.consecutive_failures - self.DEMOTE_AFTER))
+                t.reprobe_at = now + backoff
+                if t.consecutive_failures == self.DEMOTE_AFTER:
+                    print(f"[TRACKERS] {n} rebaixado após {t.consecutive_failures} falhas seguidas")
+        self._dirty = True
+
+    # ---------------------- seleção ----------------------
+
+    def top(self, n: int, schemes: Optional[Iterable[str]] = None) -> List[str]:
+        """Os `n` trackers mais saudáveis (opcionalmente só de `schemes`, ex.: ("udp",))."""
+        data = self._load()
+        schemes = tuple(s.lower() for s in schemes) if schemes else None
+        candidates = [t for t in data.values()
+                      if not t.demoted and (schemes is None or t.url.split("://", 1)[0] in schemes)]
+        # Camadas: já responderam > nunca medidos (ordem da lista semente) > só falharam até agora
+        order = {url: i for i, url in enumerate(data)}
+
+        def rank(t: TrackerStats):
+            tier = 0 if t.successes > 0 else (1 if not t.known else 2)
+            return tier, -t.score() if tier != 1 else 0.0, order[t.url]
+
+        candidates.sort(key=rank)
+        return [t.url for t in candidates[:max(0, n)]]
+
+    def due_for_probe(self, limit: Optional[int] = None) -> List[str]:
+        """Rebaixados cujo re-probe venceu, depois os nunca medidos."""
+        now = time.time()
+        data = self._load()
+        demoted = sorted((t for t in data.values() if t.demoted and t.reprobe_at <= now), key=lambda t: t.reprobe_at)
+        unknown = [t for t in data.values() if not t.known]
+        return [t.url for t in (demoted + unknown)[:limit]]
+
+    # ---------------------- probe em segundo plano ----------------------
+
+    async def probe(self, url: str) -> bool:
+        """Contato mínimo com o tracker (UDP: handshake connect; HTTP: qualquer resposta) e registra o resultado."""
+        start = time.monotonic()
+        try:
+            if url.startswith("udp://"):
+                ok = await _udp_connect(url, self.PROBE_TIMEOUT)
+            else:
+                ok = await _http_reachable(url, self.PROBE_TIMEOUT)
+        except Exception:
+            ok = False
+        self.record(url, ok, time.monotonic() - start if ok else None)
+        return ok
+
+    async def _probe_many(self, urls: List[str]) -> int:
+        sem = asyncio.Semaphore(self.PROBE_PARALLEL)
+
+        async def one(url: str) -> bool:
+            async with sem:
+                return await self.probe(url)
+
+        results = await asyncio.gather(*(one(u) for u in urls), return_exceptions=True)
+        return sum(1 for r in results if r is True)
+
+    async def _loop(self):
+        first = True
+        while True:
+            try:
+                # Primeira passada: todos os devidos (instalação nova = lista semente inteira) de uma vez
+                batch = self.due_for_probe(None if first else self.PROBE_BATCH)
+                if batch:
+                    alive = await self._probe_many(batch)
+                    print(f"[TRACKERS] {'Probe inicial' if first else 'Re-probe'}: {alive}/{len(batch)} responderam")
+                self.save()
+            except Exception as e:
+                print(f"[WARN] Re-probe de trackers falhou: {e}")
+            finally:
+                if first:
+                    first = False
+                    self._first_pass.set()
+            await asyncio.sleep(self.PROBE_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._first_pass = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def ready(self, timeout: Optional[float] = None):
+        """Espera (até `timeout`) a primeira passada do probe; sem loop rodando volta na hora."""
+        if self._first_pass is None or self._first_pass.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._first_pass.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.save()
+
+    def snapshot(self, limit: int = 50) -> dict:
+        data = self._load()
+        ranked = sorted(data.values(), key=lambda t: (t.demoted, -t.score()))
+        return {
+            "total": len(data),
+            "healthy": sum(1 for t in data.values() if t.known and not t.demoted),
+            "demoted": sum(1 for t in data.values() if t.demoted),
+            "unknown": sum(1 for t in data.values() if not t.known),
+            "trackers": [dict(t.to_dict(), score=round(t.score(), 4), demoted=t.demoted) for t in ranked[:limit]],
+        }
+
+
+class _ConnectProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.response = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.response.done():
+            self.response.set_result(data)
+
+    def error_received(self, exc):
+        if not self.response.done():
+            self.response.set_exception(exc)
+
+
+async def _udp_connect(url: str, timeout: float) -> bool:
+    """BEP 15: pedido connect; tracker vivo responde com o mesmo transaction id."""
+    p = urlparse(url)
+    loop = asyncio.get_running_loop()
+    transport, protocol = await asyncio.wait_for(
+        loop.create_datagram_endpoint(_ConnectProtocol, remote_addr=(p.hostname, p.port)), timeout)
+    try:
+        transaction_id = random.randint(0, 0xFFFFFFFF)
+        transport.sendto(struct.pack("!QII", 0x41727101980, 0, transaction_id))
+        data = await asyncio.wait_for(protocol.response, timeout)
+        return len(data) >= 16 and struct.unpack("!II", data[:8]) == (0, transaction_id)
+    finally:
+        transport.close()
+
+
+async def _http_reachable(url: str, timeout: float) -> bool:
+    """Tracker HTTP responde (qualquer status: announce sem parâmetros costuma dar 400)."""
+    # Cliente do pool por host: a conexão fica quente para o próximo probe e a limpeza fecha os ociosos
+    async with http_pool.lease(url) as client:
+        r = await client.get(url, timeout=timeout, follow_redirects=False)
+        return r.status_code < 500
+
+
+tracker_registry = TrackerRegistry()
+
+
+async def injected_trackers() -> List[str]:
+    """Lista passada ao aria2 em --bt-tracker / opção bt-tracker (top-N do registro)."""
+    try:
+        from backend import config as backend_config
+        n = getattr(backend_config, "TRACKERS_TOP_N", 30)
+    except Exception:
+        n = 30
+    # Instalação nova: melhor esperar alguns segundos pelo probe inicial do que entregar trackers mortos
+    await tracker_registry.ready(timeout=2 * TrackerRegistry.PROBE_TIMEOUT)
+    return tracker_registry.top(n)
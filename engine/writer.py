@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Dict
+
+
+# ============================================================
+# ESCRITA POSICIONAL COM BUFFER (ULTRAMAX)
+# ============================================================
+
+_HAS_PWRITE = hasattr(os, "pwrite")
+
+
+class WriteLatency:
+    """
+    Latência de escrita em disco de todos os downloads (ms por MB, EWMA), medida em
+    volta de cada pwrite/write. O ajuste de concorrência de jobs usa isso para
+    perceber quando o disco, e não a rede, virou o gargalo.
+    """
+
+    ALPHA = 0.2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ms_per_mb: Optional[float] = None
+        self.samples = 0
+
+    def record(self, nbytes: int, seconds: float):
+        if nbytes < 64 * 1024:
+            return  # escrita pequena: custo fixo domina, não diz nada sobre o disco
+        value = seconds * 1000 / (nbytes / (1024 * 1024))
+        with self._lock:
+            self.samples += 1
+            if self.ms_per_mb is None:
+                self.ms_per_mb = value
+            else:
+                self.ms_per_mb = self.ALPHA * value + (1 - self.ALPHA) * self.ms_per_mb
+
+
+write_latency = WriteLatency()
+
+
+class BufferPool:
+    """
+    Blocos `bytearray` de tamanho fixo, reaproveitados entre escritas.
+
+    Os bytes recebidos são copiados uma única vez para dentro de um bloco e o
+    pwrite usa uma fatia (memoryview) dele; quando a escrita termina o bloco volta
+    para o pool. Em regime não há alocação por chunk: o número de blocos vivos
+    fica limitado por max_pending / block_size + um por worker.
+    """
+
+    def __init__(self, block_size: int, max_free: int = 64):
+        self.block_size = block_size
+        self.max_free = max_free
+        self._free: list = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray(self.block_size)
+
+    def release(self, block: bytearray):
+        if len(block) != self.block_size:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(block)
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+
+class _WorkerBuffer:
+    __slots__ = ("offset", "block", "length")
+
+    def __init__(self):
+        self.offset = 0
+        self.block: Optional[bytearray] = None
+        self.length = 0
+
+
+class PositionalWriter:
+    """
+    Um único descritor por job, compartilhado por todos os workers.
+
+    Cada worker acumula seus bytes contíguos num bloco do BufferPool (buffer_size)
+    e o bloco cheio vira um único pwrite num pool pequeno de threads. `max_pending`
+    limita quantos bytes podem estar aguardando escrita: quando estoura, o worker
+    espera (backpressure) em vez de acumular memória sem limite.
+
+    `on_written(offset, length)` é chamado no loop do asyncio depois que o trecho
+    foi entregue ao sistema operacional (é o momento certo de marcar o mapa de ranges).
+    `on_data(offset, data)` roda na própria thread de escrita, logo após o pwrite,
+    com o bloco ainda na memória (usado pelo checksum em streaming). O `data` é uma
+    memoryview de um bloco reaproveitado: quem quiser guardá-lo depois do retorno
+    precisa copiar.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 2 * 1024 * 1024, max_pending: int = 64 * 1024 * 1024,
+                 threads: int = 4, on_written: Optional[Callable[[int, int], None]] = None,
+                 on_data: Optional[Callable[[int, memoryview], None]] = None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.max_pending = max(max_pending, buffer_size)
+        self.on_written = on_written
+        self.on_data = on_data
+        self.error: Optional[BaseException] = None
+
+        self._fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ultramax-write")
+        # Sem pwrite (Windows): seek+write precisam ser atômicos entre threads
+        self._seek_lock = threading.Lock()
+        self._buffers: Dict[int, _WorkerBuffer] = {}
+        self.pool = BufferPool(buffer_size, max_free=self.max_pending // buffer_size + 1)
+        self._pending_bytes = 0
+        self._pending_changed = asyncio.Condition()
+        self._inflight: set = set()
+        self._closed = False
+
+    # ---------------------- thread de escrita ----------------------
+
+    def _write_at(self, offset: int, block: bytearray, length: int) -> int:
+        view = memoryview(block)[:length]
+        written = 0
+        t0 = time.perf_counter()
+        if _HAS_PWRITE:
+            while written < len(view):
+                written += os.pwrite(self._fd, view[written:], offset + written)
+        else:
+            with self._seek_lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                while written < len(view):
+                    written += os.write(self._fd, view[written:])
+        write_latency.record(written, time.perf_counter() - t0)
+        if self.on_data:
+            self.on_data(offset, view)
+        return written
+
+    # ---------------------- API dos workers ----------------------
+
+    async def write(self, wid: int, offset: int, data):
+        """Copia `data` para o bloco do worker em `offset`; descarrega quando cheio ou descontíguo."""
+        if self.error:
+            raise self.error
+        buf = self._buffers.get(wid)
+        if buf is None:
+            buf = self._buffers[wid] = _WorkerBuffer()
+        if buf.length and buf.offset + buf.length != offset:
+            await self.flush_worker(wid)
+        view = memoryview(data)
+        while view:
+            if buf.block is None:
+                buf.block = self.pool.acquire()
+            if not buf.length:
+                buf.offset = offset
+            n = min(len(view), self.buffer_size - buf.length)
+            buf.block[buf.length:buf.length + n] = view[:n]
+            buf.length += n
+            offset += n
+            view = view[n:]
+            if buf.length >= self.buffer_size:
+                await self.flush_worker(wid)
+
+    async def flush_worker(self, wid: int):
+        """Envia o bloco do worker para o pool de escrita (não espera o pwrite terminar)."""
+        buf = self._buffers.get(wid)
+        if buf is None or not buf.length:
+            return
+        offset, block, length = buf.offset, buf.block, buf.length
+        buf.block = None
+        buf.length = 0
+        await self._submit(offset, block, length)
+
+    async def _submit(self, offset: int, block: bytearray, n: int):
+        async with self._pending_changed:
+            # Backpressure: só segura se já houver algo pendente (evita deadlock com buffer gigante)
+            await self._pending_changed.wait_for(
+                lambda: self._pending_bytes == 0 or self._pending_bytes + n <= self.max_pending or self.error is not None
+            )
+            if self.error:
+                self.pool.release(block)
+                raise self.error
+            self._pending_bytes += n
+
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._executor, self._write_at, offset, block, n)
+        self._inflight.add(fut)
+        fut.add_done_callback(lambda f, off=offset, size=n, blk=block: asyncio.ensure_future(self._on_done(f, off, size, blk)))
+
+    async def _on_done(self, fut, offset: int, size: int, block: bytearray):
+        self._inflight.discard(fut)
+        # pwrite e on_data já terminaram: o bloco pode voltar para o pool
+        self.pool.release(block)
+        exc = fut.exception() if not fut.cancelled() else None
+        if exc and not self.error:
+            self.error = exc
+            print(f"[ERRO] Falha de escrita em {self.path} @ {offset}: {exc}")
+        elif not exc and self.on_written:
+            try:
+                self.on_written(offset, size)
+            except Exception as e:
+                print(f"[WARN] on_written falhou: {e}")
+        async with self._pending_changed:
+            self._pending_bytes -= size
+            self._pending_changed.notify_all()
+
+    async def drain(self):
+        """Descarrega todos os buffers e espera as escritas pendentes."""
+        for wid in list(self._buffers.keys()):
+            try:
+                await self.flush_worker(wid)
+            except Exception:
+                break
+        async with self._pending_changed:
+            await self._pending_changed.wait_for(lambda: self._pending_bytes == 0)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.drain()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.pool.clear()
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
@@ -0,0 +1,208 @@
+"""
+Servidor JSON-RPC falso do aria2 (em processo, numa thread) para testar o modo daemon.
+
+Simula só o que `engine.aria2_rpc` usa: um magnet adicionado vira um gid de
+metadados que completa depois de `metadata_polls` consultas e aponta
+(`followedBy`) para o download real, que avança `step` bytes a cada
+`aria2.tellStatus` até `total`. forcePause/unpause/forceRemove mudam o status,
+changeOption atualiza as opções do gid; `calls` guarda os métodos recebidos
+para as asserções.
+
+    with FakeAria2Rpc() as fake:
+        daemon = Aria2Daemon(url=fake.url, secret="s3cret")
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import unquote
+
+
+class FakeRpcFault(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeAria2Rpc:
+    def __init__(self, secret: Optional[str] = None, total: int = 1000, step: int = 250, metadata_polls: int = 2):
+        self.secret = secret
+        self.total = total
+        self.step = step
+        self.metadata_polls = metadata_polls
+        self.downloads: Dict[str, Dict[str, Any]] = {}
+        self.calls: List[str] = []
+        self.changes: List[tuple] = []  # (gid, opções) de cada changeOption
+        self._next_gid = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------------- servidor ----------------------
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/jsonrpc"
+
+    def start(self) -> "FakeAria2Rpc":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                req = json.loads(body)
+                try:
+                    resp = {"jsonrpc": "2.0", "id": req.get("id"), "result": fake.dispatch(req["method"], req.get("params") or [])}
+                except FakeRpcFault as e:
+                    resp = {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": e.code, "message": str(e)}}
+                data = json.dumps(resp).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------------- métodos RPC ----------------------
+
+    def dispatch(self, method: str, params: list) -> Any:
+        with self._lock:
+            if method == "system.multicall":
+                out = []
+                for call in params[0]:
+                    try:
+                        out.append([self._call(call["methodName"], list(call.get("params") or []))])
+                    except FakeRpcFault as e:
+                        out.append({"faultCode": e.code, "faultString": str(e)})
+                return out
+            return self._call(method, list(params))
+
+    def _call(self, method: str, params: list) -> Any:
+        self.calls.append(method)
+        if params and isinstance(params[0], str) and params[0].startswith("token:"):
+            if self.secret and params[0] != f"token:{self.secret}":
+                raise FakeRpcFault(1, "Unauthorized")
+            params = params[1:]
+        elif self.secret:
+            raise FakeRpcFault(1, "Unauthorized")
+        handler = getattr(self, "_rpc_" + method.split(".", 1)[1], None)
+        if handler is None:
+            raise FakeRpcFault(1, f"No such method: {method}")
+        return handler(*params)
+
+    def _gid(self) -> str:
+        self._next_gid += 1
+        return f"{self._next_gid:016x}"
+
+    def _get(self, gid: str) -> Dict[str, Any]:
+        if gid not in self.downloads:
+            raise FakeRpcFault(1, f"GID {gid} is not found")
+        return self.downloads[gid]
+
+    def _rpc_getVersion(self):
+        return {"version": "fake-1.0", "enabledFeatures": ["BitTorrent"]}
+
+    def _rpc_addUri(self, uris, options=None):
+        options = options or {}
+        magnet = uris[0]
+        infohash = unquote(magnet).split("urn:btih:", 1)[1].split("&", 1)[0].lower()
+        name = options.get("out") or "download"
+        gid = self._gid()
+        self.downloads[gid] = {"gid": gid, "status": "active", "infoHash": infohash, "dir": options.get("dir", ""),
+                               "name": name, "metadata": True, "polls": 0, "completed": 0, "options": options}
+        return gid
+
+    def _rpc_tellStatus(self, gid, keys=None):
+        d = self._get(gid)
+        if d["status"] == "active":
+            d["polls"] += 1
+            if d["metadata"] and d["polls"] > self.metadata_polls:
+                real = self._gid()
+                self.downloads[real] = {"gid": real, "status": "active", "infoHash": d["infoHash"], "dir": d["dir"],
+                                        "name": d["name"], "metadata": False, "polls": 0, "completed": 0,
+                                        "following": gid, "options": dict(d["options"])}
+                d["status"], d["followedBy"] = "complete", [real]
+            elif not d["metadata"]:
+                d["completed"] = min(self.total, d["completed"] + self.step)
+                if d["completed"] >= self.total:
+                    d["status"] = "complete"
+        return self._status(d)
+
+    def _status(self, d: Dict[str, Any]) -> Dict[str, Any]:
+        total = 16 if d["metadata"] else self.total
+        completed = (16 if d["status"] == "complete" else 0) if d["metadata"] else d["completed"]
+        status = {"gid": d["gid"], "status": d["status"], "infoHash": d["infoHash"], "dir": d["dir"],
+                  "totalLength": str(total), "completedLength": str(completed),
+                  "downloadSpeed": "100", "connections": "3", "numSeeders": "1", "bittorrent": {}}
+        if not d["metadata"]:
+            status["bittorrent"] = {"info": {"name": d["name"]}}
+        if d.get("followedBy"):
+            status["followedBy"] = d["followedBy"]
+        if d.get("following"):
+            status["following"] = d["following"]
+        return status
+
+    def _list(self, statuses, keys=None):
+        return [self._status(d) for d in self.downloads.values() if d["status"] in statuses]
+
+    def _rpc_tellActive(self, keys=None):
+        return self._list(("active",))
+
+    def _rpc_tellWaiting(self, offset, num, keys=None):
+        return self._list(("waiting", "paused"))[offset:offset + num]
+
+    def _rpc_tellStopped(self, offset, num, keys=None):
+        return self._list(("complete", "removed", "error"))[offset:offset + num]
+
+    def _rpc_forcePause(self, gid):
+        self._get(gid)["status"] = "paused"
+        return gid
+
+    def _rpc_forcePauseAll(self):
+        for d in self.downloads.values():
+            if d["status"] in ("active", "waiting"):
+                d["status"] = "paused"
+        return "OK"
+
+    def _rpc_unpause(self, gid):
+        d = self._get(gid)
+        if d["status"] != "paused":
+            raise FakeRpcFault(1, f"GID {gid} cannot be unpaused now")
+        d["status"] = "active"
+        return gid
+
+    def _rpc_forceRemove(self, gid):
+        self._get(gid)["status"] = "removed"
+        return gid
+
+    def _rpc_removeDownloadResult(self, gid):
+        self.downloads.pop(gid, None)
+        return "OK"
+
+    def _rpc_changeOption(self, gid, options):
+        self._get(gid)["options"].update(options)
+        self.changes.append((gid, dict(options)))
+        return "OK"
+
+    def _rpc_saveSession(self):
+        return "OK"
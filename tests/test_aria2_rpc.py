@@ -0,0 +1,117 @@
+import asyncio
+
+from engine.aria2_rpc import Aria2Daemon, download_magnet_rpc
+from engine.bandwidth import BandwidthScheduler
+from tests.fake_aria2_rpc import FakeAria2Rpc
+
+INFOHASH = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+MAGNET = f"magnet:?xt=urn:btih:{INFOHASH.upper()}&dn=Game"
+
+
+async def _daemon(fake: FakeAria2Rpc) -> Aria2Daemon:
+    daemon = Aria2Daemon(url=fake.url, secret=fake.secret)
+    assert await daemon.ensure()
+    return daemon
+
+
+def test_magnet_follows_metadata_gid_until_complete(tmp_path):
+    phases = []
+
+    async def progress_cb(downloaded, total, **kw):
+        phases.append((kw["phase"], downloaded, total))
+
+    async def run():
+        with FakeAria2Rpc(secret="s3cret") as fake:
+            daemon = await _daemon(fake)
+            try:
+                result = await download_magnet_rpc(MAGNET, str(tmp_path / "Game"), daemon,
+                                                   progress_cb=progress_cb, poll_interval=0)
+            finally:
+                await daemon.shutdown()
+            return result, fake
+
+    (path, status), fake = asyncio.run(run())
+    assert status == "completed"
+    assert path == str(tmp_path / "Game")
+    assert fake.calls.count("aria2.addUri") == 1
+    assert phases[0][0] == "metadata"
+    assert phases[-1][1:] == (1000, 1000)
+    # O download real terminou e o resultado foi removido do daemon
+    assert all(d["metadata"] for d in fake.downloads.values())
+
+
+def test_pause_then_resume_by_infohash(tmp_path):
+    dest = str(tmp_path / "Game")
+
+    async def run():
+        with FakeAria2Rpc(total=1000, step=100) as fake:
+            daemon = await _daemon(fake)
+            stop = asyncio.Event()
+
+            async def pause_midway(downloaded, total, **kw):
+                if kw["phase"] != "metadata" and downloaded >= 300:
+                    stop.set()
+
+            first = await download_magnet_rpc(MAGNET, dest, daemon, progress_cb=pause_midway,
+                                              stop_event=stop, poll_interval=0)
+            paused = [dict(d) for d in fake.downloads.values() if not d["metadata"]]
+            second = await download_magnet_rpc(MAGNET, dest, daemon, poll_interval=0)
+            return first, paused, second, fake
+
+    first, paused, second, fake = asyncio.run(run())
+    assert first[1] == "paused"
+    assert [d["status"] for d in paused] == ["paused"]
+    assert second[1] == "completed"
+    # Retomar não adiciona o magnet de novo: o gid pausado é encontrado pelo infohash
+    assert fake.calls.count("aria2.addUri") == 1
+    assert "aria2.unpause" in fake.calls
+
+
+def test_cancelled_worker_pauses_its_gid(tmp_path):
+    async def run():
+        with FakeAria2Rpc(total=10 ** 9, step=1) as fake:
+            daemon = await _daemon(fake)
+            task = asyncio.create_task(download_magnet_rpc(MAGNET, str(tmp_path / "Game"), daemon, poll_interval=0.01))
+            await asyncio.sleep(0.3)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return fake
+
+    fake = asyncio.run(run())
+    real = [d for d in fake.downloads.values() if not d["metadata"]]
+    assert real and real[0]["status"] == "paused"
+
+
+def test_bandwidth_changes_reach_the_running_gid(tmp_path):
+    async def run():
+        scheduler = BandwidthScheduler(global_limit=4_000_000)
+        bw = scheduler.register(1)
+        with FakeAria2Rpc(total=1000, step=100, metadata_polls=3) as fake:
+            daemon = await _daemon(fake)
+
+            async def progress_cb(downloaded, total, **kw):
+                # Um job HTTP entra no meio: a fatia do magnet cai para a metade do teto
+                if kw["phase"] == "metadata":
+                    scheduler.register(2)
+                elif downloaded >= 500:
+                    scheduler.unregister(2)
+
+            try:
+                result = await download_magnet_rpc(MAGNET, str(tmp_path / "Game"), daemon, progress_cb=progress_cb,
+                                                   poll_interval=0, max_download_limit=bw.rate, bandwidth=bw)
+            finally:
+                await daemon.shutdown()
+            return result, fake, bw
+
+    (_, status), fake, bw = asyncio.run(run())
+    assert status == "completed"
+    assert bw.on_rate is None
+    metadata = next(d for d in fake.downloads.values() if d["metadata"])
+    assert metadata["options"]["max-download-limit"] == "2000000"
+    # O gid real (followedBy) recebe a taxa atual, não a herdada do gid de metadados
+    sent = fake.changes
+    assert [o["max-download-limit"] for _, o in sent] == ["2000000", "2000000", "4000000"]
+    assert sent[1][0] != sent[0][0]